@@ -1,19 +1,31 @@
 import streamlit as st
-from openai import OpenAI
 import concurrent.futures
-from typing import List, Dict, Any
 import datetime
-import random
+import json
 import time
-import math
 import os
+import urllib.parse
+import uuid
+from divination_core.clients import BASE_URL, ClientPool
+from divination_core.context import UsageMeter
+from divination_core.engine import RoundtableEngine, new_stream_state
+from divination_core.jobs import JobQueue, stream_job
+from divination_core.ganzhi import CITY_COORDINATES, TZ_CN, get_ganzhi_info, load_ganzhi_index, lunar_available
+from divination_core.casting import DivinationEngine, RngStreams, meihua_numbers
+from divination_core.najia import format_chart, najia_chart
+from divination_core.prompts import build_user_prompt, generate_system_prompt, local_chart
+from divination_core.readings import (ANALYSIS_OUTPUT_TOKENS, CONSENSUS_MODEL, CONSENSUS_OUTPUT_TOKENS, consensus_messages,
+                                      consensus_tokens)
+from divination_core.render import StreamRenderer
+from divination_core.solar_time import GEOCODER_URL, default_table, geocode, shichen_boundaries
+from divination_core.scheduler import MAX_RETRIES, ModelScheduler
+from divination_core.secretary import summarize
+from divination_core.store import CACHEABLE_METHODS, ResponseCache, SessionStore
+from divination_core.telemetry import QUANTILES, Telemetry
+from divination_core.utils import HitRateCounter, estimate_tokens
 # 需要先安装 lunar_python: pip install lunar_python
-try:
-    from lunar_python import Lunar, Solar
-except ImportError:
+if not lunar_available():
     st.error("请安装依赖: pip install lunar_python")
-    Solar = None
-    Lunar = None
 
 # --- Global Setup ---
 st.set_page_config(page_title="AI 综合智能平台", page_icon="🤖", layout="wide")
@@ -74,14 +86,158 @@ def get_api_key():
     # Fallback to sidebar input
     return st.sidebar.text_input("SiliconFlow API Key", type="password", key="global_api_key_input")
 
+@st.cache_resource
+def get_client_pool():
+    # st.cache_resource makes this a single instance shared by every session in the process.
+    return ClientPool.from_env()
+
 def get_client(api_key):
     if not api_key:
         return None
-    return OpenAI(
-        api_key=api_key,
-        base_url="https://api.siliconflow.cn/v1"
+    return get_client_pool().get(api_key, BASE_URL)
+
+@st.cache_resource
+def get_background_executor():
+    # Off-critical-path work (e.g. speculative secretary summaries) shares one small pool per process.
+    return concurrent.futures.ThreadPoolExecutor(
+        max_workers=int(os.getenv("DIVINATION_BACKGROUND_WORKERS", "4")),
+        thread_name_prefix="divination-bg",
     )
 
+@st.cache_resource
+def get_secretary_metrics():
+    return HitRateCounter()
+
+def render_pool_stats():
+    stats = get_client_pool().stats()
+    with st.sidebar.expander("🔌 连接池状态", expanded=False):
+        c1, c2 = st.columns(2)
+        c1.metric("客户端复用率", f"{stats['client_hit_ratio']:.0%}")
+        c2.metric("连接复用率", f"{stats['connection_reuse_ratio']:.0%}")
+        for client in stats["clients"]:
+            st.caption(f"{client['key']} · 打开 {client['open']} / 空闲 {client['idle']} · 请求 {client['requests']} · 新建连接 {client['new_connections']} · 进行中 {client['in_use']}")
+
+@st.cache_resource
+def get_ganzhi_index():
+    # Memory-mapped 干支 table shared by every session; None falls back to lunar_python per call.
+    # Build it once with `python -m divination_core.ganzhi_index build`.
+    return load_ganzhi_index()
+
+@st.cache_resource
+def get_solar_table():
+    # Per-day equation-of-time table, built once per process (a few ms) and shared by every session.
+    return default_table()
+
+@st.cache_data(ttl=600, show_spinner="🌍 正在查询地点...")
+def lookup_place(query):
+    return geocode(query)
+
+SHICHEN_WARNING_MINUTES = 10  # warn when the cast is this close to a 时辰 boundary
+
+@st.cache_resource
+def get_rng_streams():
+    # One root seed per process; every session casts from its own independent stream.
+    return RngStreams.from_env()
+
+def get_session_rng():
+    return get_rng_streams().for_session(get_session_id())
+
+# --- Persistence ---
+
+@st.cache_resource
+def get_session_store():
+    return SessionStore.from_env()
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache.from_env()
+
+def get_session_id():
+    """Session ID from the `?sid=` URL parameter, so a reconnecting browser resumes its history."""
+    if "session_id" not in st.session_state:
+        sid = st.query_params.get("sid")
+        if not sid:
+            sid = uuid.uuid4().hex
+            st.query_params["sid"] = sid
+        st.session_state.session_id = sid
+    return st.session_state.session_id
+
+def render_session_controls():
+    with st.sidebar.expander("🗂️ 会话", expanded=False):
+        st.caption(f"当前会话 ID: `{get_session_id()}`")
+        target = st.text_input("恢复会话 ID", key="resume_session_id")
+        if st.button("恢复", key="btn_resume_session") and target:
+            if not get_session_store().exists(target.strip()):
+                st.error("未找到该会话。")
+                return
+            for key in list(st.session_state.keys()):
+                del st.session_state[key]
+            st.query_params["sid"] = target.strip()
+            st.rerun()
+
+# --- Request Scheduling ---
+
+@st.cache_resource
+def get_scheduler():
+    return ModelScheduler.from_env()
+
+def render_scheduler_stats():
+    stats = get_scheduler().stats()
+    if not stats:
+        return
+    with st.sidebar.expander("🚦 调度队列", expanded=False):
+        for model, s in stats.items():
+            st.caption(
+                f"**{model.split('/')[-1]}** · 运行 {s['inflight']}/{s['max_inflight']} · 排队 {s['queued']} "
+                f"· 平均等待 {s['avg_wait_s']:.1f}s (p95 {s['p95_wait_s']:.1f}s) · 429 次数 {s['throttled']}"
+            )
+
+@st.cache_resource
+def get_usage_meter():
+    # Prompt / cached-prompt / completion tokens as reported by the API, per model, for the whole process.
+    return UsageMeter()
+
+def render_usage_stats():
+    stats = get_usage_meter().stats()
+    if not stats:
+        return
+    with st.sidebar.expander("🧮 提示词缓存", expanded=False):
+        for model, s in stats.items():
+            st.caption(
+                f"**{model.split('/')[-1]}** · {s['requests']} 次请求 · 提示 {s['prompt_tokens']:,} tokens "
+                f"· 缓存命中 {s['cached_tokens']:,} ({s['cached_ratio']:.0%}) · 输出 {s['completion_tokens']:,}"
+            )
+
+def usage_caption(usage):
+    if not usage:
+        return ""
+    ratio = usage["cached_tokens"] / usage["prompt_tokens"] if usage["prompt_tokens"] else 0.0
+    return f"提示 {usage['prompt_tokens']:,} tokens · 缓存命中 {usage['cached_tokens']:,} ({ratio:.0%})"
+
+# --- Telemetry ---
+
+@st.cache_resource
+def get_telemetry():
+    # Ring buffer of per-call timings for the 性能监控 page; JSONL and /metrics are opt-in via env.
+    telemetry = Telemetry.from_env()
+    port = os.getenv("DIVINATION_METRICS_PORT")
+    if port:
+        telemetry.serve(int(port), os.getenv("DIVINATION_METRICS_HOST", "127.0.0.1"))
+    return telemetry
+
+# --- Background Readings ---
+
+@st.cache_resource
+def get_job_queue():
+    # Long readings run here, not in the script thread, so reruns and refreshes don't abandon them.
+    return JobQueue.from_env()
+
+# --- Roundtable Engine ---
+
+@st.cache_resource
+def get_roundtable_engine():
+    return RoundtableEngine(get_client_pool(), get_scheduler(), get_telemetry())
+
 # ==========================================
 # APP 1: AI Roundtable (AI 众议院)
 # ==========================================
@@ -97,11 +253,29 @@ def app_roundtable(api_key):
         "zai-org/GLM-4.6", 
         "MiniMaxAI/MiniMax-M2"
     ]
-    SECRETARY_MODEL = "deepseek-ai/DeepSeek-V3"
+    # The secretary's model, prompt and token caps live in divination_core.secretary.
+    SECRETARY_MIN_NEW = 4
+    RT_WINDOW_TURNS = 3      # turns always drawn in full
+    RT_PAGE_MESSAGES = 60    # older messages read back from the store per "show earlier" click
+    RT_MEMORY_TAIL = int(os.getenv("DIVINATION_MEMORY_TAIL", "60"))  # messages kept in session_state
+    RT_CONTEXT_MESSAGES = 2000  # stored messages read back as panel context; each model then fits its own window
+
+    store = get_session_store()
+    session_id = get_session_id()
+    telemetry = get_telemetry()  # captured here: the secretary runs on a background thread
 
-    # State Management for Roundtable
+    # State Management for Roundtable (resumed from the store when the session ID is known)
     if "messages" not in st.session_state:
-        st.session_state.messages = []
+        meta = store.get_meta(session_id)
+        st.session_state.rt_start_seq = meta.get("rt_start_seq", 0)
+        st.session_state.messages = store.load_messages(session_id, after_seq=st.session_state.rt_start_seq, limit=RT_MEMORY_TAIL)
+        st.session_state.rt_seq = store.max_seq(session_id)
+        # One rolling summary; `watermark` is the seq of the last message already folded in.
+        st.session_state.rt_summary = meta.get("rt_summary", {"text": "", "watermark": 0})
+    if "rt_summary_future" not in st.session_state:
+        st.session_state.rt_summary_future = None
+    if "rt_history_pages" not in st.session_state:
+        st.session_state.rt_history_pages = 0
     if "selected_models" not in st.session_state:
         st.session_state.selected_models = PANEL_MODELS
 
@@ -131,106 +305,248 @@ def app_roundtable(api_key):
         else:
             st.session_state.selected_models = PANEL_MODELS
         
-        use_secretary = st.checkbox("启用秘书摘要 (Secretary)", value=False, help="启用后，DeepSeek-V3 将在每轮对话前总结历史。")
+        use_secretary = st.checkbox("启用秘书摘要 (Secretary)", value=False, help="启用后，DeepSeek-V3 会在每轮回答结束后于后台预先整理纪要，供下一轮使用。")
+        if use_secretary:
+            metrics = get_secretary_metrics()
+            st.caption(f"📈 预计算纪要命中率 {metrics.ratio:.0%} ({metrics.hits}/{metrics.hits + metrics.misses})")
+        use_streaming = st.checkbox("流式输出 (Streaming)", value=True, help="每位 AI 的回答逐字实时显示，先完成的模型先入档。")
+        with st.expander("⚙️ 引擎参数", expanded=False):
+            deadline = st.number_input("单模型超时 (秒, 0=不限)", 0, 1800, 300, step=30)
+            hedge_after = st.number_input("首字超时后对冲重试 (秒, 0=关闭)", 0, 300, 0, step=5,
+                                          help="若模型在此时间内未返回首个片段，则并行发起一次相同请求，取先到者。")
+            quorum = st.number_input("法定人数 K (0=等待全部)", 0, len(PANEL_MODELS), 0,
+                                     help="先有 K 位 AI 完成回答即结束本轮，其余请求被取消。")
         
         if st.button("清空历史"):
+            # The store is append-only: clearing just moves the start of the visible history.
+            st.session_state.rt_start_seq = st.session_state.rt_seq
             st.session_state.messages = []
+            st.session_state.rt_summary = {"text": "", "watermark": 0}
+            store.update_meta(session_id, rt_start_seq=st.session_state.rt_start_seq, rt_summary=st.session_state.rt_summary)
+            st.session_state.rt_summary_future = None
+            st.session_state.rt_history_pages = 0
             st.rerun()
 
-    # Chat Display
-    chat_container = st.container()
-    with chat_container:
-        for msg in st.session_state.messages:
-            role = msg["role"]
-            name = msg.get("name", "")
-            content = msg["content"]
-            
-            if role == "user":
-                with st.chat_message("user"):
-                    st.write(content)
-            elif role == "assistant":
-                with st.chat_message("assistant", avatar="🤖"):
-                    st.markdown(f"**{name}**")
-                    st.markdown(content)
-            elif role == "system":
-                with st.expander(f"📋 会议纪要 (由 {name} 提供)", expanded=False):
-                    st.markdown(content)
+    def append_message_rt(msg):
+        st.session_state.rt_seq += 1
+        msg["seq"] = st.session_state.rt_seq
+        store.append_message(session_id, msg)
+        st.session_state.messages.append(msg)
+        if len(st.session_state.messages) > RT_MEMORY_TAIL:
+            del st.session_state.messages[:-RT_MEMORY_TAIL]
+
+    def render_message_rt(msg):
+        role = msg["role"]
+        name = msg.get("name", "")
+        content = msg["content"]
+        
+        if role == "user":
+            with st.chat_message("user"):
+                st.write(content)
+        elif role == "assistant":
+            with st.chat_message("assistant", avatar="🤖"):
+                st.markdown(f"**{name}**")
+                st.markdown(content)
+        elif role == "system":
+            with st.expander(f"📋 会议纪要 (由 {name} 提供)", expanded=False):
+                st.markdown(content)
+
+    def split_turns(messages):
+        turns = []
+        for msg in messages:
+            if msg["role"] == "user" or not turns:
+                turns.append([])
+            turns[-1].append(msg)
+        return turns
+
+    @st.fragment
+    def render_collapsed_turn(seq, turn):
+        # Old turns draw a one-line header; their messages are rendered only when opened,
+        # and toggling re-runs just this fragment.
+        question = turn[0]["content"] if turn[0]["role"] == "user" else ""
+        answers = sum(1 for m in turn if m["role"] == "assistant")
+        label = f"#{seq} · {question[:40]}{'…' if len(question) > 40 else ''} ({answers} 位 AI 回答)"
+        if st.toggle(label, key=f"rt_turn_open_{seq}"):
+            for msg in turn:
+                render_message_rt(msg)
+
+    def show_more_turns():
+        st.session_state.rt_history_pages += 1
+
+    @st.fragment
+    def render_history(turns):
+        # Only the last RT_WINDOW_TURNS turns are drawn in full, so a rerun costs the same however
+        # long the debate gets; older messages are read back from the store page by page and shown
+        # as collapsed turn headers.
+        if turns and turns[0][0]["role"] != "user":
+            turns = turns[1:]  # the in-memory tail starts mid-turn; that turn is read back whole below
+        window = turns[-RT_WINDOW_TURNS:]
+        first_seq = window[0][0]["seq"] if window else st.session_state.rt_seq + 1
+        start_seq = st.session_state.rt_start_seq
+        older_total = store.count_messages(session_id, before_seq=first_seq, after_seq=start_seq)
+        older = []
+        if st.session_state.rt_history_pages:
+            older = store.load_messages(session_id, before_seq=first_seq, after_seq=start_seq,
+                                        limit=st.session_state.rt_history_pages * RT_PAGE_MESSAGES)
+        if older_total > len(older):
+            st.button(f"⬆️ 显示更早的记录 (还有 {older_total - len(older)} 条发言未显示)", on_click=show_more_turns)
+        for turn in split_turns(older):
+            render_collapsed_turn(turn[0]["seq"], turn)
+        for turn in window:
+            for msg in turn:
+                render_message_rt(msg)
 
     # Input & Logic
     user_input = st.chat_input("输入问题或指令...")
+    if user_input:
+        append_message_rt({"role": "user", "name": "User", "content": user_input})
 
-    def generate_response_rt(client, model_name, history, system_prompt=None):
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        for msg in history:
-            messages.append({"role": msg["role"], "content": msg["content"]})
-        try:
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                stream=False,
-                temperature=0.7,
-            )
-            return {"model": model_name, "content": response.choices[0].message.content, "error": None}
-        except Exception as e:
-            return {"model": model_name, "content": None, "error": str(e)}
+    # Chat Display: finished turns in the history fragment, the turn being answered (if any) below it.
+    messages = st.session_state.messages
+    live_turn = bool(messages) and messages[-1]["role"] == "user"
+    if st.session_state.rt_summary["text"]:
+        with st.expander("📋 会议纪要 (由 Secretary 滚动维护)", expanded=False):
+            st.markdown(st.session_state.rt_summary["text"])
+    render_history(split_turns(messages[:-1] if live_turn else messages))
 
-    def summarize_context_rt(client, history):
-        prompt = "请作为会议秘书，简要总结上述所有AI模型的讨论要点和用户的核心问题。保留关键分歧和共识。"
-        temp_msgs = [{"role": m["role"], "content": f"[{m.get('name', 'User')}]: {m['content']}"} for m in history]
-        temp_msgs.append({"role": "user", "content": prompt})
+    def summarize_context_rt(client, summary, new_messages, session_id):
+        """Fold only `new_messages` into the rolling `summary`; returns the updated summary dict."""
+        return summarize(client, get_scheduler(), summary, new_messages, session_id, telemetry)
+
+    def unsummarized_messages():
+        watermark = st.session_state.rt_summary["watermark"]
+        return [m for m in st.session_state.messages if m["role"] != "system" and m.get("seq", 0) > watermark]
+
+    def schedule_speculative_summary():
+        """Start folding the just-committed turn into the summary in the background, for the next turn."""
+        future = st.session_state.rt_summary_future
+        if future is not None and not future.done():
+            return  # The in-flight job will be adopted later; the next one picks up from its watermark.
+        new_messages = unsummarized_messages()
+        if len(new_messages) < SECRETARY_MIN_NEW:
+            return
+        st.session_state.rt_summary_future = get_background_executor().submit(
+            summarize_context_rt, client, dict(st.session_state.rt_summary), list(new_messages), session_id
+        )
+
+    def adopt_speculative_summary():
+        """Use the background summary if it is ready; otherwise fall back to the previous one plus raw history."""
+        future = st.session_state.rt_summary_future
+        if future is None:
+            return
+        if not future.done():
+            get_secretary_metrics().record(False)
+            st.caption("👩‍💼 秘书纪要尚在后台整理，本轮沿用上一版纪要与原始发言。")
+            return
+        st.session_state.rt_summary_future = None
         try:
-            response = client.chat.completions.create(model=SECRETARY_MODEL, messages=temp_msgs, temperature=0.5)
-            return response.choices[0].message.content
+            result = future.result()
         except Exception as e:
-            return f"秘书模型无法总结: {e}"
+            get_secretary_metrics().record(False)
+            st.caption(f"👩‍💼 秘书模型无法总结: {e}")
+            return
+        get_secretary_metrics().record(True)
+        if result["watermark"] > st.session_state.rt_summary["watermark"]:
+            st.session_state.rt_summary = result
+            store.update_meta(session_id, rt_summary=result)
 
-    if user_input:
-        st.session_state.messages.append({"role": "user", "name": "User", "content": user_input})
-        st.rerun()
+    def build_panel_context(use_summary):
+        """Panelists see the rolling summary plus only the messages it does not cover yet.
+
+        Those messages are read back from the store, not the RT_MEMORY_TAIL kept in memory, and the
+        engine cuts them to each model's context window. Returns (system_prompt, history, skipped),
+        `skipped` being the older messages past RT_CONTEXT_MESSAGES that were not even read.
+        """
+        summary = st.session_state.rt_summary
+        after_seq = st.session_state.rt_start_seq
+        system_prompt = None
+        if use_summary and summary["text"]:
+            after_seq = max(after_seq, summary["watermark"])
+            system_prompt = f"以下是本次会议此前讨论的纪要，请在此基础上继续发言：\n{summary['text']}"
+        stored = store.load_messages(session_id, after_seq=after_seq, limit=RT_CONTEXT_MESSAGES)
+        skipped = 0
+        if len(stored) == RT_CONTEXT_MESSAGES:
+            skipped = store.count_messages(session_id, after_seq=after_seq) - len(stored)
+        history = [{"role": m["role"], "content": m["content"]} for m in stored if m["role"] != "system"]
+        return system_prompt, history, skipped
 
-    if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
+    if live_turn:
+        render_message_rt(messages[-1])
         active_models = st.session_state.selected_models
         if not active_models:
             st.error("请至少选择一个模型进行回答！")
             st.stop()
             
-        current_history = st.session_state.messages
-        if use_secretary and len(current_history) > 5:
-            with st.status("👩‍💼 秘书 (DeepSeek-V3) 正在整理会议背景...", expanded=True) as status:
-                summary = summarize_context_rt(client, current_history[:-1])
-                st.session_state.messages.insert(-1, {"role": "system", "name": "Secretary", "content": f"**背景摘要**: {summary}"})
-                status.update(label="背景整理完毕", state="complete", expanded=False)
+        if use_secretary:
+            adopt_speculative_summary()
+        system_prompt, clean_history, skipped = build_panel_context(use_secretary)
         
         st.markdown("### 🎙️ AI 正在思考中...")
-        results = []
         cols = st.columns(len(active_models))
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(active_models)) as executor:
-            future_to_model = {}
-            for i, model in enumerate(active_models):
-                with cols[i]:
-                    st.markdown(f"**{model.split('/')[-1]}**")
-                    spinner = st.spinner("思考中...")
-                clean_history = [{"role": m["role"], "content": m["content"]} for m in st.session_state.messages if m["role"] != "system"]
-                future = executor.submit(generate_response_rt, client, model, clean_history)
-                future_to_model[future] = model
-                
-            for future in concurrent.futures.as_completed(future_to_model):
-                res = future.result()
-                results.append(res)
-        
-        for res in results:
-            if res["error"]:
-                st.error(f"{res['model']} Error: {res['error']}")
-            else:
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "name": res["model"],
-                    "content": res["content"]
-                })
-        st.rerun()
+        panel_messages = ([{"role": "system", "content": system_prompt}] if system_prompt else []) + clean_history
+        states = {}
+        slots = {}
+        for i, model in enumerate(active_models):
+            states[model] = new_stream_state()
+            with cols[i]:
+                st.markdown(f"**{model.split('/')[-1]}**")
+                status_area = st.empty()
+                status_area.caption("⏳ 思考中...")
+                reasoning_area = st.expander("💭 思考过程", expanded=False).empty()
+                content_area = st.empty()
+            slots[model] = {"status": status_area, "reasoning": reasoning_area, "content": content_area, "shown": (0, 0)}
+
+        panel = get_roundtable_engine().submit_panel(
+            api_key, session_id, active_models, panel_messages, states,
+            deadline=deadline or None, hedge_after=hedge_after or None, quorum=quorum,
+        )
+
+        # Poll the engine buffers from the script thread; each model is committed as soon as it finishes.
+        try:
+            pending = list(active_models)
+            while pending:
+                for model in list(pending):
+                    state, slot = states[model], slots[model]
+                    done = state["done"]
+                    reasoning = "".join(state["reasoning"])
+                    content = "".join(state["content"])
+                    if use_streaming and ((len(reasoning), len(content)) != slot["shown"] or done):
+                        if reasoning:
+                            slot["reasoning"].markdown(f"*{reasoning}*")
+                        if content:
+                            slot["status"].caption("✍️ 回答中..." + (" (已对冲重试)" if state["hedged"] else ""))
+                            slot["content"].markdown(content if done else content + "▌")
+                        slot["shown"] = (len(reasoning), len(content))
+                    elif state["queued"] and slot["shown"] == (0, 0):
+                        slot["status"].caption("🚦 排队等待上游配额...")
+                    if not done:
+                        continue
+                    pending.remove(model)
+                    if state["cancelled"]:
+                        slot["status"].caption("⏹️ 已满足法定人数，未等待")
+                    elif state["error"]:
+                        slot["status"].error(f"{model} Error: {state['error']}")
+                    else:
+                        get_usage_meter().record(model, state["usage"])
+                        trimmed = skipped + len(panel_messages) - state["sent_messages"]
+                        slot["status"].caption(" · ".join(filter(None, [
+                            "✅ 已完成", usage_caption(state["usage"]), f"早先 {trimmed} 条发言超出上下文窗口未发送" if trimmed else "",
+                        ])))
+                        if not use_streaming:
+                            slot["content"].markdown(content)
+                        append_message_rt({
+                            "role": "assistant",
+                            "name": model,
+                            "content": content
+                        })
+                if pending:
+                    time.sleep(0.1)
+        finally:
+            # A rerun interrupts this loop; don't leave upstream requests running with nobody listening.
+            if not panel.done():
+                panel.cancel()
+        if use_secretary:
+            schedule_speculative_summary()
 
 
 # ==========================================
@@ -243,157 +559,195 @@ def app_yijing(api_key):
     # 配置与常量
     MODELS = {
         "DeepSeek-R1 (推理强)": "deepseek-ai/DeepSeek-R1",
-        "Kimi-K2-Thinking (中文优)": "moonshotai/Kimi-K2-Thinking"
+        "Kimi-K2-Thinking (中文优)": "moonshotai/Kimi-K2-Thinking",
+        # e.g. DIVINATION_YIJING_MODELS='{"GLM-4.6": "zai-org/GLM-4.6"}'
+        **json.loads(os.getenv("DIVINATION_YIJING_MODELS", "{}")),
     }
     
-    CITY_COORDINATES = {
-        "北京": 116.40, "上海": 121.47, "广州": 113.26, "深圳": 114.05,
-        "武汉": 114.30, "成都": 104.06, "西安": 108.93, "沈阳": 123.43,
-        "重庆": 106.55, "天津": 117.20, "杭州": 120.15, "南京": 118.79,
-        "郑州": 113.62, "长沙": 112.93, "福州": 119.30, "昆明": 102.71,
-        "贵阳": 106.63, "兰州": 103.82, "南宁": 108.32, "哈尔滨": 126.63,
-        "长春": 125.32, "石家庄": 114.48, "太原": 112.53, "呼和浩特": 111.65,
-        "合肥": 117.28, "南昌": 115.89, "济南": 117.00, "海口": 110.35,
-        "拉萨": 91.11, "西宁": 101.74, "银川": 106.27, "乌鲁木齐": 87.62,
-        "台北": 121.50, "香港": 114.17, "澳门": 113.54,
-        "自定义/手动输入": 0.0
-    }
-    TZ_CN = datetime.timezone(datetime.timedelta(hours=8))
-
-    # --- 易学 Helpers ---
-    def get_true_solar_time(dt, longitude):
-        offset_minutes = (longitude - 120.0) * 4
-        return dt + datetime.timedelta(minutes=offset_minutes)
-
-    def get_ganzhi_info(dt_solar):
-        if not Solar: return {}
-        solar = Solar.fromYmdHms(dt_solar.year, dt_solar.month, dt_solar.day, dt_solar.hour, dt_solar.minute, dt_solar.second)
-        lunar = solar.getLunar()
-        ganzhi_year = lunar.getYearInGanZhi()
-        ganzhi_month = lunar.getMonthInGanZhi()
-        ganzhi_day = lunar.getDayInGanZhi()
-        ganzhi_time = lunar.getTimeInGanZhi()
-        info = {
-            "str": f"{ganzhi_year}年 {ganzhi_month}月 {ganzhi_day}日 {ganzhi_time}时",
-            "lunar_str": f"农历{lunar.getMonthInChinese()}月{lunar.getDayInChinese()}",
-            "month_num": lunar.getMonth(),
-            "day_num": lunar.getDay(),
-            "hour_zhi": ganzhi_time[1],
-            "day_gan": ganzhi_day[0],
-            "day_zhi": ganzhi_day[1],
-            "solar_term": lunar.getPrevJieQi().getName() if lunar.getPrevJieQi() else "非节气日"
-        }
-        dizhi_list = list("子丑寅卯辰巳午未申酉戌亥")
-        info['hour_idx'] = dizhi_list.index(info['hour_zhi'])
-        return info
-
-    class DivinationEngine:
-        @staticmethod
-        def get_seed():
-            return int(time.time() * 1000000)
-
-        @staticmethod
-        def cast_liuyao_coin():
-            random.seed(DivinationEngine.get_seed())
-            results = []
-            display_lines = []
-            for _ in range(6):
-                coins = [random.randint(0, 1) for _ in range(3)] 
-                sum_val = sum(coins)
-                if sum_val == 1:
-                    val, name, symbol = 1, "少阳", "▅▅▅▅▅"
-                elif sum_val == 2:
-                    val, name, symbol = 0, "少阴", "▅▅　▅▅"
-                elif sum_val == 3:
-                    val, name, symbol = 3, "老阳 O", "▅▅▅▅▅ O"
-                else:
-                    val, name, symbol = 2, "老阴 X", "▅▅　▅▅ X"
-                results.append(val)
-                display_lines.append({"name": name, "symbol": symbol, "val": val})
-            return results, display_lines
-
-        @staticmethod
-        def cast_meihua(n1, n2, time_num):
-            upper = n1 % 8 or 8
-            lower = n2 % 8 or 8
-            moving = (n1 + n2 + time_num) % 6 or 6
-            trigrams = {1:"乾", 2:"兑", 3:"离", 4:"震", 5:"巽", 6:"坎", 7:"艮", 8:"坤"}
-            nature = {1:"天", 2:"泽", 3:"火", 4:"雷", 5:"风", 6:"水", 7:"山", 8:"地"}
-            return {
-                "upper": trigrams[upper], "upper_nature": nature[upper],
-                "lower": trigrams[lower], "lower_nature": nature[lower],
-                "moving": moving, "nums": (n1, n2)
-            }
-
-    def generate_system_prompt(method, user_profile, ganzhi_info):
-        gender_str = user_profile['gender'] if user_profile['gender'] != "未提供" else "未知"
-        bazi_desc = "未提供"
-        if user_profile['bazi_year'] or user_profile['bazi_day']:
-            bazi_desc = f"年柱({user_profile['bazi_year']}) 月柱({user_profile['bazi_month']}) 日柱({user_profile['bazi_day']}) 时柱({user_profile['bazi_hour']})"
-        elif user_profile['birth_year']:
-             bazi_desc = f"出生年份: {user_profile['birth_year']}"
-
-        base_prompt = f"""
-        你是一位精通中国传统术数的大师。请基于以下严谨的时空与命主信息进行推演。
-        【时空能量】
-        - 真太阳时干支：{ganzhi_info.get('str', '未知')}
-        - 农历：{ganzhi_info.get('lunar_str', '未知')}
-        - 节气：{ganzhi_info.get('solar_term', '未知')}
-        【命主信息】
-        - 性别：{gender_str}
-        - 命理八字/年命：{bazi_desc}
-        - 所在经度：{user_profile['longitude']}
-        【核心原则】
-        1. **拒绝模棱两可**：请根据五行旺衰给出倾向性判断。
-        2. **专业术语**：必须分析月令（旺相休囚死）、日辰（生克冲合）、空亡、神煞。
-        3. **结合真太阳时**：排盘依据的是当地真实的太阳位置，而非标准北京时间。
-        """
-        if method == "六爻":
-            return base_prompt + "\n【六爻特化指令】1. 自动装卦：确定世爻、应爻、六亲。2. 取用神：根据问题选取用神。3. 分析动爻。"
-        elif method == "梅花":
-            return base_prompt + "\n【梅花易数特化指令】1. 区分体用。2. 分析五行生克。3. 结合当下时间。"
-        elif method == "奇门":
-            return base_prompt + "\n【奇门遁甲特化指令】1. 脑中排盘（时家奇门）。2. 找用神。3. 分析宫位。4. 决策建议。"
-        elif method == "大六壬":
-            return base_prompt + "\n【大六壬特化指令】1. 确定月将。2. 排盘（天地盘、四课、三传）。3. 断课。"
-        elif method == "太乙":
-            return base_prompt + "\n【太乙神数特化指令】1. 计算积年与太乙局。2. 推演主客。3. 定格局。4. 断大势。"
-        elif method == "小六壬":
-            return base_prompt + "\n【小六壬特化指令】1. 结合年月日时推导三宫。2. 解释落宫深意。"
-        return base_prompt
-
-    def stream_ai_analysis(prompt, system_prompt, model_key):
+    def stream_ai_analysis(prompt, system_prompt, models, method=None, question=""):
+        """Submit the reading as background jobs, one per model (plus a consensus job when there are several);
+        `render_reading_job` (below the tabs) follows them."""
         if not api_key:
             st.error("⚠️ 未检测到 API Key。")
             return
-        
+
         client = get_client(api_key)
-        
+        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+        tokens = estimate_tokens(system_prompt) + estimate_tokens(prompt) + ANALYSIS_OUTPUT_TOKENS
+        # Captured here: targets and `finish` run on job workers, outside the script thread.
+        store, session_id, cache, usage_meter = get_session_store(), get_session_id(), get_response_cache(), get_usage_meter()
+        scheduler, telemetry, queue = get_scheduler(), get_telemetry(), get_job_queue()
+        group = uuid.uuid4().hex[:12]
+
+        def member(model_key):
+            cache_key = ResponseCache.make_key(method, model_key, system_prompt, prompt) if use_cache and method in CACHEABLE_METHODS else None
+            cached = cache.get(cache_key) if cache_key else None
+
+            def replay(job):
+                job.reasoning.append(cached["reasoning"])
+                job.content.append(cached["content"])
+
+            def generate(job):
+                # With a shared cache tier, identical readings in flight anywhere collapse into one generation:
+                # wait while a peer holds the lease, and take over if it ends without a reply.
+                lease = cache.lead(cache_key) if cache_key else None
+                while cache_key and lease is None:
+                    job.meta["waiting_on_peer"] = True
+                    payload = cache.wait_for(cache_key, should_stop=lambda: job.cancel_requested)
+                    if payload is not None:
+                        job.meta["cached"] = True
+                        job.reasoning.append(payload["reasoning"])
+                        job.content.append(payload["content"])
+                        return
+                    if job.cancel_requested:
+                        return
+                    lease = cache.lead(cache_key)
+                job.meta.pop("waiting_on_peer", None)
+                try:
+                    stream_job(job, client, scheduler, model_key, messages, tokens, telemetry=telemetry, kind="yijing",
+                               heartbeat=lease.keep if lease else None)
+                    reasoning, content = job.text()
+                    if cache_key and content and not job.cancel_requested:
+                        cache.put(cache_key, {"reasoning": reasoning, "content": content}, method, model_key)
+                finally:
+                    if lease:
+                        lease.release()
+
+            def finish(job):
+                # The reading is stored even when nobody is watching any more.
+                reasoning, content = job.text()
+                usage_meter.record(model_key, job.usage)
+                if method and content:
+                    store.append_reading(session_id, method, question, {
+                        "kind": "analysis", "model": model_key, "reasoning": reasoning, "content": content,
+                    })
+
+            # The panel's models are their own key component, so the set (not its order) scopes the dedup.
+            key = ResponseCache.make_key(method, model_key, system_prompt, prompt, tuple(sorted(models)))
+            return {"target": replay if cached is not None else generate, "key": key, "on_finish": finish,
+                    "method": method, "question": question, "model": model_key, "cached": cached is not None}
+
+        # Clicking again while the same reading is still running re-attaches to the whole ensemble (and its
+        # consensus) instead of generating twice; a partial match starts a complete new ensemble.
+        members = queue.submit_all(session_id, [member(model_key) for model_key in models], group=group)
+        st.session_state.yj_job_id = members[0].id
+        if len(members) < 2 or members[0].group != group:
+            return
+
+        def consensus(job):
+            verdicts = [(m.meta["model"], m.text()[1]) for m in members if m.status == "done" and m.content]
+            if len(verdicts) < 2:
+                job.meta["skipped"] = True
+                return
+            consensus_msgs = consensus_messages(method, question, verdicts)
+            stream_job(job, client, scheduler, CONSENSUS_MODEL, consensus_msgs, consensus_tokens(consensus_msgs),
+                       telemetry=telemetry, kind="consensus", max_tokens=CONSENSUS_OUTPUT_TOKENS)
+
+        def finish_consensus(job):
+            usage_meter.record(CONSENSUS_MODEL, job.usage)
+            content = job.text()[1]
+            if method and content:
+                store.append_reading(session_id, method, question, {
+                    "kind": "analysis", "model": CONSENSUS_MODEL, "consensus": True, "content": content,
+                })
+
+        # Starts the moment the last member finishes, so the wall clock is the slowest model plus the summary.
+        queue.submit(session_id, consensus, on_finish=finish_consensus, group=group, after=members,
+                     method=method, question=question, model=CONSENSUS_MODEL, role="consensus")
+
+    def dismiss_reading_job(group):
+        st.session_state.yj_job_dismissed = group
+
+    def cancel_reading_jobs(job_ids):
+        for job_id in job_ids:
+            get_job_queue().cancel(job_id)
+
+    def job_status_text(job):
+        ticket = job.ticket
+        if job.status == "queued":
+            return "🕒 等待各模型完成后综合..." if job.meta.get("role") == "consensus" else "🕒 等待空闲的推演线程..."
+        if job.meta.get("waiting_on_peer"):
+            return "🔗 相同的推演正在另一处进行，完成后直接共享结果..."
+        if ticket is not None and not ticket.granted:
+            return f"🚦 排队中：前方还有 {max(ticket.position() - 1, 0)} 个请求，已等待 {ticket.wait_seconds:.0f} 秒"
+        if job.retry is not None and not (job.reasoning or job.content):
+            return f"⏳ 上游繁忙，正在重试 ({job.retry + 1}/{MAX_RETRIES})..."
+        return "✍️ 推演在后台进行，切换页面或刷新都不会中断，回来即可继续查看。"
+
+    def render_reading_job():
+        """Follow this session's current reading live, every model side by side; after a rerun or a
+        refresh it re-attaches by job ID."""
+        queue = get_job_queue()
+        anchor = queue.get(st.session_state.get("yj_job_id", "")) or queue.latest(get_session_id())
+        if anchor is None or anchor.group == st.session_state.get("yj_job_dismissed"):
+            return
+        st.session_state.yj_job_id = anchor.id
+        jobs = queue.group(anchor.group)
+        members = [job for job in jobs if job.meta.get("role") != "consensus"]
+        consensus_jobs = [job for job in jobs if job.meta.get("role") == "consensus"]
+
         st.markdown("---")
-        st.markdown("#### 📜 大师批断")
-        reasoning_expander = st.expander("👁️ 凝神推演 (AI 思考过程)", expanded=True)
-        reasoning_area = reasoning_expander.empty()
-        content_area = st.empty()
-        full_reasoning = ""
-        full_content = ""
-        
-        try:
-            response = client.chat.completions.create(
-                model=model_key,
-                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
-                stream=True
+        st.markdown("#### 📜 大师批断" + (" · 多模型会诊" if len(members) > 1 else ""))
+        st.caption(f"{anchor.meta.get('method') or ''} · {anchor.meta.get('question') or ''}")
+        if all(job.finished for job in jobs):
+            st.button("收起", key="btn_yj_dismiss", on_click=dismiss_reading_job, args=(anchor.group,))
+        else:
+            st.button("⏹️ 停止推演", key="btn_yj_cancel", on_click=cancel_reading_jobs, args=([job.id for job in jobs],))
+
+        views = []
+        columns = st.columns(len(members)) if len(members) > 1 else [st.container()]
+        for job, column in zip(members, columns):
+            with column:
+                if len(members) > 1:
+                    st.markdown(f"**{job.meta['model'].split('/')[-1]}**")
+                status_area = st.empty()
+                reasoning_area = st.expander("👁️ 凝神推演 (AI 思考过程)", expanded=not job.finished).empty()
+                views.append({"job": job, "status_area": status_area, "renderer": StreamRenderer(reasoning_area, st.empty())})
+        for job in consensus_jobs:
+            st.markdown(f"#### 🤝 综合结论 ({CONSENSUS_MODEL.split('/')[-1]})")
+            status_area = st.empty()
+            views.append({"job": job, "status_area": status_area, "renderer": StreamRenderer(st.empty(), st.empty())})
+
+        for view in views:
+            view.update(reasoning=0, content=0, status=None, done=False)
+        while not all(view["done"] for view in views):
+            for view in views:
+                if view["done"]:
+                    continue
+                job, renderer = view["job"], view["renderer"]
+                finished = job.finished  # read first, so the chunks drained below include the last ones
+                n_reasoning, n_content = len(job.reasoning), len(job.content)
+                for text in job.reasoning[view["reasoning"]:n_reasoning]:
+                    renderer.add_reasoning(text)
+                for text in job.content[view["content"]:n_content]:
+                    renderer.add_content(text)
+                view.update(reasoning=n_reasoning, content=n_content)
+                if finished:
+                    renderer.flush(final=True)
+                    render_job_outcome(job, renderer, view["status_area"])
+                    view["done"] = True
+                    continue
+                text = job_status_text(job)
+                if text != view["status"]:
+                    view["status_area"].caption(text)
+                    view["status"] = text
+            time.sleep(0.1)
+
+    def render_job_outcome(job, renderer, status_area):
+        if job.status == "error":
+            status_area.error(f"连接中断: {job.error}")
+        elif job.status == "cancelled":
+            status_area.warning("⏹️ 已停止推演。")
+        elif job.meta.get("skipped"):
+            status_area.caption("仅一个模型给出批断，无需综合。")
+        elif job.meta.get("cached"):
+            status_area.caption("⚡ 相同起局与问题的批断已命中缓存，即时呈现。")
+        else:
+            stats = renderer.stats()
+            status_area.caption(
+                f"⚡ {stats['chunks']} 个片段 · {stats['chunks_per_s']:.0f} 片段/秒 · 刷新 {stats['flushes']} 次 (推理 {stats['reasoning_flushes']} 次)"
+                + (f" · 🧮 {usage_caption(job.usage)}" if job.usage else "")
             )
-            for chunk in response:
-                delta = chunk.choices[0].delta
-                if hasattr(delta, 'reasoning_content') and delta.reasoning_content:
-                    full_reasoning += delta.reasoning_content
-                    reasoning_area.markdown(f"*{full_reasoning}*")
-                if hasattr(delta, 'content') and delta.content:
-                    full_content += delta.content
-                    content_area.markdown(full_content + "▌")
-            content_area.markdown(full_content)
-        except Exception as e:
-            st.error(f"连接中断: {str(e)}")
 
     # --- Sidebar: User Settings ---
     with st.sidebar:
@@ -417,21 +771,53 @@ def app_yijing(api_key):
         with st.expander("🌍 时空校准 (真太阳时)", expanded=True):
             city_name = st.selectbox("选择所在地", list(CITY_COORDINATES.keys()), index=4) 
             if city_name == "自定义/手动输入":
-                longitude = st.number_input("请输入当地经度", value=116.40, format="%.2f")
+                if GEOCODER_URL:
+                    place_query = st.text_input("地名或经纬度", placeholder="如: 纽约 / 40.71,-74.01")
+                    st.caption(f"🔎 地名将发送至 {urllib.parse.urlsplit(GEOCODER_URL).netloc} 查询经纬度。")
+                else:
+                    place_query = st.text_input("经纬度", placeholder="如: 40.71,-74.01 或经度 116.40")
+                place = lookup_place(place_query) if place_query else None
+                if place:
+                    longitude = place["longitude"]
+                    st.caption(f"📍 {place['name']} 经度: {longitude:.2f}°")
+                else:
+                    if place_query:
+                        st.warning("未能查到该地点，请直接输入经度。")
+                    longitude = st.number_input("请输入当地经度", value=116.40, format="%.2f")
             else:
                 longitude = CITY_COORDINATES[city_name]
                 st.caption(f"📍 {city_name} 经度: {longitude}°")
             
             now = datetime.datetime.now(TZ_CN)
-            true_solar_time = get_true_solar_time(now.replace(tzinfo=None), longitude)
-            st.caption(f"🌞 真太阳时: {true_solar_time.strftime('%H:%M:%S')}")
+            shichen = shichen_boundaries(now, longitude, get_solar_table())
+            true_solar_time = shichen["solar"]
+            st.caption(f"🌞 真太阳时: {true_solar_time.strftime('%H:%M:%S')} "
+                       f"(经度 {shichen['longitude_offset_min']:+.1f} 分 · 时差 {shichen['equation_of_time_min']:+.1f} 分)")
+            if shichen["margin_s"] < SHICHEN_WARNING_MINUTES * 60:
+                if shichen["until_s"] < shichen["since_s"]:
+                    boundary = f"{shichen['ends']:%H:%M:%S} 进入{shichen['next_zhi']}时"
+                else:
+                    boundary = f"{shichen['starts']:%H:%M:%S} 刚入{shichen['zhi']}时"
+                st.warning(f"⏳ 临近时辰交界 ({boundary})，起卦时刻稍有出入时柱即不同。")
 
-        ganzhi_info = get_ganzhi_info(true_solar_time) if Solar else {}
+        ganzhi_info = get_ganzhi_info(true_solar_time, get_ganzhi_index())
         if ganzhi_info:
             st.success(f"📅 {ganzhi_info['str']}\n\n🌙 {ganzhi_info['lunar_str']}")
         
-        model_name = st.selectbox("选择易学 AI 模型", list(MODELS.keys()), index=0)
-        selected_model = MODELS[model_name]
+        use_ensemble = st.checkbox("多模型会诊", value=False,
+                                   help=f"同一起局并行交给多个模型推演，全部完成后由 {CONSENSUS_MODEL.split('/')[-1]} 给出综合结论；耗时取决于最慢的模型。")
+        if use_ensemble:
+            model_names = st.multiselect("参与会诊的模型", list(MODELS.keys()), default=list(MODELS.keys()))
+            selected_models = [MODELS[name] for name in model_names] or [next(iter(MODELS.values()))]
+        else:
+            model_name = st.selectbox("选择易学 AI 模型", list(MODELS.keys()), index=0)
+            selected_models = [MODELS[model_name]]
+        use_cache = st.checkbox("复用相同起局的批断 (缓存)", value=True,
+                                help=f"对{'、'.join(sorted(CACHEABLE_METHODS))}，输入完全相同的请求直接复用已有批断。")
+        if use_cache:
+            cache_stats = get_response_cache().stats()
+            st.caption(f"🗃️ 缓存命中率 {cache_stats['hit_ratio']:.0%} · 内存 {cache_stats['memory_hits']} / 共享 {cache_stats['shared_hits']}"
+                       f" / 磁盘 {cache_stats['disk_hits']} / 未命中 {cache_stats['misses']}")
 
     # --- Main Yi Jing Content ---
     st.markdown("""
@@ -441,7 +827,7 @@ def app_yijing(api_key):
     </div>
     """, unsafe_allow_html=True)
 
-    if not Solar:
+    if not ganzhi_info:
         st.error("⚠️ 缺少 `lunar_python` 库，无法进行排盘计算。")
         return
 
@@ -451,6 +837,31 @@ def app_yijing(api_key):
         "longitude": longitude
     }
 
+    def show_more_readings():
+        st.session_state.yj_history_pages += 1
+
+    @st.fragment
+    def render_reading_history():
+        if "yj_history_pages" not in st.session_state:
+            st.session_state.yj_history_pages = 0
+        with st.expander("📚 历史批断", expanded=False):
+            if not st.session_state.yj_history_pages:
+                st.button("加载历史记录", key="btn_yj_history", on_click=show_more_readings)
+                return
+            readings = get_session_store().load_readings(get_session_id(), limit=st.session_state.yj_history_pages * 5)
+            analyses = [r for r in readings if r["payload"].get("kind") == "analysis"]
+            if not analyses:
+                st.caption("暂无记录。")
+            for reading in analyses:
+                when = datetime.datetime.fromtimestamp(reading["created"], TZ_CN).strftime("%m-%d %H:%M")
+                model = reading["payload"]["model"].split("/")[-1] + (" · 综合" if reading["payload"].get("consensus") else "")
+                if st.toggle(f"{when} · {reading['method']} · {reading['question'] or '（未填问题）'} · {model}", key=f"yj_reading_{reading['id']}"):
+                    st.markdown(reading["payload"]["content"])
+            if len(readings) == st.session_state.yj_history_pages * 5:
+                st.button("加载更多", key="btn_yj_history_more", on_click=show_more_readings)
+
+    render_reading_history()
+
     tabs = st.tabs(["🪙 六爻纳甲", "🌸 梅花易数", "🛡️ 奇门遁甲", "🌊 大六壬", "🌌 太乙神数", "🖐️ 小六壬"])
 
     # 1. 六爻
@@ -458,14 +869,19 @@ def app_yijing(api_key):
         st.subheader("六爻纳甲")
         col_q, col_btn = st.columns([3, 1])
         q_ly = col_q.text_input("请输入问题", placeholder="例如：下个月跳槽去A公司吉凶如何？", key="q_ly")
-        if "ly_res" not in st.session_state: st.session_state.ly_res = None
+        if "ly_res" not in st.session_state:
+            # Resume the last cast of this session from the store, if any.
+            recent = get_session_store().load_readings(get_session_id(), limit=10, method="六爻")
+            casts = [r for r in recent if r["payload"].get("kind") == "cast"]
+            st.session_state.ly_res = {**casts[0]["payload"], "q": casts[0]["question"]} if casts else None
         if col_btn.button("摇卦起盘", use_container_width=True):
             if not q_ly: st.toast("⚠️ 请先输入问题")
             else:
                 with st.spinner("凝神摇卦中..."):
                     time.sleep(1)
-                    raw, display = DivinationEngine.cast_liuyao_coin()
+                    raw, display = DivinationEngine.cast_liuyao_coin(get_session_rng())
                     st.session_state.ly_res = {"raw": raw, "display": display, "q": q_ly}
+                    get_session_store().append_reading(get_session_id(), "六爻", q_ly, {"kind": "cast", "raw": raw, "display": display})
         
         if st.session_state.ly_res:
             res = st.session_state.ly_res
@@ -475,10 +891,12 @@ def app_yijing(api_key):
                 color = "#D32F2F" if "阳" in line['name'] else "#1976D2"
                 st.markdown(f"<div style='display:flex; justify-content:space-between; align-items:center; margin: 4px 0;'><span style='color:#999; font-size:12px; width:30px;'>六{i+1}</span><span style='color:{color}; font-weight:bold; font-size:18px; letter-spacing: 2px;'>{line['symbol']}</span><span style='color:#555; font-size:14px; width:80px; text-align:right;'>{line['name']}</span></div>", unsafe_allow_html=True)
             st.markdown("</div>", unsafe_allow_html=True)
+            with st.expander("📋 纳甲排盘", expanded=False):
+                st.text(format_chart(najia_chart(res['raw'], ganzhi_info['day_gan'], ganzhi_info['day_zhi'])))
             if st.button("大师解卦", key="btn_ly_ai"):
                 sys_prompt = generate_system_prompt("六爻", user_profile, ganzhi_info)
-                user_prompt = f"用户问题：{res['q']}\n卦象数据：{[line['name'] for line in res['display']]}\n请排盘并断卦。"
-                stream_ai_analysis(user_prompt, sys_prompt, selected_model)
+                user_prompt = build_user_prompt("六爻", res['q'], ganzhi_info, res)
+                stream_ai_analysis(user_prompt, sys_prompt, selected_models, method="六爻", question=res['q'])
 
     # 2. 梅花
     with tabs[1]:
@@ -489,7 +907,7 @@ def app_yijing(api_key):
         q_mh = st.text_input("所测之事", key="q_mh")
         if st.button("起卦", key="btn_mh"):
             if n1 == 0 or n2 == 0:
-                n1, n2 = random.randint(1, 100), random.randint(1, 100)
+                n1, n2 = (int(x[0]) for x in meihua_numbers(1, get_session_rng()))
                 st.info(f"自动感应数字：{n1}, {n2}")
             res = DivinationEngine.cast_meihua(n1, n2, ganzhi_info['hour_idx'] + 1)
             c_a, c_b, c_c = st.columns(3)
@@ -497,26 +915,34 @@ def app_yijing(api_key):
             c_b.metric("动爻", f"第 {res['moving']} 爻")
             c_c.metric("五行", f"上{res['upper_nature']} 下{res['lower_nature']}")
             sys_prompt = generate_system_prompt("梅花", user_profile, ganzhi_info)
-            user_prompt = f"用户问题：{q_mh}\n上卦：{res['upper']}\n下卦：{res['lower']}\n动爻：{res['moving']}\n请断吉凶。"
-            stream_ai_analysis(user_prompt, sys_prompt, selected_model)
+            user_prompt = build_user_prompt("梅花", q_mh, ganzhi_info, res)
+            stream_ai_analysis(user_prompt, sys_prompt, selected_models, method="梅花", question=q_mh)
 
     # 3. 奇门
     with tabs[2]:
         st.subheader("奇门遁甲")
         q_qm = st.text_input("决策事项", placeholder="例如：明天去谈判能否成功？方位在西北。", key="q_qm")
+        qimen_text = local_chart("奇门", ganzhi_info)
+        if qimen_text:
+            with st.expander("📋 奇门盘", expanded=False):
+                st.text(qimen_text)
         if st.button("排盘演局", key="btn_qm"):
             sys_prompt = generate_system_prompt("奇门", user_profile, ganzhi_info)
-            user_prompt = f"用户问题：{q_qm}\n当前真太阳时干支：{ganzhi_info['str']}\n请以时家奇门排盘分析。"
-            stream_ai_analysis(user_prompt, sys_prompt, selected_model)
+            user_prompt = build_user_prompt("奇门", q_qm, ganzhi_info)
+            stream_ai_analysis(user_prompt, sys_prompt, selected_models, method="奇门", question=q_qm)
 
     # 4. 大六壬
     with tabs[3]:
         st.subheader("大六壬")
         q_lr = st.text_input("六壬问事", key="q_lr")
+        liuren_text = local_chart("大六壬", ganzhi_info)
+        if liuren_text:
+            with st.expander("📋 六壬课式", expanded=False):
+                st.text(liuren_text)
         if st.button("起课分析", key="btn_lr"):
             sys_prompt = generate_system_prompt("大六壬", user_profile, ganzhi_info)
-            user_prompt = f"用户问题：{q_lr}\n当前真太阳时干支：{ganzhi_info['str']}\n当前节气：{ganzhi_info.get('solar_term','')}\n请确定月将，推导天地盘、四课、三传，最后断事。"
-            stream_ai_analysis(user_prompt, sys_prompt, selected_model)
+            user_prompt = build_user_prompt("大六壬", q_lr, ganzhi_info)
+            stream_ai_analysis(user_prompt, sys_prompt, selected_models, method="大六壬", question=q_lr)
 
     # 5. 太乙
     with tabs[4]:
@@ -524,26 +950,68 @@ def app_yijing(api_key):
         q_ty = st.text_input("太乙问测", placeholder="例如：未来五年行业发展大势如何？", key="q_ty")
         if st.button("太乙演局", key="btn_ty"):
             sys_prompt = generate_system_prompt("太乙", user_profile, ganzhi_info)
-            user_prompt = f"用户问题：{q_ty}\n当前真太阳时干支：{ganzhi_info['str']}\n请进行太乙积年推算，定局数，分主客，论格局。"
-            stream_ai_analysis(user_prompt, sys_prompt, selected_model)
+            user_prompt = build_user_prompt("太乙", q_ty, ganzhi_info)
+            stream_ai_analysis(user_prompt, sys_prompt, selected_models, method="太乙", question=q_ty)
 
     # 6. 小六壬
     with tabs[5]:
         st.subheader("小六壬")
         q_xlr = st.text_input("速问", key="q_xlr")
         if st.button("掐指一算", key="btn_xlr"):
-            m, d, h = ganzhi_info['month_num'], ganzhi_info['day_num'], ganzhi_info['hour_idx'] + 1
-            states = ["大安", "留连", "速喜", "赤口", "小吉", "空亡"]
-            idx_m = (m - 1) % 6
-            idx_d = (idx_m + d - 1) % 6
-            idx_h = (idx_d + h - 1) % 6
-            result = states[idx_h]
-            seq = f"{states[idx_m]} -> {states[idx_d]} -> {states[idx_h]}"
-            st.success(f"结果：{result}")
-            st.caption(f"路径：{seq}")
+            res = DivinationEngine.cast_xiaoliuren(ganzhi_info['month_num'], ganzhi_info['day_num'], ganzhi_info['hour_idx'] + 1)
+            st.success(f"结果：{res['result']}")
+            st.caption(f"路径：{res['path']}")
             sys_prompt = generate_system_prompt("小六壬", user_profile, ganzhi_info)
-            user_prompt = f"用户问题：{q_xlr}\n推演路径：{seq}\n最终落宫：{result}\n请解释含义。"
-            stream_ai_analysis(user_prompt, sys_prompt, selected_model)
+            user_prompt = build_user_prompt("小六壬", q_xlr, ganzhi_info, res)
+            stream_ai_analysis(user_prompt, sys_prompt, selected_models, method="小六壬", question=q_xlr)
+
+    render_reading_job()
+
+# ==========================================
+# APP 3: Telemetry (性能监控)
+# ==========================================
+
+def app_telemetry():
+    st.title("📈 性能监控")
+    st.markdown("每次模型调用的首字延迟 (TTFT)、推理/回答吞吐、总耗时与错误率，按模型统计。")
+    telemetry = get_telemetry()
+    WINDOWS = {"最近 5 分钟": 300, "最近 15 分钟": 900, "最近 1 小时": 3600, "全部缓冲记录": None}
+    c1, c2 = st.columns([3, 1])
+    window = WINDOWS[c1.selectbox("统计窗口", list(WINDOWS.keys()), index=1)]
+    c2.button("刷新", use_container_width=True)
+
+    summary = telemetry.summary(window)
+    if not summary:
+        st.info("该时间窗口内还没有模型调用记录。")
+    else:
+        def fmt(value, digits):
+            return "—" if value is None else f"{value:.{digits}f}"
+
+        rows = []
+        for model, stats in summary.items():
+            row = {"模型": model.split("/")[-1], "调用": stats["calls"], "错误率": f"{stats['error_rate']:.0%}"}
+            for field, label, digits in (("ttft_s", "TTFT 秒", 2), ("total_s", "总耗时 秒", 1), ("queue_s", "排队 秒", 1),
+                                         ("reasoning_tps", "推理 tok/s", 0), ("content_tps", "回答 tok/s", 0)):
+                for q in QUANTILES:
+                    row[f"{label} p{int(q * 100)}"] = fmt(stats[field][q], digits)
+            rows.append(row)
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+
+    recent = telemetry.recent(window)[-50:]
+    if recent:
+        with st.expander(f"🧾 最近 {len(recent)} 次调用", expanded=False):
+            st.dataframe([
+                {"时间": datetime.datetime.fromtimestamp(r["ts"], TZ_CN).strftime("%H:%M:%S"), "来源": r["kind"],
+                 "模型": r["model"].split("/")[-1], "状态": r["status"], "TTFT": r["ttft_s"], "总耗时": r["total_s"],
+                 "推理 tok": r["reasoning_tokens"], "回答 tok": r["content_tokens"], "错误": r["error"] or ""}
+                for r in reversed(recent)
+            ], use_container_width=True, hide_index=True)
+    sinks = []
+    if telemetry.jsonl_path:
+        sinks.append(f"JSONL → `{telemetry.jsonl_path}`")
+    if os.getenv("DIVINATION_METRICS_PORT"):
+        sinks.append(f"Prometheus → `http://{os.getenv('DIVINATION_METRICS_HOST', '127.0.0.1')}:{os.getenv('DIVINATION_METRICS_PORT')}/metrics`")
+    st.caption(" · ".join(sinks) if sinks else "设置 DIVINATION_TELEMETRY_PATH 输出 JSONL，设置 DIVINATION_METRICS_PORT 开启 Prometheus 指标端点。")
 
 # ==========================================
 # Main Navigation
@@ -551,15 +1019,22 @@ def app_yijing(api_key):
 
 def main():
     st.sidebar.title("🔮 功能导航")
-    app_mode = st.sidebar.radio("选择应用", ["AI 众议院 (Roundtable)", "AI 易学决策 (Yi Jing)"])
+    app_mode = st.sidebar.radio("选择应用", ["AI 众议院 (Roundtable)", "AI 易学决策 (Yi Jing)", "性能监控 (Telemetry)"])
     
     # Unified Key Retrieval
     api_key = get_api_key()
+    render_session_controls()
+    if api_key:
+        render_pool_stats()
+        render_scheduler_stats()
+        render_usage_stats()
 
     if app_mode == "AI 众议院 (Roundtable)":
         app_roundtable(api_key)
     elif app_mode == "AI 易学决策 (Yi Jing)":
         app_yijing(api_key)
+    elif app_mode == "性能监控 (Telemetry)":
+        app_telemetry()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,46 @@
+"""UI-free core of the divination app, shared by the Streamlit front end and the batch CLI.
+
+Nothing heavy is imported up front: `import divination_core` only sets up the lazy attribute table
+below, submodules load on first access, and openai/httpx/lunar_python/numpy are imported inside the
+functions that need them. Run `python -m divination_core --help` for the batch entry point.
+"""
+import importlib
+
+_EXPORTS = {
+    "estimate_tokens": "utils", "truncate_to_tokens": "utils", "HitRateCounter": "utils",
+    "BASE_URL": "clients", "ClientPool": "clients",
+    "StreamRenderer": "render",
+    "SessionStore": "store", "ResponseCache": "store", "CACHEABLE_METHODS": "store",
+    "MmapStore": "shared_cache", "RespClient": "shared_cache", "RespServer": "shared_cache", "SingleFlight": "shared_cache",
+    "open_shared_cache": "shared_cache",
+    "TokenBucket": "scheduler", "Ticket": "scheduler", "ModelScheduler": "scheduler", "MAX_RETRIES": "scheduler",
+    "retry_after_seconds": "scheduler", "backoff_delay": "scheduler", "call_with_retry": "scheduler",
+    "stream_completion": "scheduler",
+    "RoundtableEngine": "engine", "new_stream_state": "engine", "PANEL_OUTPUT_TOKENS": "engine",
+    "Job": "jobs", "JobQueue": "jobs", "stream_job": "jobs",
+    "TZ_CN": "ganzhi", "CITY_COORDINATES": "ganzhi", "get_true_solar_time": "ganzhi", "get_ganzhi_info": "ganzhi",
+    "load_ganzhi_index": "ganzhi", "lunar_available": "ganzhi",
+    "EquationOfTimeTable": "solar_time", "true_solar_time_batch": "solar_time", "shichen_boundaries": "solar_time",
+    "shichen_batch": "solar_time", "geocode": "solar_time",
+    "DivinationEngine": "casting", "RngStreams": "casting", "cast_liuyao_batch": "casting", "cast_meihua_batch": "casting",
+    "najia_chart": "najia", "format_chart": "najia", "qimen_plate": "qimen", "format_qimen": "qimen",
+    "liuren_plate": "liuren", "format_liuren": "liuren",
+    "generate_system_prompt": "prompts", "system_prompt_segments": "prompts", "build_user_prompt": "prompts",
+    "local_chart": "prompts",
+    "MODEL_CONTEXT_TOKENS": "context", "context_budget": "context", "fit_history": "context", "usage_numbers": "context",
+    "UsageMeter": "context", "Telemetry": "telemetry", "CallTimer": "telemetry",
+    "SECRETARY_MODEL": "secretary", "secretary_messages": "secretary", "summarize": "secretary",
+    "METHODS": "readings", "cast_for": "readings", "prepare_reading": "readings",
+    "CONSENSUS_MODEL": "readings", "consensus_messages": "readings",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
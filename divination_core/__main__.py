@@ -0,0 +1,215 @@
+"""Batch readings from a JSONL file: `python -m divination_core questions.jsonl -o readings.jsonl`.
+
+Each input line is an object with `method` (六爻/梅花/奇门/大六壬/太乙/小六壬) and `question`, and optionally
+`id`, `time` (ISO 8601, China time when naive; default now), `city` (any place name or "lat,lon", looked
+up with `solar_time.geocode` when it is not in CITY_COORDINATES) or `longitude`, `profile` (same keys
+as the app's 命主信息), `n1`/`n2` for 梅花 and `model`. One result object is written per input line, in
+completion order. Timings go to stderr; `--dry-run` stops after casting and prompt building, which is
+the way to measure the cold-start path without any network.
+"""
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import os
+import sys
+import threading
+import uuid
+
+from .ganzhi import CITY_COORDINATES, TZ_CN, get_ganzhi_info, get_true_solar_time, load_ganzhi_index
+from .readings import cast_for, prepare_reading, reading_messages, reading_tokens
+from .utils import estimate_tokens
+
+_IMPORTED = time.perf_counter()
+
+DEFAULT_MODEL = "deepseek-ai/DeepSeek-R1"
+
+
+def parse_time(value):
+    if not value:
+        return datetime.datetime.now(TZ_CN).replace(tzinfo=None)
+    dt = datetime.datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(TZ_CN).replace(tzinfo=None)
+    return dt
+
+
+def run_item(line_no, item, args, runtime):
+    started = time.perf_counter()
+    method, question = item.get("method", ""), item.get("question", "")
+    result = {"line": line_no, "id": item.get("id", line_no), "method": method, "question": question}
+    try:
+        if "longitude" in item:
+            longitude = float(item["longitude"])
+        elif item.get("city", "北京") in CITY_COORDINATES:
+            longitude = CITY_COORDINATES[item.get("city", "北京")]
+        else:
+            from .solar_time import geocode
+            place = geocode(item["city"])
+            if place is None:
+                raise ValueError(f"cannot resolve city {item['city']!r}")
+            longitude = place["longitude"]
+        true_solar_time = get_true_solar_time(parse_time(item.get("time")), longitude)
+        ganzhi_info = get_ganzhi_info(true_solar_time, runtime["index"])
+        if not ganzhi_info:
+            raise RuntimeError("lunar_python is not installed and no 干支 index is available")
+        # Each request draws from its own stream, keyed by its id (reproducible with DIVINATION_RNG_SEED).
+        rng = runtime["streams"].generator(f"batch/{result['id']}")
+        cast = cast_for(method, ganzhi_info, int(item.get("n1", 0)), int(item.get("n2", 0)), rng)
+        reading = prepare_reading(method, question, ganzhi_info, {**item.get("profile", {}), "longitude": longitude}, cast,
+                                  charts=not args.no_charts)
+        model = item.get("model", args.model)
+        result.update({"solar_time": true_solar_time.isoformat(timespec="seconds"), "ganzhi": ganzhi_info["str"], "solar_term": ganzhi_info["solar_term"], "cast": cast, "model": model,
+                       "prompt_tokens_est": estimate_tokens(reading["system_prompt"]) + estimate_tokens(reading["user_prompt"])})
+        if args.dry_run:
+            result.update({"system_prompt": reading["system_prompt"], "user_prompt": reading["user_prompt"]})
+        else:
+            result.update(ask_model(reading, model, runtime))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def ask_model(reading, model, runtime):
+    from .store import CACHEABLE_METHODS, ResponseCache
+    cache, cache_key, lease = runtime["cache"], None, None
+    if cache is not None and reading["method"] in CACHEABLE_METHODS:
+        cache_key = ResponseCache.make_key(reading["method"], model, reading["system_prompt"], reading["user_prompt"])
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cached": True}
+        # Another worker (or process, with a shared cache tier) already generating the same reading?
+        # Wait while it keeps its lease; take over if the lease ends without a reply.
+        lease = cache.lead(cache_key)
+        while lease is None:
+            cached = cache.wait_for(cache_key)
+            if cached is not None:
+                return {**cached, "cached": True}
+            lease = cache.lead(cache_key)
+    try:
+        return generate_reading(reading, model, runtime, cache_key, lease)
+    finally:
+        if lease:
+            lease.release()
+
+
+def generate_reading(reading, model, runtime, cache_key, lease=None):
+    from .scheduler import stream_completion
+    cache = runtime["cache"]
+    client = runtime["pool"].get(runtime["api_key"], runtime["base_url"])
+    parts = {"reasoning": [], "content": []}
+    usage = {}
+    started, first_chunk = time.perf_counter(), None
+    for kind, text in stream_completion(client, runtime["scheduler"], model, reading_messages(reading),
+                                        runtime["session_id"], reading_tokens(reading), on_usage=usage.update,
+                                        on_wait=lease and (lambda ticket: lease.keep()),
+                                        telemetry=runtime["telemetry"], kind="batch"):
+        first_chunk = first_chunk or time.perf_counter()
+        parts[kind].append(text)
+        if lease:
+            lease.keep()
+    payload = {"reasoning": "".join(parts["reasoning"]), "content": "".join(parts["content"])}
+    if cache_key and payload["content"]:
+        cache.put(cache_key, payload, reading["method"], model)
+    return {
+        **payload, "cached": False,
+        "ttft_s": round(first_chunk - started, 3) if first_chunk else None,
+        "reasoning_tokens_est": estimate_tokens(payload["reasoning"]),
+        **usage,
+    }
+
+
+def build_runtime(args):
+    from .casting import RngStreams
+    runtime = {"index": load_ganzhi_index(), "streams": RngStreams.from_env(), "cache": None,
+               "session_id": f"batch-{uuid.uuid4().hex[:8]}"}
+    if args.dry_run:
+        return runtime
+    from .clients import BASE_URL, ClientPool
+    from .scheduler import ModelScheduler
+    from .store import ResponseCache
+    from .telemetry import Telemetry
+    api_key = args.api_key or os.getenv("SILICONFLOW_API_KEY")
+    if not api_key:
+        raise SystemExit("set SILICONFLOW_API_KEY or pass --api-key (or use --dry-run)")
+    runtime.update({
+        "api_key": api_key,
+        "base_url": BASE_URL,
+        "pool": ClientPool.from_env(),
+        "scheduler": ModelScheduler.from_env(),
+        "cache": None if args.no_cache else ResponseCache.from_env(),
+        "telemetry": Telemetry.from_env(),
+    })
+    return runtime
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m divination_core", description="Run divination readings in bulk from a JSONL file.")
+    parser.add_argument("input", help="JSONL file of questions ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file for the readings (default stdout)")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--workers", type=int, default=4, help="readings in flight at once (the scheduler still applies per-model limits)")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the response cache")
+    parser.add_argument("--dry-run", action="store_true", help="cast and build prompts only, no model calls")
+    parser.add_argument("--no-charts", action="store_true", help="send 六爻/奇门/大六壬 without the locally computed chart (for A/B runs)")
+    args = parser.parse_args(argv)
+
+    with (sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")) as f:
+        items = [(n, json.loads(line)) for n, line in enumerate(f, 1) if line.strip()]
+    runtime = build_runtime(args)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    lock = threading.Lock()
+    first_result = None
+    errors = 0
+    answered = []
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(args.workers, 1)) as pool:
+            futures = [pool.submit(run_item, n, item, args, runtime) for n, item in items]
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                with lock:
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+                first_result = first_result or time.perf_counter()
+                errors += "error" in result
+                if result.get("cached") is False:
+                    answered.append(result)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    done = time.perf_counter()
+    print(
+        f"{len(items)} readings, {errors} errors · core import {(_IMPORTED - _STARTED) * 1000:.1f} ms"
+        + (f" · first result {(first_result - _STARTED) * 1000:.1f} ms" if first_result else "")
+        + f" · total {done - _STARTED:.2f} s",
+        file=sys.stderr,
+    )
+    if answered:
+        print(
+            f"{len(answered)} model readings · mean {sum(r['elapsed_s'] for r in answered) / len(answered):.1f} s"
+            f" · reasoning ≈{sum(r['reasoning_tokens_est'] for r in answered) / len(answered):.0f} tokens"
+            f" · prompt ≈{sum(r['prompt_tokens_est'] for r in answered) / len(answered):.0f} tokens",
+            file=sys.stderr,
+        )
+        prompt_tokens = sum(r.get("prompt_tokens", 0) for r in answered)
+        if prompt_tokens:
+            cached = sum(r.get("cached_tokens", 0) for r in answered)
+            print(f"usage: {prompt_tokens} prompt tokens sent · {cached} served from the provider's prompt cache"
+                  f" ({cached / prompt_tokens:.0%})", file=sys.stderr)
+    if "telemetry" in runtime:
+        for model, stats in runtime["telemetry"].summary(window_s=None).items():
+            ttft, total = stats["ttft_s"], stats["total_s"]
+            if ttft[0.5] is not None:
+                print(f"{model}: {stats['calls']} calls · {stats['error_rate']:.0%} errors · TTFT p50/p95/p99 "
+                      f"{ttft[0.5]:.2f}/{ttft[0.95]:.2f}/{ttft[0.99]:.2f} s · total p50 {total[0.5]:.1f} s", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""Reproducible load benchmarks for the app's model-call paths, against a local mock server.
+
+    python -m divination_core.bench --sessions 8 --turns 3 --save bench-baseline.json
+    python -m divination_core.bench --sessions 8 --turns 3 --compare bench-baseline.json
+
+Each scenario runs N simulated sessions at once through the same code the app uses, headlessly:
+
+    yijing      a reading per turn: prepare_reading -> stream_completion (scheduler slot, retries)
+    roundtable  a panel per turn on one shared RoundtableEngine, over each session's growing history
+    secretary   a rolling-summary update per turn: the app's `secretary.summarize`, non-streaming
+
+The mock (`divination_core.mock_server`) runs in a subprocess so its CPU and memory stay out of the
+numbers; `--base-url` targets another server instead. Per scenario the report has throughput, p50/
+p95/p99 of turn latency and TTFT, errors, 429s, this process's CPU time and its peak RSS so far
+(scenarios run in order, so later ones include earlier peaks; run one with `--scenarios` to isolate it). `--save`
+writes the results as JSON and `--compare` diffs a run against such a baseline, exiting 1 when a
+metric is worse by more than `--tolerance`.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from .telemetry import QUANTILES, Telemetry, percentile
+
+SCENARIOS = ("yijing", "roundtable", "secretary")
+YIJING_MODEL = "deepseek-ai/DeepSeek-R1"
+ROUNDTABLE_MODELS = ["deepseek-ai/DeepSeek-V3.2", "deepseek-ai/DeepSeek-R1", "moonshotai/Kimi-K2-Thinking",
+                     "zai-org/GLM-4.6", "MiniMaxAI/MiniMax-M2"]
+API_KEY = "sk-bench"
+# Metric -> True when higher is better; these are what --compare checks.
+COMPARED = {"turns_per_s": True, "tokens_per_s": True, "turn_p95_s": False, "ttft_p95_s": False,
+            "error_rate": False, "cpu_s": False, "rss_peak_mb": False}
+
+
+def rss_mb():
+    """Current resident set size of this process in MB (None where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return rss_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def start_mock(args):
+    """Run the mock server in a subprocess; returns (process, base_url)."""
+    cmd = [sys.executable, "-m", "divination_core.mock_server", "--port", "0",
+           "--ttft", str(args.ttft), "--tps", str(args.tps), "--reasoning-tokens", str(args.reasoning_tokens),
+           "--content-tokens", str(args.content_tokens), "--error-rate", str(args.error_rate),
+           "--rate-429", str(args.rate_429), "--retry-after", str(args.retry_after), "--models", args.mock_models]
+    if args.seed is not None:
+        cmd += ["--seed", str(args.seed)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(cmd, cwd=root, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        process.kill()
+        raise SystemExit("mock server failed to start")
+    return process, line.strip().rsplit(" ", 1)[-1]
+
+
+def sample_reading(seed):
+    from .casting import RngStreams
+    from .ganzhi import get_ganzhi_info, get_true_solar_time, load_ganzhi_index
+    from .readings import cast_for, prepare_reading
+    moment = get_true_solar_time(datetime.datetime(2025, 6, 1, 10, 30), 116.40)
+    ganzhi_info = get_ganzhi_info(moment, load_ganzhi_index())
+    if not ganzhi_info:
+        raise SystemExit("lunar_python is not installed and no 干支 index is available")
+    cast = cast_for("六爻", ganzhi_info, rng=RngStreams(seed).generator("bench"))
+    return prepare_reading("六爻", "下个月跳槽去A公司吉凶如何？", ganzhi_info, cast=cast)
+
+
+def run_scenario(name, args, base_url, pool, scheduler):
+    """Run `args.sessions` sessions of `args.turns` turns each; returns the scenario's metrics."""
+    from .engine import RoundtableEngine, new_stream_state
+    from .readings import reading_messages, reading_tokens
+    from .scheduler import stream_completion
+    from .secretary import summarize
+    telemetry = Telemetry(capacity=1_000_000)
+    engine = RoundtableEngine(pool, scheduler, telemetry, base_url) if name == "roundtable" else None
+    reading = sample_reading(args.seed)
+    client = pool.get(API_KEY, base_url)
+
+    def yijing_turn(session_id, turn, history):
+        for _ in stream_completion(client, scheduler, YIJING_MODEL, reading_messages(reading), session_id,
+                                   reading_tokens(reading), telemetry=telemetry, kind="yijing"):
+            pass
+
+    def roundtable_turn(session_id, turn, history):
+        history.append({"role": "user", "content": f"第{turn + 1}轮：请各位就上述问题继续发表看法。" * 4})
+        states = {model: new_stream_state() for model in ROUNDTABLE_MODELS}
+        engine.submit_panel(API_KEY, session_id, ROUNDTABLE_MODELS, list(history), states,
+                            deadline=args.deadline or None).result()
+        failed = [m for m, s in states.items() if s["error"]]
+        history.extend({"role": "assistant", "content": "".join(s["content"])} for s in states.values() if not s["error"])
+        if failed:
+            raise RuntimeError(f"{len(failed)} panel models failed")
+
+    def secretary_turn(session_id, turn, history):
+        summary = {"text": "纪要" * 200, "watermark": 0}
+        new_messages = [{"name": model, "content": "发言" * 600, "seq": i + 1} for i, model in enumerate(ROUNDTABLE_MODELS)]
+        summarize(client, scheduler, summary, new_messages, session_id, telemetry)
+
+    turn_fn = {"yijing": yijing_turn, "roundtable": roundtable_turn, "secretary": secretary_turn}[name]
+    latencies, failures = [], []
+
+    def session(n):
+        session_id = f"bench-{name}-{n}"
+        history = [{"role": "system", "content": "你是AI圆桌会议的与会者。"}]
+        for turn in range(args.turns):
+            started = time.perf_counter()
+            try:
+                turn_fn(session_id, turn, history)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                failures.append(e)
+            if args.think:
+                time.sleep(args.think)
+
+    throttled_before = sum(s["throttled"] for s in scheduler.stats().values())
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        list(executor.map(session, range(args.sessions)))
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+
+    records = telemetry.recent()
+    ok = [r for r in records if r["status"] == "ok"]
+    ttfts = sorted(r["ttft_s"] for r in ok if r["ttft_s"] is not None)
+    latencies.sort()
+    tokens = sum((r["completion_tokens"] or r["reasoning_tokens"] + r["content_tokens"]) for r in ok)
+    calls = [r for r in records if r["status"] != "cancelled"]
+    result = {
+        "sessions": args.sessions,
+        "turns": len(latencies),
+        "failed_turns": len(failures),
+        "calls": len(records),
+        "call_errors": sum(r["status"] == "error" for r in records),
+        "error_rate": sum(r["status"] == "error" for r in calls) / len(calls) if calls else 0.0,
+        "throttled_429": sum(s["throttled"] for s in scheduler.stats().values()) - throttled_before,
+        "wall_s": round(wall, 3),
+        "turns_per_s": round(len(latencies) / wall, 3),
+        "tokens_per_s": round(tokens / wall, 1),
+        "cpu_s": round(cpu, 3),
+        "cpu_pct": round(100 * cpu / wall, 1),
+        "rss_mb": round(rss_mb() or 0, 1),
+        "rss_peak_mb": round(peak_rss_mb() or 0, 1),
+    }
+    for q in QUANTILES:
+        label = f"p{int(q * 100)}"
+        result[f"turn_{label}_s"] = round(percentile(latencies, q), 3) if latencies else None
+        result[f"ttft_{label}_s"] = round(percentile(ttfts, q), 3) if ttfts else None
+    return result
+
+
+def compare(current, baseline, tolerance):
+    """Print metric deltas against a baseline run; returns the list of regressions."""
+    regressions = []
+    if current["config"] != baseline.get("config"):
+        print("note: baseline was recorded with a different configuration", file=sys.stderr)
+    for name, metrics in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        print(f"\n{name} vs baseline ({baseline.get('recorded_at', '?')})")
+        for metric, higher_is_better in COMPARED.items():
+            new, old = metrics.get(metric), base.get(metric)
+            if new is None or old is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+            worse = -change if higher_is_better else change
+            if metric == "error_rate":
+                worse = new - old  # absolute, rates are small
+            flag = "REGRESSION" if worse > tolerance else ""
+            if flag:
+                regressions.append((name, metric))
+            print(f"  {metric:<14} {old:>10.3f} -> {new:>10.3f}  {change:+7.1%}  {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the model-call paths against a mock chat-completions server.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=3, help="turns per session")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds each session waits between turns")
+    parser.add_argument("--deadline", type=float, default=0.0, help="roundtable per-model deadline (0 = none)")
+    parser.add_argument("--base-url", default=None, help="use this server instead of starting the mock")
+    mock = parser.add_argument_group("mock server")
+    mock.add_argument("--ttft", type=float, default=0.3)
+    mock.add_argument("--tps", type=float, default=200.0)
+    mock.add_argument("--reasoning-tokens", type=int, default=100)
+    mock.add_argument("--content-tokens", type=int, default=150)
+    mock.add_argument("--error-rate", type=float, default=0.0)
+    mock.add_argument("--rate-429", type=float, default=0.0)
+    mock.add_argument("--retry-after", type=float, default=0.2)
+    mock.add_argument("--mock-models", default="{}", help="per-model mock overrides as JSON")
+    limits = parser.add_argument_group("client limits")
+    limits.add_argument("--app-limits", action="store_true", help="use the app's DIVINATION_MODEL_* scheduler limits")
+    limits.add_argument("--max-inflight", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", default=None, help="write the results (a baseline) to this JSON file")
+    parser.add_argument("--compare", default=None, help="compare against a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="relative worsening that counts as a regression")
+    args = parser.parse_args()
+
+    from .clients import ClientPool
+    from .scheduler import ModelScheduler
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    process, base_url = (None, args.base_url) if args.base_url else start_mock(args)
+    config = {k: v for k, v in vars(args).items() if k not in ("save", "compare", "tolerance", "scenarios")}
+    results = {"recorded_at": datetime.datetime.now().isoformat(timespec="seconds"), "config": config,
+               "python": platform.python_version(), "platform": platform.platform(), "scenarios": {}}
+    try:
+        for name in scenarios:
+            pool = ClientPool.from_env()
+            if args.app_limits:
+                scheduler = ModelScheduler.from_env()
+            else:
+                scheduler = ModelScheduler({"max_inflight": args.max_inflight, "rpm": 10 ** 9, "tpm": 10 ** 12})
+            metrics = results["scenarios"][name] = run_scenario(name, args, base_url, pool, scheduler)
+            print(
+                f"{name:<11} {metrics['turns']} turns ({metrics['failed_turns']} failed) in {metrics['wall_s']:.2f} s"
+                f" · {metrics['turns_per_s']:.2f} turns/s · {metrics['tokens_per_s']:.0f} tok/s"
+                f" · turn p50/p95/p99 {metrics['turn_p50_s']}/{metrics['turn_p95_s']}/{metrics['turn_p99_s']} s"
+                f" · TTFT p50/p95/p99 {metrics['ttft_p50_s']}/{metrics['ttft_p95_s']}/{metrics['ttft_p99_s']} s"
+                f" · errors {metrics['call_errors']} · 429 {metrics['throttled_429']}"
+                f" · CPU {metrics['cpu_s']:.2f} s ({metrics['cpu_pct']:.0f}%) · RSS peak {metrics['rss_peak_mb']:.0f} MB",
+                flush=True,
+            )
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"saved {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): " + ", ".join(f"{s}.{m}" for s, m in regressions))
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
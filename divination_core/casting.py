@@ -0,0 +1,253 @@
+"""Casting methods: pure functions of their inputs and of an explicit random stream.
+
+Randomness comes from NumPy `Generator`s handed out by `RngStreams`: every session (or batch request)
+gets its own PCG64 stream derived from one root `SeedSequence`, so concurrent casts never share state
+and two sessions casting in the same microsecond still get independent hexagrams. The `*_batch`
+functions cast N readings in one vectorized call for simulations and bulk jobs;
+`python -m divination_core.casting check` runs the statistical checks and reports throughput.
+"""
+import argparse
+import collections
+import hashlib
+import math
+import os
+import threading
+import time
+
+XIAOLIUREN_STATES = ["大安", "留连", "速喜", "赤口", "小吉", "空亡"]
+TRIGRAMS = {1:"乾", 2:"兑", 3:"离", 4:"震", 5:"巽", 6:"坎", 7:"艮", 8:"坤"}
+NATURE = {1:"天", 2:"泽", 3:"火", 4:"雷", 5:"风", 6:"水", 7:"山", 8:"地"}
+
+# Line value -> (name, symbol). 0 少阴, 1 少阳, 2 老阴 (moving), 3 老阳 (moving).
+LINES = {
+    0: ("少阴", "▅▅　▅▅"),
+    1: ("少阳", "▅▅▅▅▅"),
+    2: ("老阴 X", "▅▅　▅▅ X"),
+    3: ("老阳 O", "▅▅▅▅▅ O"),
+}
+# Three coins as a 3-bit number -> line value: 0 heads 老阴, 1 少阳, 2 少阴, 3 老阳.
+COINS_TO_LINE = (2, 1, 1, 0, 1, 0, 0, 3)
+LINE_PROBABILITIES = {0: 3 / 8, 1: 3 / 8, 2: 1 / 8, 3: 1 / 8}
+
+
+class RngStreams:
+    """Independent random streams keyed by session or request ID, all derived from one root seed.
+
+    A key maps to a fixed `spawn_key` of the root `SeedSequence`, so the same (root seed, key) pair
+    always reproduces the same stream and different keys are statistically independent. The root
+    entropy comes from the OS unless DIVINATION_RNG_SEED pins it (useful for replaying simulations).
+    """
+
+    def __init__(self, seed=None, max_sessions=4096):
+        import numpy as np
+        self._np = np
+        self.root = np.random.SeedSequence(seed)
+        self.max_sessions = max_sessions
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        seed = os.getenv("DIVINATION_RNG_SEED")
+        return cls(int(seed) if seed else None)
+
+    def generator(self, key):
+        """A fresh Generator at the start of `key`'s stream."""
+        digest = hashlib.sha256(str(key).encode("utf-8")).digest()
+        spawn_key = (int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:16], "little"))
+        seq = self._np.random.SeedSequence(self.root.entropy, spawn_key=spawn_key)
+        return self._np.random.Generator(self._np.random.PCG64(seq))
+
+    def for_session(self, session_id):
+        """The session's long-lived Generator; successive casts continue the same stream.
+
+        A Generator is not thread-safe, which is fine for a Streamlit session (one script run at a time);
+        use `generator()` for work that fans out across threads.
+        """
+        with self._lock:
+            rng = self._sessions.get(session_id)
+            if rng is None:
+                rng = self._sessions[session_id] = self.generator(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return rng
+
+
+def _default_rng(rng):
+    if rng is not None:
+        return rng
+    import numpy as np
+    return np.random.default_rng()
+
+
+def cast_liuyao_batch(n, rng=None):
+    """N 六爻 casts as an (n, 6) uint8 array of line values, bottom line first.
+
+    One 18-bit draw per hexagram holds its 18 coins; each 3-bit group maps to a line through
+    COINS_TO_LINE, so the whole batch is two array operations.
+    """
+    import numpy as np
+    rng = _default_rng(rng)
+    coins = rng.integers(0, 1 << 18, size=n, dtype=np.uint32)
+    groups = (coins[:, None] >> np.arange(0, 18, 3, dtype=np.uint32)) & 7
+    return np.asarray(COINS_TO_LINE, dtype=np.uint8)[groups]
+
+
+def cast_meihua_batch(n1, n2, time_num):
+    """Vectorized `cast_meihua` on arrays of numbers: (upper, lower, moving) as arrays of 1..8, 1..8, 1..6."""
+    import numpy as np
+    n1, n2 = np.asarray(n1), np.asarray(n2)
+    upper = (n1 - 1) % 8 + 1
+    lower = (n2 - 1) % 8 + 1
+    moving = (n1 + n2 + np.asarray(time_num) - 1) % 6 + 1
+    return upper, lower, moving
+
+
+def meihua_numbers(n, rng=None):
+    """N pairs of 梅花 numbers in 1..100 (the app's 自动感应数字), as two arrays."""
+    rng = _default_rng(rng)
+    nums = rng.integers(1, 101, size=(2, n))
+    return nums[0], nums[1]
+
+
+class DivinationEngine:
+    @staticmethod
+    def cast_liuyao_coin(rng=None):
+        results = [int(v) for v in cast_liuyao_batch(1, rng)[0]]
+        display_lines = [{"name": LINES[val][0], "symbol": LINES[val][1], "val": val} for val in results]
+        return results, display_lines
+
+    @staticmethod
+    def cast_meihua(n1, n2, time_num):
+        upper = n1 % 8 or 8
+        lower = n2 % 8 or 8
+        moving = (n1 + n2 + time_num) % 6 or 6
+        return {
+            "upper": TRIGRAMS[upper], "upper_nature": NATURE[upper],
+            "lower": TRIGRAMS[lower], "lower_nature": NATURE[lower],
+            "moving": moving, "nums": (n1, n2)
+        }
+
+    @staticmethod
+    def cast_xiaoliuren(month_num, day_num, hour_num):
+        idx_m = (month_num - 1) % 6
+        idx_d = (idx_m + day_num - 1) % 6
+        idx_h = (idx_d + hour_num - 1) % 6
+        return {
+            "result": XIAOLIUREN_STATES[idx_h],
+            "path": f"{XIAOLIUREN_STATES[idx_m]} -> {XIAOLIUREN_STATES[idx_d]} -> {XIAOLIUREN_STATES[idx_h]}",
+        }
+
+
+# --- Statistical checks ---
+
+def chi2_sf(x, df):
+    """Survival function of the chi-square distribution for integer `df` (closed form, no SciPy)."""
+    if x <= 0:
+        return 1.0
+    half = x / 2.0
+    if df % 2 == 0:
+        term = total = 1.0
+        for k in range(1, df // 2):
+            term *= half / k
+            total += term
+        return math.exp(-half) * total
+    total = math.erfc(math.sqrt(half))
+    term = math.sqrt(2 * x / math.pi) * math.exp(-half)
+    for k in range(1, (df + 1) // 2):
+        total += term
+        term *= x / (2 * k + 1)
+    return total
+
+
+def chi2_goodness(counts, expected_probs):
+    total = sum(counts)
+    stat = sum((c - total * p) ** 2 / (total * p) for c, p in zip(counts, expected_probs))
+    return stat, chi2_sf(stat, len(counts) - 1)
+
+
+def chi2_independence(table):
+    rows = [sum(r) for r in table]
+    cols = [sum(c) for c in zip(*table)]
+    total = sum(rows)
+    stat = sum((table[i][j] - rows[i] * cols[j] / total) ** 2 / (rows[i] * cols[j] / total)
+               for i in range(len(rows)) for j in range(len(cols)))
+    return stat, chi2_sf(stat, (len(rows) - 1) * (len(cols) - 1))
+
+
+def check(casts=2_000_000, alpha=1e-4, seed=None):
+    """Run every check on `casts` hexagrams; returns [(name, statistic, p_value, passed)] and casts/s."""
+    import numpy as np
+    streams = RngStreams(seed)
+    rng = streams.generator("check")
+    started = time.perf_counter()
+    lines = cast_liuyao_batch(casts, rng)
+    rate = casts / (time.perf_counter() - started)
+    probs = [LINE_PROBABILITIES[v] for v in range(4)]
+    results = []
+
+    def record(name, stat, p):
+        results.append((name, stat, p, p >= alpha))
+
+    record("line values (1/8, 3/8, 3/8, 1/8)", *chi2_goodness(np.bincount(lines.ravel(), minlength=4).tolist(), probs))
+    for position in range(6):
+        record(f"line {position + 1} values", *chi2_goodness(np.bincount(lines[:, position], minlength=4).tolist(), probs))
+    for position in range(5):
+        pair = np.bincount(lines[:, position] * 4 + lines[:, position + 1], minlength=16).reshape(4, 4)
+        record(f"lines {position + 1}/{position + 2} independent", *chi2_independence(pair.tolist()))
+    moving = np.bincount((lines >= 2).sum(axis=1), minlength=7)
+    binomial = [math.comb(6, k) * 0.25 ** k * 0.75 ** (6 - k) for k in range(7)]
+    record("moving lines per cast ~ Binomial(6, 1/4)", *chi2_goodness(moving.tolist(), binomial))
+
+    # Two session streams from the same root must be independent of each other.
+    a = cast_liuyao_batch(casts // 10, streams.generator("session-a")).ravel()
+    b = cast_liuyao_batch(casts // 10, streams.generator("session-b")).ravel()
+    record("session streams independent", *chi2_independence(np.bincount(a * 4 + b, minlength=16).reshape(4, 4).tolist()))
+
+    # The single-cast path and the batch path agree, and a (seed, key) pair replays exactly.
+    replay = cast_liuyao_batch(1000, streams.generator("replay"))
+    same = np.array_equal(replay, cast_liuyao_batch(1000, streams.generator("replay")))
+    single = DivinationEngine.cast_liuyao_coin(streams.generator("single"))[0]
+    same = same and single == cast_liuyao_batch(1, streams.generator("single"))[0].tolist()
+    results.append(("streams reproducible per key", float("nan"), float("nan"), bool(same)))
+
+    n1, n2 = meihua_numbers(10000, rng)
+    upper, lower, moving_line = cast_meihua_batch(n1, n2, 7)
+    scalar = [DivinationEngine.cast_meihua(int(x), int(y), 7) for x, y in zip(n1, n2)]
+    agree = all(TRIGRAMS[int(u)] == s["upper"] and TRIGRAMS[int(l)] == s["lower"] and int(m) == s["moving"]
+                for u, l, m, s in zip(upper, lower, moving_line, scalar))
+    results.append(("meihua batch == scalar", float("nan"), float("nan"), agree))
+    return results, rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Statistical checks and throughput of the casting engine.")
+    parser.add_argument("command", choices=["check", "bench"])
+    parser.add_argument("--casts", type=int, default=2_000_000)
+    parser.add_argument("--alpha", type=float, default=1e-4, help="fail a chi-square test when p < alpha")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.command == "bench":
+        import numpy as np
+        rng = np.random.default_rng(args.seed)
+        started = time.perf_counter()
+        cast_liuyao_batch(args.casts, rng)
+        batch = args.casts / (time.perf_counter() - started)
+        started = time.perf_counter()
+        for _ in range(10000):
+            DivinationEngine.cast_liuyao_coin(rng)
+        single = 10000 / (time.perf_counter() - started)
+        print(f"batch: {batch:,.0f} casts/s · single: {single:,.0f} casts/s")
+        return
+    results, rate = check(args.casts, args.alpha, args.seed)
+    for name, stat, p, passed in results:
+        detail = "" if math.isnan(p) else f"chi2={stat:10.2f}  p={p:.4f}"
+        print(f"{'ok  ' if passed else 'FAIL'} {name:<42} {detail}")
+    print(f"{args.casts:,} casts at {rate:,.0f} casts/s")
+    raise SystemExit(0 if all(r[3] for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
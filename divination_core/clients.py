@@ -0,0 +1,231 @@
+"""Pooled OpenAI-compatible clients (openai/httpx are imported on first use)."""
+import importlib.util
+import os
+import threading
+import time
+
+BASE_URL = os.getenv("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1")
+
+class ClientPool:
+    """Process-wide OpenAI clients keyed by (api_key, base_url), each with its own pooled httpx client."""
+
+    def __init__(self, max_connections=50, max_keepalive=20, keepalive_expiry=60.0, http2=False, idle_ttl=900.0):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.idle_ttl = idle_ttl
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_connections=int(os.getenv("DIVINATION_HTTP_MAX_CONNECTIONS", "50")),
+            max_keepalive=int(os.getenv("DIVINATION_HTTP_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("DIVINATION_HTTP_KEEPALIVE_EXPIRY", "60")),
+            http2=os.getenv("DIVINATION_HTTP2", "0").lower() in ("1", "true", "yes"),
+            idle_ttl=float(os.getenv("DIVINATION_CLIENT_IDLE_TTL", "900")),
+        )
+
+    def _http2_available(self):
+        # httpx needs the optional h2 package for HTTP/2.
+        return self.http2 and importlib.util.find_spec("h2") is not None
+
+    def _build(self, api_key, base_url, asynchronous):
+        import httpx
+        from openai import AsyncOpenAI, OpenAI
+        counters = {"requests": 0, "connections": 0}
+
+        # httpcore reports every new TCP connection through the "trace" extension,
+        # which lets us tell reused keep-alive connections from fresh ones.
+        def count_connection(event_name):
+            if event_name == "connection.connect_tcp.started":
+                counters["connections"] += 1
+
+        if asynchronous:
+            async def trace(event_name, info):
+                count_connection(event_name)
+
+            async def on_request(request):
+                counters["requests"] += 1
+                request.extensions["trace"] = trace
+        else:
+            def trace(event_name, info):
+                count_connection(event_name)
+
+            def on_request(request):
+                counters["requests"] += 1
+                request.extensions["trace"] = trace
+
+        entry = {"counters": counters, "created": time.monotonic(), "last_used": time.monotonic(), "uses": 0,
+                 "in_use": 0, "loop": None}
+
+        def acquire():
+            with self._lock:
+                entry["in_use"] += 1
+
+        def release():
+            with self._lock:
+                entry["in_use"] -= 1
+                entry["last_used"] = time.monotonic()
+
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        transport_cls = httpx.AsyncHTTPTransport if asynchronous else httpx.HTTPTransport
+        entry["transport"] = transport_cls(limits=limits, http2=self._http2_available())
+        http_kwargs = {
+            "transport": _in_use_transport(httpx, entry["transport"], acquire, release, asynchronous),
+            "event_hooks": {"request": [on_request]},
+        }
+        # Retries are done by the scheduler (see `call_with_retry`) so that backoff releases the slot.
+        if asynchronous:
+            # An async client is bound to the event loop that first uses it; remember it for closing.
+            import asyncio
+            entry["loop"] = asyncio.get_running_loop()
+            entry["http"] = httpx.AsyncClient(**http_kwargs)
+            entry["client"] = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=entry["http"], max_retries=0)
+        else:
+            entry["http"] = httpx.Client(**http_kwargs)
+            entry["client"] = OpenAI(api_key=api_key, base_url=base_url, http_client=entry["http"], max_retries=0)
+        return entry
+
+    def get(self, api_key, base_url=BASE_URL):
+        return self._get(api_key, base_url, asynchronous=False)
+
+    def get_async(self, api_key, base_url=BASE_URL):
+        """AsyncOpenAI client; must be called from the event loop that will use it."""
+        return self._get(api_key, base_url, asynchronous=True)
+
+    def _get(self, api_key, base_url, asynchronous):
+        key = (api_key, base_url, asynchronous)
+        with self._lock:
+            self.lookups += 1
+            self._evict_idle_locked()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = self._build(api_key, base_url, asynchronous)
+            else:
+                self.hits += 1
+            entry["last_used"] = time.monotonic()
+            entry["uses"] += 1
+            return entry["client"]
+
+    def _evict_idle_locked(self):
+        # A client is idle once no request is in flight on it (a stream can outlast `idle_ttl`)
+        # and none has been looked up or finished for `idle_ttl` seconds.
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if e["in_use"] == 0 and now - e["last_used"] > self.idle_ttl]:
+            entry = self._entries.pop(key)
+            if entry["loop"] is None:
+                entry["http"].close()
+            elif not entry["loop"].is_closed():
+                import asyncio
+                asyncio.run_coroutine_threadsafe(entry["http"].aclose(), entry["loop"])
+            self.evictions += 1
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_idle_locked()
+
+    def stats(self):
+        with self._lock:
+            clients = []
+            total_requests = total_connections = 0
+            for (api_key, base_url, asynchronous), entry in self._entries.items():
+                # Connection objects live on httpcore's pool, which httpx does not expose publicly.
+                pool = getattr(entry["transport"], "_pool", None)
+                conns = list(getattr(pool, "connections", []))
+                requests, connections = entry["counters"]["requests"], entry["counters"]["connections"]
+                total_requests += requests
+                total_connections += connections
+                clients.append({
+                    "key": f"…{api_key[-4:]}@{base_url}" + (" (async)" if asynchronous else ""),
+                    "open": len(conns),
+                    "idle": sum(1 for c in conns if c.is_idle()),
+                    "requests": requests,
+                    "new_connections": connections,
+                    "uses": entry["uses"],
+                    "in_use": entry["in_use"],
+                    "idle_for_s": round(time.monotonic() - entry["last_used"], 1),
+                })
+            return {
+                "clients": clients,
+                "lookups": self.lookups,
+                "client_hit_ratio": self.hits / self.lookups if self.lookups else 0.0,
+                "connection_reuse_ratio": 1 - total_connections / total_requests if total_requests else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+def _in_use_transport(httpx, transport, acquire, release, asynchronous):
+    """Wrap `transport` so each request counts as in use from sending until its response is closed
+    (for a stream, until the last chunk is read or the stream is abandoned)."""
+    if asynchronous:
+        class Stream(httpx.AsyncByteStream):
+            def __init__(self, stream):
+                self.stream = stream
+                self.open = True
+
+            async def __aiter__(self):
+                async for chunk in self.stream:
+                    yield chunk
+
+            async def aclose(self):
+                try:
+                    await self.stream.aclose()
+                finally:
+                    if self.open:
+                        self.open = False
+                        release()
+
+        class Transport(httpx.AsyncBaseTransport):
+            async def handle_async_request(self, request):
+                acquire()
+                try:
+                    response = await transport.handle_async_request(request)
+                except BaseException:
+                    release()
+                    raise
+                response.stream = Stream(response.stream)
+                return response
+
+            async def aclose(self):
+                await transport.aclose()
+    else:
+        class Stream(httpx.SyncByteStream):
+            def __init__(self, stream):
+                self.stream = stream
+                self.open = True
+
+            def __iter__(self):
+                yield from self.stream
+
+            def close(self):
+                try:
+                    self.stream.close()
+                finally:
+                    if self.open:
+                        self.open = False
+                        release()
+
+        class Transport(httpx.BaseTransport):
+            def handle_request(self, request):
+                acquire()
+                try:
+                    response = transport.handle_request(request)
+                except BaseException:
+                    release()
+                    raise
+                response.stream = Stream(response.stream)
+                return response
+
+            def close(self):
+                transport.close()
+    return Transport()
@@ -0,0 +1,101 @@
+"""Context budgeting: per-model context windows, cache-friendly history fitting and usage accounting.
+
+Providers discount and speed up a request whose leading tokens match an earlier request (prefix /
+KV caching), so everything here tries to keep the head of a conversation byte-identical from one call
+to the next: history is cut in whole blocks of messages rather than one message at a time, and the
+API's own usage numbers (prompt tokens, cached prompt tokens) are collected to show whether it works.
+"""
+import json
+import os
+import threading
+
+from .utils import estimate_tokens
+
+# Context windows (tokens) as served upstream; unknown models get DEFAULT_CONTEXT_TOKENS.
+# e.g. DIVINATION_MODEL_CONTEXT='{"zai-org/GLM-4.6": 200000}'
+MODEL_CONTEXT_TOKENS = {
+    "deepseek-ai/DeepSeek-R1": 64000,
+    "deepseek-ai/DeepSeek-V3": 64000,
+    "deepseek-ai/DeepSeek-V3.2": 128000,
+    "moonshotai/Kimi-K2-Thinking": 128000,
+    "zai-org/GLM-4.6": 128000,
+    "MiniMaxAI/MiniMax-M2": 128000,
+    **json.loads(os.getenv("DIVINATION_MODEL_CONTEXT", "{}")),
+}
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("DIVINATION_DEFAULT_CONTEXT", "32000"))
+HISTORY_BLOCK = 8  # messages dropped together, so the kept prefix only moves every few turns
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators per chat message
+
+
+def context_budget(model, reserve):
+    """Prompt tokens `model` can take while leaving `reserve` tokens for its answer."""
+    return MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS) - reserve
+
+
+def message_tokens(messages):
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def fit_history(messages, budget, block=HISTORY_BLOCK):
+    """Drop the oldest non-system messages until `messages` fits in `budget` tokens.
+
+    Leading system messages are always kept. The cut is rounded up to a multiple of `block` messages,
+    so as a conversation grows the first kept message stays the same for several turns and the
+    provider can keep serving the shared prefix from its cache. The newest message is never dropped.
+    """
+    head = 0
+    while head < len(messages) and messages[head]["role"] == "system":
+        head += 1
+    system, history = messages[:head], messages[head:]
+    available = budget - message_tokens(system)
+    sizes = [estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in history]
+    total, cut = sum(sizes), 0
+    while cut < len(history) - 1 and total > available:
+        total -= sizes[cut]
+        cut += 1
+    if cut:
+        cut = min(-(-cut // block) * block, len(history) - 1)
+    return system + history[cut:]
+
+
+def usage_numbers(usage):
+    """(prompt, cached prompt, completion) tokens from an API `usage` object or dict.
+
+    Cached tokens are read from OpenAI's `prompt_tokens_details.cached_tokens` or DeepSeek's
+    `prompt_cache_hit_tokens`, whichever the provider fills in.
+    """
+    if usage is None:
+        return None
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else dict(vars(usage))
+    details = usage.get("prompt_tokens_details") or {}
+    cached = details.get("cached_tokens") or usage.get("prompt_cache_hit_tokens") or 0
+    return {
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "cached_tokens": cached,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+    }
+
+
+class UsageMeter:
+    """Thread-safe per-model totals of prompt, cached and completion tokens, shared by every session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def record(self, model, numbers):
+        if not numbers:
+            return
+        with self._lock:
+            totals = self._models.setdefault(model, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+            totals["requests"] += 1
+            for key in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+                totals[key] += numbers[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                model: {**totals, "cached_ratio": totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0}
+                for model, totals in self._models.items()
+            }
@@ -0,0 +1,169 @@
+"""Asyncio fan-out engine for Roundtable panels."""
+import asyncio
+import threading
+
+from .clients import BASE_URL
+from .context import context_budget, fit_history, message_tokens, usage_numbers
+from .scheduler import MAX_RETRIES, backoff_delay, retry_after_seconds
+
+PANEL_OUTPUT_TOKENS = 2000  # expected completion size, used for tokens/min admission
+
+def new_stream_state():
+    # Shared between the engine loop (writer) and the script thread (reader); list appends are atomic.
+    return {"reasoning": [], "content": [], "error": None, "done": False, "cancelled": False, "hedged": False, "queued": False,
+            "usage": None, "sent_messages": 0}
+
+class RoundtableEngine:
+    """Asyncio fan-out for panel requests, running on one background event loop per process.
+
+    Every model streams into its own state dict (see `new_stream_state`). A model is abandoned after
+    `deadline` seconds, optionally hedged with a duplicate request if its first chunk has not arrived
+    after `hedge_after` seconds, and once `quorum` models have answered the rest are cancelled.
+    Each model gets `messages` cut to fit its own context window (see `context.fit_history`), and its
+    state's `usage` holds the API's token counts once the stream ends. With `telemetry`, every model
+    call is recorded under the "roundtable" kind.
+    """
+
+    def __init__(self, client_pool, scheduler, telemetry=None, base_url=BASE_URL):
+        self.client_pool = client_pool
+        self.scheduler = scheduler
+        self.telemetry = telemetry
+        self.base_url = base_url
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="roundtable-engine", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """Schedule `coro` on the engine loop; cancelling the returned future cancels the coroutine."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def submit_panel(self, api_key, session_id, models, messages, states, deadline=None, hedge_after=None, quorum=0):
+        return self.submit(self.run_panel(api_key, session_id, models, messages, states, deadline, hedge_after, quorum))
+
+    async def run_panel(self, api_key, session_id, models, messages, states, deadline=None, hedge_after=None, quorum=0):
+        aclient = self.client_pool.get_async(api_key, self.base_url)
+        tasks = {}
+        for model in models:
+            fitted = fit_history(messages, context_budget(model, PANEL_OUTPUT_TOKENS))
+            states[model]["sent_messages"] = len(fitted)
+            request = {"client": aclient, "session_id": session_id, "messages": fitted,
+                       "tokens": message_tokens(fitted) + PANEL_OUTPUT_TOKENS}
+            tasks[asyncio.ensure_future(self._run_model(request, model, states[model], deadline, hedge_after))] = model
+        pending = set(tasks)
+        answered = 0
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                answered += sum(1 for task in done if states[tasks[task]]["error"] is None)
+                if quorum and answered >= quorum:
+                    break
+        finally:
+            # Reached on quorum, and also when the caller cancels the whole round.
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _run_model(self, request, model, state, deadline, hedge_after):
+        timer = self.telemetry.start("roundtable", model, request["session_id"]) if self.telemetry is not None else None
+        error = None
+        try:
+            await asyncio.wait_for(self._stream_model(request, model, state, hedge_after, timer), timeout=deadline)
+        except asyncio.TimeoutError as e:
+            error = e
+            state["error"] = f"超时 (超过 {deadline:.0f} 秒未完成)"
+        except asyncio.CancelledError as e:
+            error = e
+            state["cancelled"] = True
+            state["error"] = "已取消"
+            raise
+        except Exception as e:
+            error = e
+            state["error"] = str(e)
+        finally:
+            state["done"] = True
+            if timer:
+                timer.finish(error, state["usage"])
+
+    async def _stream_model(self, request, model, state, hedge_after, timer=None):
+        stream, first, ticket = await self._open_stream(request, model, state, hedge_after, timer)
+        try:
+            self._apply_chunk(first, state, timer)
+            async for chunk in stream:
+                self._apply_chunk(chunk, state, timer)
+        finally:
+            usage = state["usage"]
+            ticket.release(usage["prompt_tokens"] + usage["completion_tokens"] if usage else None)
+            await stream.close()
+
+    async def _open_stream(self, request, model, state, hedge_after, timer=None):
+        """Return (stream, first_chunk, ticket) from whichever attempt produces a first chunk first."""
+        scheduler = self.scheduler
+
+        async def attempt():
+            # Each attempt holds its own scheduler slot; 429/5xx before the first chunk are retried.
+            for n in range(MAX_RETRIES + 1):
+                state["queued"] = True
+                ticket = await scheduler.acquire_async(model, request["session_id"], request["tokens"])
+                state["queued"] = False
+                stream = None
+                if timer:
+                    timer.sent()
+                try:
+                    stream = await request["client"].chat.completions.create(
+                        model=model, messages=request["messages"], stream=True, temperature=0.7,
+                        stream_options={"include_usage": True})
+                    return stream, await stream.__anext__(), ticket
+                except BaseException as e:
+                    ticket.release()
+                    if stream is not None:
+                        await stream.close()
+                    retry_after = retry_after_seconds(e) if isinstance(e, Exception) else None
+                    if retry_after is None or n == MAX_RETRIES:
+                        raise
+                    if getattr(e, "status_code", None) == 429:
+                        scheduler.report_throttle(model, retry_after)
+                await asyncio.sleep(backoff_delay(n, retry_after))
+
+        def close_loser(task):
+            if not task.cancelled() and task.exception() is None:
+                stream, _, ticket = task.result()
+                ticket.release()
+                asyncio.ensure_future(stream.close())
+
+        attempts = [asyncio.ensure_future(attempt())]
+        if hedge_after:
+            done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+            if not done:
+                state["hedged"] = True
+                attempts.append(asyncio.ensure_future(attempt()))
+        error = None
+        try:
+            while attempts:
+                done, _ = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    attempts.remove(task)
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                task.add_done_callback(close_loser)
+                task.cancel()
+
+    @staticmethod
+    def _apply_chunk(chunk, state, timer=None):
+        if getattr(chunk, "usage", None):
+            state["usage"] = usage_numbers(chunk.usage)
+        if not chunk.choices:
+            return
+        delta = chunk.choices[0].delta
+        if getattr(delta, 'reasoning_content', None):
+            state["reasoning"].append(delta.reasoning_content)
+            if timer:
+                timer.reasoning()
+        if getattr(delta, 'content', None):
+            state["content"].append(delta.content)
+            if timer:
+                timer.content()
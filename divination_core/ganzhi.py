@@ -0,0 +1,105 @@
+"""真太阳时 and 干支 information for a moment in time.
+
+`get_ganzhi_info` reads from the precomputed day index (see `ganzhi_index`) when one is loaded and
+falls back to lunar_python otherwise; neither numpy nor lunar_python is imported until needed.
+"""
+import datetime
+import importlib.util
+import os
+
+GAN = "甲乙丙丁戊己庚辛壬癸"
+ZHI = "子丑寅卯辰巳午未申酉戌亥"
+# From 冬至: even positions are 中气, odd positions are 节.
+JIEQI = ["冬至", "小寒", "大寒", "立春", "雨水", "惊蛰", "春分", "清明", "谷雨", "立夏", "小满", "芒种",
+         "夏至", "小暑", "大暑", "立秋", "处暑", "白露", "秋分", "寒露", "霜降", "立冬", "小雪", "大雪"]
+TZ_CN = datetime.timezone(datetime.timedelta(hours=8))
+
+CITY_COORDINATES = {
+    "北京": 116.40, "上海": 121.47, "广州": 113.26, "深圳": 114.05,
+    "武汉": 114.30, "成都": 104.06, "西安": 108.93, "沈阳": 123.43,
+    "重庆": 106.55, "天津": 117.20, "杭州": 120.15, "南京": 118.79,
+    "郑州": 113.62, "长沙": 112.93, "福州": 119.30, "昆明": 102.71,
+    "贵阳": 106.63, "兰州": 103.82, "南宁": 108.32, "哈尔滨": 126.63,
+    "长春": 125.32, "石家庄": 114.48, "太原": 112.53, "呼和浩特": 111.65,
+    "合肥": 117.28, "南昌": 115.89, "济南": 117.00, "海口": 110.35,
+    "拉萨": 91.11, "西宁": 101.74, "银川": 106.27, "乌鲁木齐": 87.62,
+    "台北": 121.50, "香港": 114.17, "澳门": 113.54,
+    "自定义/手动输入": 0.0
+}
+
+
+def sexagenary(ganzhi):
+    """'甲子' -> 0 ... '癸亥' -> 59."""
+    gan, zhi = GAN.index(ganzhi[0]), ZHI.index(ganzhi[1])
+    return (6 * gan - 5 * zhi) % 60
+
+
+def ganzhi_name(index):
+    return GAN[index % 10] + ZHI[index % 12]
+
+
+def pillars(ganzhi_info):
+    """(year, month, day, hour) pillars of a `get_ganzhi_info` result, e.g. ('甲辰', '丙寅', '戊午', '壬子')."""
+    return tuple(part[:2] for part in ganzhi_info["str"].split())
+
+
+def xunkong(gan, zhi):
+    """The two 旬空 branches of a pillar."""
+    head = (ZHI.index(zhi) - GAN.index(gan)) % 12
+    return ZHI[(head + 10) % 12] + ZHI[(head + 11) % 12]
+
+
+def lunar_available():
+    return importlib.util.find_spec("lunar_python") is not None
+
+
+def get_true_solar_time(dt, longitude):
+    """Apparent solar time at `longitude`: longitude offset plus the equation of time (see `solar_time`)."""
+    from .solar_time import true_solar_time
+    return true_solar_time(dt, longitude)
+
+
+def load_ganzhi_index(path=None):
+    """The memory-mapped day index, or None when numpy or the index file is missing (or stale)."""
+    try:
+        from .ganzhi_index import DEFAULT_PATH, GanZhiIndex
+    except ImportError:
+        return None
+    path = path or DEFAULT_PATH
+    if not os.path.exists(path):
+        return None
+    try:
+        return GanZhiIndex.load(path)
+    except ValueError:
+        return None
+
+
+def get_ganzhi_info(dt_solar, index=None):
+    if index is not None and index.covers(dt_solar):
+        return index.lookup(dt_solar)
+    if not lunar_available():
+        return {}
+    return ganzhi_info_from_lunar(dt_solar)
+
+
+def ganzhi_info_from_lunar(dt_solar):
+    """Reference implementation straight from lunar_python (the path the index replaces)."""
+    from lunar_python import Solar
+    solar = Solar.fromYmdHms(dt_solar.year, dt_solar.month, dt_solar.day, dt_solar.hour, dt_solar.minute, dt_solar.second)
+    lunar = solar.getLunar()
+    ganzhi_year = lunar.getYearInGanZhi()
+    ganzhi_month = lunar.getMonthInGanZhi()
+    ganzhi_day = lunar.getDayInGanZhi()
+    ganzhi_time = lunar.getTimeInGanZhi()
+    info = {
+        "str": f"{ganzhi_year}年 {ganzhi_month}月 {ganzhi_day}日 {ganzhi_time}时",
+        "lunar_str": f"农历{lunar.getMonthInChinese()}月{lunar.getDayInChinese()}",
+        "month_num": lunar.getMonth(),
+        "day_num": lunar.getDay(),
+        "hour_zhi": ganzhi_time[1],
+        "day_gan": ganzhi_day[0],
+        "day_zhi": ganzhi_day[1],
+        "solar_term": lunar.getPrevJieQi().getName() if lunar.getPrevJieQi() else "非节气日"
+    }
+    info['hour_idx'] = ZHI.index(info['hour_zhi'])
+    return info
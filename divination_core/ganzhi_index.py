@@ -0,0 +1,234 @@
+"""Precomputed 干支 calendar index.
+
+`get_ganzhi_info` used to build a lunar_python `Solar`/`Lunar` pair on every sidebar rerun (~2 ms each).
+This module stores everything that depends on the date in one packed record per day for 1900-01-31 ..
+2100-12-31, so a lookup is an array read plus a little arithmetic for the hour pillar:
+
+    year, month, day   sexagenary indices (0 = 甲子) as lunar_python reports them
+                       (year by lunar new year, month by the 节 of the day)
+    lunar_month        lunar month, negative for a leap month; lunar_day
+    jq_before          index into JIEQI of the previous 节气 at 00:00:00 of the day
+    jq_after           same at 23:59:59; differs from jq_before on the day a new 节气 starts ...
+    jq_sec             ... at this second of the day (-1 otherwise)
+
+The table is saved as a plain .npy file and opened with `mmap_mode="r"`, so every worker process on a
+host shares the same page-cache copy. Build it once with `python -m divination_core.ganzhi_index build`;
+`verify` compares it against lunar_python and `bench` times both paths.
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+
+import numpy as np
+
+from .ganzhi import GAN, JIEQI, ZHI, ganzhi_info_from_lunar, ganzhi_name, sexagenary
+
+LUNAR_MONTHS = "正二三四五六七八九十冬腊"
+LUNAR_DAYS = ["初一", "初二", "初三", "初四", "初五", "初六", "初七", "初八", "初九", "初十",
+              "十一", "十二", "十三", "十四", "十五", "十六", "十七", "十八", "十九", "二十",
+              "廿一", "廿二", "廿三", "廿四", "廿五", "廿六", "廿七", "廿八", "廿九", "三十"]
+
+FIRST_DAY = datetime.date(1900, 1, 31)  # lunar 1900 正月初一, the first day lunar_python supports
+LAST_DAY = datetime.date(2100, 12, 31)
+DTYPE = np.dtype([
+    ("year", "u1"), ("month", "u1"), ("day", "u1"), ("lunar_month", "i1"), ("lunar_day", "u1"),
+    ("jq_before", "u1"), ("jq_after", "u1"), ("jq_sec", "<i4"),
+])
+DEFAULT_PATH = os.getenv("DIVINATION_GANZHI_INDEX", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ganzhi_index.npy"))
+
+
+def hour_ganzhi_index(day_index, hour):
+    """Sexagenary index of the 时辰 at `hour` on a day whose pillar is `day_index`.
+
+    23:00-23:59 is already the next day's 子时, so its stem follows the next day's stem
+    (lunar_python's "exact" day), while the day pillar itself still changes at midnight.
+    """
+    zhi = (hour + 1) // 2 % 12
+    day_gan = (day_index + (hour >= 23)) % 10
+    gan = (day_gan % 5 * 2 + zhi) % 10
+    return (6 * gan - 5 * zhi) % 60
+
+
+def _build_days(first, last):
+    from lunar_python import Solar
+    days = (last - first).days + 1
+    table = np.zeros(days, dtype=DTYPE)
+    start = Solar.fromYmdHms(first.year, first.month, first.day, 0, 0, 0).getLunar().getPrevJieQi()
+    previous = JIEQI.index(start.getName())
+    for i in range(days):
+        date = first + datetime.timedelta(days=i)
+        lunar = Solar.fromYmdHms(date.year, date.month, date.day, 23, 59, 59).getLunar()
+        jieqi = lunar.getPrevJieQi()
+        after = JIEQI.index(jieqi.getName())
+        starts = jieqi.getSolar()
+        switch = -1
+        if after != previous and (starts.getYear(), starts.getMonth(), starts.getDay()) == (date.year, date.month, date.day):
+            switch = starts.getHour() * 3600 + starts.getMinute() * 60 + starts.getSecond()
+        table[i] = (
+            sexagenary(lunar.getYearInGanZhi()), sexagenary(lunar.getMonthInGanZhi()), sexagenary(lunar.getDayInGanZhi()),
+            lunar.getMonth(), lunar.getDay(), previous, after, switch,
+        )
+        previous = after
+    return table
+
+
+class GanZhiIndex:
+    """One record per day from `first_day` to `last_day` (see the module docstring for the fields).
+
+    The app's index spans FIRST_DAY .. LAST_DAY; a shorter range (for tests) is passed explicitly to
+    `build` and again to `load`, since the .npy file does not record it.
+    """
+
+    def __init__(self, table, first_day=FIRST_DAY, last_day=LAST_DAY):
+        if len(table) != (last_day - first_day).days + 1:
+            raise ValueError(f"index has {len(table)} days, expected {first_day} .. {last_day}; rebuild it")
+        self.table = table
+        self.first_day = first_day
+        self.last_day = last_day
+        self._first_day64 = np.datetime64(first_day, "D")
+
+    @classmethod
+    def build(cls, workers=None, first_day=FIRST_DAY, last_day=LAST_DAY):
+        """Walk every day once through lunar_python, split into per-year chunks across processes."""
+        import concurrent.futures
+        chunks = []
+        year_start = first_day
+        while year_start <= last_day:
+            year_end = min(datetime.date(year_start.year, 12, 31), last_day)
+            chunks.append((year_start, year_end))
+            year_start = year_end + datetime.timedelta(days=1)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_build_days, *zip(*chunks)))
+        return cls(np.concatenate(parts), first_day, last_day)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH, first_day=FIRST_DAY, last_day=LAST_DAY):
+        return cls(np.load(path, mmap_mode="r"), first_day, last_day)
+
+    def save(self, path=DEFAULT_PATH):
+        np.save(path, np.ascontiguousarray(self.table))
+
+    def covers(self, dt):
+        return self.first_day <= dt.date() <= self.last_day
+
+    def lookup(self, dt):
+        """Same dict as `ganzhi_info_from_lunar(dt)`, in O(1)."""
+        row = self.table[(dt.date() - self.first_day).days]
+        second = dt.hour * 3600 + dt.minute * 60 + dt.second
+        jieqi = row["jq_after"] if 0 <= row["jq_sec"] <= second else row["jq_before"]
+        day = int(row["day"])
+        hour = hour_ganzhi_index(day, dt.hour)
+        lunar_month, lunar_day = int(row["lunar_month"]), int(row["lunar_day"])
+        info = {
+            "str": f"{ganzhi_name(row['year'])}年 {ganzhi_name(row['month'])}月 {ganzhi_name(day)}日 {ganzhi_name(hour)}时",
+            "lunar_str": f"农历{'闰' if lunar_month < 0 else ''}{LUNAR_MONTHS[abs(lunar_month) - 1]}月{LUNAR_DAYS[lunar_day - 1]}",
+            "month_num": lunar_month,
+            "day_num": lunar_day,
+            "hour_zhi": ZHI[hour % 12],
+            "day_gan": GAN[day % 10],
+            "day_zhi": ZHI[day % 12],
+            "solar_term": JIEQI[jieqi],
+        }
+        info['hour_idx'] = hour % 12
+        return info
+
+    def lookup_batch(self, datetimes):
+        """Vectorized lookup of many datetimes; returns index arrays (decode with `ganzhi_name`, JIEQI)."""
+        stamps = np.asarray(datetimes, dtype="datetime64[s]")
+        days = stamps.astype("datetime64[D]")
+        offsets = (days - self._first_day64).astype(np.int64)
+        if offsets.size and (offsets.min() < 0 or offsets.max() >= len(self.table)):
+            raise ValueError(f"datetimes must fall within {self.first_day} .. {self.last_day}")
+        seconds = (stamps - days).astype(np.int64)
+        hours = seconds // 3600
+        rows = self.table[offsets]
+        day = rows["day"].astype(np.int64)
+        zhi = (hours + 1) // 2 % 12
+        gan = ((day + (hours >= 23)) % 10 % 5 * 2 + zhi) % 10
+        switched = (rows["jq_sec"] >= 0) & (seconds >= rows["jq_sec"])
+        return {
+            "year": rows["year"],
+            "month": rows["month"],
+            "day": rows["day"],
+            "hour": ((6 * gan - 5 * zhi) % 60).astype(np.uint8),
+            "lunar_month": rows["lunar_month"],
+            "lunar_day": rows["lunar_day"],
+            "jieqi": np.where(switched, rows["jq_after"], rows["jq_before"]),
+        }
+
+
+def _random_datetimes(n, index, seed=0):
+    rng = random.Random(seed)
+    span = (index.last_day - index.first_day).days
+    out = []
+    for _ in range(n):
+        day = index.first_day + datetime.timedelta(days=rng.randrange(span + 1))
+        # Bias towards the edges where the pillars change: 23:xx, 00:xx and odd hours.
+        hour = rng.choice([23, 0, rng.randrange(24), 2 * rng.randrange(12) + 1])
+        out.append(datetime.datetime(day.year, day.month, day.day, hour, rng.randrange(60), rng.randrange(60)))
+    return out
+
+
+def verify(index, samples=20000):
+    """Compare the index with lunar_python on random datetimes and on every 节气 switch second."""
+    cases = _random_datetimes(samples, index)
+    for i in np.nonzero(np.asarray(index.table["jq_sec"]) >= 0)[0][:500]:
+        day = index.first_day + datetime.timedelta(days=int(i))
+        sec = int(index.table["jq_sec"][i])
+        moment = datetime.datetime(day.year, day.month, day.day) + datetime.timedelta(seconds=sec)
+        cases += [moment - datetime.timedelta(seconds=1), moment]
+    mismatches = [(dt, index.lookup(dt), ganzhi_info_from_lunar(dt)) for dt in cases
+                  if index.covers(dt) and index.lookup(dt) != ganzhi_info_from_lunar(dt)]
+    batch = index.lookup_batch(cases)
+    for i, dt in enumerate(cases[:2000]):
+        single = index.lookup(dt)
+        if single["str"].split()[3][:2] != ganzhi_name(batch["hour"][i]) or single["solar_term"] != JIEQI[batch["jieqi"][i]]:
+            mismatches.append((dt, single, "lookup_batch"))
+    return len(cases), mismatches
+
+
+def bench(index, n=20000):
+    cases = _random_datetimes(n, index, seed=1)
+    lunar_n = min(n, 2000)
+    t = time.perf_counter()
+    for dt in cases[:lunar_n]:
+        ganzhi_info_from_lunar(dt)
+    lunar_us = (time.perf_counter() - t) / lunar_n * 1e6
+    t = time.perf_counter()
+    for dt in cases:
+        index.lookup(dt)
+    lookup_us = (time.perf_counter() - t) / n * 1e6
+    t = time.perf_counter()
+    index.lookup_batch(cases)
+    batch_us = (time.perf_counter() - t) / n * 1e6
+    return {"lunar_python_us": lunar_us, "lookup_us": lookup_us, "lookup_batch_us": batch_us}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, verify or benchmark the 干支 calendar index.")
+    parser.add_argument("command", choices=["build", "verify", "bench"])
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args()
+    if args.command == "build":
+        t = time.perf_counter()
+        index = GanZhiIndex.build(workers=args.workers)
+        index.save(args.path)
+        print(f"built {len(index.table)} days ({index.first_day} .. {index.last_day}) in {time.perf_counter() - t:.1f}s -> {args.path}")
+        return
+    index = GanZhiIndex.load(args.path)
+    if args.command == "verify":
+        checked, mismatches = verify(index, args.samples)
+        for dt, ours, theirs in mismatches[:10]:
+            print(f"MISMATCH {dt}: index={ours} lunar_python={theirs}")
+        print(f"checked {checked} datetimes, {len(mismatches)} mismatches")
+        raise SystemExit(1 if mismatches else 0)
+    for name, value in bench(index, args.samples).items():
+        print(f"{name:>16}: {value:8.2f} µs/lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""Background jobs for long model readings, decoupled from whoever is watching them.
+
+A reading runs on the `JobQueue`'s worker pool and streams into its `Job`'s append-only chunk lists;
+any number of viewers (a Streamlit rerun, a refreshed tab, another thread) can attach by job ID and
+render from where they are. Closing the viewer no longer abandons the generation, cancelling is an
+explicit `cancel()`, and finished jobs stay readable for `ttl` seconds. Throughput is set by the
+worker count rather than by how many browser tabs are connected.
+
+Jobs submitted together share a `group` (an ensemble of models and the consensus over them); a job
+submitted with `after=` waits for other jobs without holding a worker while it waits.
+"""
+import collections
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+import uuid
+
+log = logging.getLogger(__name__)
+
+
+class Job:
+    """One reading. Workers append to `reasoning`/`content`; readers take `len()` then slice."""
+
+    def __init__(self, session_id, key=None, group=None, **meta):
+        self.id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.key = key
+        self.group = group or self.id
+        self.meta = meta
+        self.status = "queued"  # queued -> running -> done | error | cancelled
+        self.reasoning = []
+        self.content = []
+        self.error = None
+        self.usage = None
+        self.ticket = None  # scheduler ticket while waiting for a slot
+        self.retry = None  # last retry attempt number, if any
+        self.created = time.time()
+        self.started = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._callbacks = []
+        self._callback_lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def text(self):
+        return "".join(self.reasoning), "".join(self.content)
+
+    def add_done_callback(self, fn):
+        """Call `fn(job)` once the job has finished (right away if it already has)."""
+        with self._callback_lock:
+            if not self.finished:
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+
+class JobQueue:
+    """Process-wide worker pool for `Job`s, with lookup by job ID or by session."""
+
+    def __init__(self, workers=8, ttl=1800.0):
+        self.workers = workers
+        self.ttl = ttl
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="divination-job")
+        self._jobs = collections.OrderedDict()  # job id -> Job, oldest first
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(int(os.getenv("DIVINATION_JOB_WORKERS", "8")), float(os.getenv("DIVINATION_JOB_TTL", "1800")))
+
+    def submit(self, session_id, target, key=None, on_finish=None, group=None, after=(), **meta):
+        """Run `target(job)` on a worker; `on_finish(job)` runs on the worker once it has ended.
+
+        While a job with the same `key` is still unfinished in the session, that job is returned
+        instead of starting a duplicate generation. With `after`, the job stays queued until every
+        job in it has finished.
+        """
+        with self._lock:
+            self._purge_locked(time.time())
+            existing = self._unfinished_locked(session_id, key)
+            if existing is not None:
+                return existing
+            job = self._add_locked(session_id, key, group, meta)
+        self._start(job, target, on_finish, after)
+        return job
+
+    def submit_all(self, session_id, members, group=None):
+        """Submit several jobs as one group, deduplicated all or nothing.
+
+        `members` are dicts of `submit` arguments (`target`, `key`, `on_finish` and meta). If every
+        key matches an unfinished job of the session and those jobs form one group, they are returned
+        as they are; otherwise every member starts fresh under `group`, so a group never mixes in jobs
+        that belong to another one.
+        """
+        with self._lock:
+            self._purge_locked(time.time())
+            existing = [self._unfinished_locked(session_id, member.get("key")) for member in members]
+            if existing and None not in existing and len({job.group for job in existing}) == 1:
+                return existing
+            group = group or uuid.uuid4().hex[:12]
+            started = []
+            for member in members:
+                meta = {k: v for k, v in member.items() if k not in ("target", "key", "on_finish")}
+                started.append((self._add_locked(session_id, member.get("key"), group, meta), member))
+        for job, member in started:
+            self._start(job, member["target"], member.get("on_finish"), ())
+        return [job for job, _ in started]
+
+    def _unfinished_locked(self, session_id, key):
+        if key is None:
+            return None
+        for job in self._jobs.values():
+            if job.session_id == session_id and job.key == key and not job.finished:
+                return job
+        return None
+
+    def _add_locked(self, session_id, key, group, meta):
+        job = Job(session_id, key, group, **meta)
+        self._jobs[job.id] = job
+        return job
+
+    def _start(self, job, target, on_finish, after):
+        pending = len(after)
+
+        def ready(_):
+            nonlocal pending
+            with job._callback_lock:
+                pending -= 1
+                if pending:
+                    return
+            self._executor.submit(self._run, job, target, on_finish)
+
+        if after:
+            for dependency in after:
+                dependency.add_done_callback(ready)
+        else:
+            self._executor.submit(self._run, job, target, on_finish)
+
+    def _run(self, job, target, on_finish):
+        try:
+            if not job.cancel_requested:
+                job.status = "running"
+                job.started = time.time()
+                target(job)
+            job.status = "cancelled" if job.cancel_requested else "done"
+        except concurrent.futures.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "cancelled" if job.cancel_requested else "error"
+        finally:
+            job.finished_at = time.time()
+            if on_finish is not None:
+                try:
+                    on_finish(job)
+                except Exception:
+                    log.exception("on_finish failed for job %s", job.id)
+            with job._callback_lock:
+                job._done.set()
+                callbacks, job._callbacks = job._callbacks, []
+            for fn in callbacks:
+                try:
+                    fn(job)
+                except Exception:
+                    log.exception("done callback failed for job %s", job.id)
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge_locked(time.time())
+            return self._jobs.get(job_id)
+
+    def latest(self, session_id):
+        """The session's most recent job still held, running or finished."""
+        with self._lock:
+            self._purge_locked(time.time())
+            for job in reversed(self._jobs.values()):
+                if job.session_id == session_id:
+                    return job
+        return None
+
+    def group(self, group_id):
+        """The jobs of a group still held, in submission order."""
+        with self._lock:
+            return [job for job in self._jobs.values() if job.group == group_id]
+
+    def cancel(self, job_id):
+        """Ask a job to stop; a queued job never starts and a running one stops at its next chunk."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel.set()
+        return True
+
+    def _purge_locked(self, now):
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and now - job.finished_at > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            self._purge_locked(time.time())
+            statuses = collections.Counter(job.status for job in self._jobs.values())
+        return {"workers": self.workers, "held": sum(statuses.values()), **statuses}
+
+
+def stream_job(job, client, scheduler, model, messages, tokens, telemetry=None, kind="yijing", heartbeat=None, **kwargs):
+    """Job target for a streamed completion: fills `job` chunk by chunk and honours cancellation,
+    both while queued for a scheduler slot and mid-stream (which also closes the upstream request).
+    `heartbeat()`, if given, is called while queued and on every chunk (e.g. `Lease.keep`).
+    Extra keyword arguments go to the completion request (e.g. `max_tokens`)."""
+    from .scheduler import stream_completion
+
+    def on_wait(ticket):
+        job.ticket = ticket
+        if heartbeat:
+            heartbeat()
+        if job.cancel_requested:
+            raise concurrent.futures.CancelledError()
+
+    def on_retry(attempt):
+        job.retry = attempt
+
+    def on_usage(numbers):
+        job.usage = numbers
+
+    stream = stream_completion(client, scheduler, model, messages, job.session_id, tokens, on_wait=on_wait,
+                               on_retry=on_retry, on_usage=on_usage, telemetry=telemetry, kind=kind, **kwargs)
+    try:
+        for part, text in stream:
+            (job.reasoning if part == "reasoning" else job.content).append(text)
+            if heartbeat:
+                heartbeat()
+            if job.cancel_requested:
+                break
+    finally:
+        stream.close()
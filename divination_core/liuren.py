@@ -0,0 +1,199 @@
+"""大六壬 课式: 月将, 天地盘, 四课, 三传 and 天将.
+
+Like `qimen_plate`, `liuren_plate` depends only on the day/hour pillars and the 节气, and is LRU-cached
+per 时辰. 三传 follow the 九宗门 in order: 伏吟, 返吟, 贼克 (元首/重审, 比用, 涉害), 八专, 遥克,
+别责, 昴星. 涉害 counts the 克 each candidate suffers on its way home (地支 and 寄宫 stems), then
+prefers 孟 over 仲 positions, then 干上 (阳日) or 支上 (阴日).
+"""
+import functools
+
+from .ganzhi import GAN, JIEQI, ZHI, xunkong
+from .najia import BRANCH_ELEMENT, ELEMENTS, relation
+
+STEM_ELEMENT = dict(zip(GAN, "木木火火土土金金水水"))
+GAN_JI = {"甲": "寅", "乙": "辰", "丙": "巳", "丁": "未", "戊": "巳", "己": "未", "庚": "申", "辛": "戌", "壬": "亥", "癸": "丑"}
+GAN_HE = dict(zip(GAN, "己庚辛壬癸甲乙丙丁戊"))
+YUEJIANG_NAMES = dict(zip(ZHI, ["神后", "大吉", "功曹", "太冲", "天罡", "太乙", "胜光", "小吉", "传送", "从魁", "河魁", "登明"]))
+GENERALS = ["贵人", "螣蛇", "朱雀", "六合", "勾陈", "青龙", "天空", "白虎", "太常", "玄武", "太阴", "天后"]
+# Day stem -> (昼贵, 夜贵): 甲戊庚牛羊，乙己鼠猴乡，丙丁猪鸡位，壬癸兔蛇藏，六辛逢马虎.
+GUIREN = {"甲": "丑未", "戊": "丑未", "庚": "丑未", "乙": "子申", "己": "子申",
+          "丙": "亥酉", "丁": "亥酉", "壬": "巳卯", "癸": "巳卯", "辛": "午寅"}
+XING = {"子": "卯", "卯": "子", "寅": "巳", "巳": "申", "申": "寅", "丑": "戌", "戌": "未", "未": "丑"}  # 辰午酉亥自刑
+SANHE_NEXT = {"申": "子", "子": "辰", "辰": "申", "寅": "午", "午": "戌", "戌": "寅",
+              "巳": "酉", "酉": "丑", "丑": "巳", "亥": "卯", "卯": "未", "未": "亥"}
+YIMA = {"申": "寅", "子": "寅", "辰": "寅", "寅": "申", "午": "申", "戌": "申",
+        "巳": "亥", "酉": "亥", "丑": "亥", "亥": "巳", "卯": "巳", "未": "巳"}
+
+
+def element(x):
+    return STEM_ELEMENT.get(x) or BRANCH_ELEMENT[x]
+
+
+def overcomes(a, b):
+    """True if `a` 克 `b` (stems or branches)."""
+    return (ELEMENTS.index(element(b)) - ELEMENTS.index(element(a))) % 5 == 2
+
+
+def is_yang(x):
+    return (GAN.index(x) if x in GAN else ZHI.index(x)) % 2 == 0
+
+
+def chong(branch):
+    return ZHI[(ZHI.index(branch) + 6) % 12]
+
+
+def yuejiang(solar_term):
+    """月将 changes at each 中气: 冬至后丑, 大寒后子, 雨水后亥 ... 小雪后寅."""
+    k = JIEQI.index(solar_term) // 2
+    return ZHI[(1 - k) % 12]
+
+
+def _unique(items):
+    return list(dict.fromkeys(items))
+
+
+def _shehai_depth(candidate, heaven):
+    """Number of 克 the 上神 `candidate` suffers walking from where it sits back to its own 地盘 position."""
+    position = next(e for e in ZHI if heaven[e] == candidate)
+    depth = 0
+    for step in range(12):
+        earth = ZHI[(ZHI.index(position) + step) % 12]
+        depth += overcomes(earth, candidate)
+        depth += sum(overcomes(stem, candidate) for stem, ji in GAN_JI.items() if ji == earth)
+        if earth == candidate:
+            break
+    return depth
+
+
+def _pick(candidates, day_gan, lessons, heaven):
+    """Choose the 初传 among several candidates: 比用, then 涉害. Returns (branch, rule)."""
+    if len(candidates) == 1:
+        return candidates[0], None
+    same = [c for c in candidates if is_yang(c) == is_yang(day_gan)]
+    if len(same) == 1:
+        return same[0], "比用"
+    pool = same or candidates
+    depths = {c: _shehai_depth(c, heaven) for c in pool}
+    deepest = max(depths.values())
+    pool = [c for c in pool if depths[c] == deepest]
+    if len(pool) > 1:
+        under = {c: next(e for e in ZHI if heaven[e] == c) for c in pool}
+        for group in ("寅申巳亥", "子午卯酉"):
+            ranked = [c for c in pool if under[c] in group]
+            if ranked:
+                pool = ranked
+                break
+    if len(pool) > 1:
+        preferred = lessons[0][0] if is_yang(day_gan) else lessons[2][0]
+        pool = [preferred] if preferred in pool else pool
+    return pool[0], "涉害"
+
+
+def _ke_candidates(lessons):
+    zei = _unique(up for up, down in lessons if overcomes(down, up))
+    if zei:
+        return zei, "重审"
+    ke = _unique(up for up, down in lessons if overcomes(up, down))
+    return ke, "元首"
+
+
+def _transmissions(day_gan, day_zhi, lessons, heaven, yuejiang_zhi, hour_zhi):
+    yang = is_yang(day_gan)
+    gan_up, zhi_up = lessons[0][0], lessons[2][0]
+    candidates, rule = _ke_candidates(lessons)
+
+    if yuejiang_zhi == hour_zhi:
+        first = _pick(candidates, day_gan, lessons, heaven)[0] if candidates else (gan_up if yang else zhi_up)
+        middle = XING.get(first) or (zhi_up if yang else gan_up)
+        if middle == first:
+            middle = chong(first)
+        # 子卯 刑 each other: rather than loop back to the 初传, 自刑 or repeats take the 冲 of the 中传.
+        last = XING.get(middle)
+        if last is None or last in (first, middle):
+            last = chong(middle)
+        return [first, middle, last], "伏吟"
+    if heaven[ZHI[0]] == chong(ZHI[0]):
+        if candidates:
+            first = _pick(candidates, day_gan, lessons, heaven)[0]
+            return [first, heaven[first], heaven[heaven[first]]], "返吟"
+        return [YIMA[day_zhi], zhi_up, gan_up], "返吟（无依）"
+    if candidates:
+        first, how = _pick(candidates, day_gan, lessons, heaven)
+        return [first, heaven[first], heaven[heaven[first]]], how or rule
+    if GAN_JI[day_gan] == day_zhi:
+        if yang:
+            first = ZHI[(ZHI.index(gan_up) + 2) % 12]
+        else:
+            first = ZHI[(ZHI.index(lessons[3][0]) - 2) % 12]
+        return [first, gan_up, gan_up], "八专"
+    ups = _unique(up for up, _ in lessons)
+    remote = [u for u in ups if overcomes(u, day_gan)] or [u for u in ups if overcomes(day_gan, u)]
+    if remote:
+        return [_pick(remote, day_gan, lessons, heaven)[0], None, None], "遥克"
+    if len(_unique(lessons)) < 4:
+        first = heaven[GAN_JI[GAN_HE[day_gan]]] if yang else SANHE_NEXT[day_zhi]
+        return [first, gan_up, gan_up], "别责"
+    if yang:
+        return [heaven["酉"], zhi_up, gan_up], "昴星"
+    return [next(e for e in ZHI if heaven[e] == "酉"), gan_up, zhi_up], "昴星"
+
+
+@functools.lru_cache(maxsize=1024)
+def liuren_plate(day_pillar, hour_pillar, solar_term):
+    """The 大六壬 课式 for a day/hour pillar under `solar_term`. Do not mutate it."""
+    day_gan, day_zhi = day_pillar
+    hour_zhi = hour_pillar[1]
+    jiang = yuejiang(solar_term)
+    offset = ZHI.index(jiang) - ZHI.index(hour_zhi)
+    heaven = {e: ZHI[(ZHI.index(e) + offset) % 12] for e in ZHI}  # 地盘 branch -> 天盘 branch over it
+
+    first_up = heaven[GAN_JI[day_gan]]
+    third_up = heaven[day_zhi]
+    lessons = [(first_up, day_gan), (heaven[first_up], first_up), (third_up, day_zhi), (heaven[third_up], third_up)]
+    chuan, rule = _transmissions(day_gan, day_zhi, lessons, heaven, jiang, hour_zhi)
+    if chuan[1] is None:
+        chuan = [chuan[0], heaven[chuan[0]], heaven[heaven[chuan[0]]]]
+
+    # 天将: 贵人 by day stem (昼 for 卯..申 hours), then 顺 if it sits over 亥..辰 on the 地盘, else 逆.
+    gui = GUIREN[day_gan][0 if 3 <= ZHI.index(hour_zhi) <= 8 else 1]
+    gui_over = next(e for e in ZHI if heaven[e] == gui)
+    direction = 1 if gui_over in "亥子丑寅卯辰" else -1
+    generals = {ZHI[(ZHI.index(gui) + k * direction) % 12]: name for k, name in enumerate(GENERALS)}
+
+    day_element = STEM_ELEMENT[day_gan]
+    head = (ZHI.index(day_zhi) - GAN.index(day_gan)) % 12
+
+    def describe(branch):
+        stem_offset = (ZHI.index(branch) - head) % 12
+        return {
+            "branch": branch,
+            "general": generals[branch],
+            "liuqin": relation(day_element, BRANCH_ELEMENT[branch]),
+            "dun": GAN[stem_offset] if stem_offset < 10 else "",  # 旬遁干; empty when the branch is 旬空
+        }
+
+    return {
+        "yuejiang": jiang,
+        "yuejiang_name": YUEJIANG_NAMES[jiang],
+        "guiren": gui,
+        "heaven": heaven,
+        "generals": generals,
+        "lessons": [{"up": up, "down": down, "general": generals[up]} for up, down in lessons],
+        "rule": rule,
+        "transmissions": [describe(b) for b in chuan],
+        "xunkong": xunkong(day_gan, day_zhi),
+    }
+
+
+def format_liuren(plate, day_pillar, hour_pillar):
+    heaven = plate["heaven"]
+    rows = [
+        f"大六壬：{day_pillar}日 {hour_pillar}时，月将{plate['yuejiang']}（{plate['yuejiang_name']}）加{hour_pillar[1]}时，"
+        f"贵人{plate['guiren']}，旬空{plate['xunkong']}",
+        "天地盘（地盘→天盘·天将）：" + "　".join(f"{e}→{heaven[e]}{plate['generals'][heaven[e]]}" for e in ZHI),
+        "四课（第一至第四课，上/下）：" + "　".join(f"{l['up']}{l['general']}/{l['down']}" for l in plate["lessons"]),
+        f"三传（{plate['rule']}）：" + "　".join(
+            f"{name}{t['dun']}{t['branch']}{t['general']}·{t['liuqin']}" for name, t in zip("初中末", plate["transmissions"])
+        ),
+    ]
+    return "\n".join(rows)
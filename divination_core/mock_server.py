@@ -0,0 +1,229 @@
+"""A local stand-in for the OpenAI-compatible chat-completions API, for benchmarks and offline runs.
+
+`python -m divination_core.mock_server --port 8765 --ttft 0.8 --tps 40 --rate-429 0.05` serves
+POST /v1/chat/completions (streaming and not) and GET /v1/models. Streams send `reasoning_content`
+deltas before `content` deltas the way DeepSeek-R1 does, one token per chunk, and a final usage chunk
+when `stream_options.include_usage` is set. Prompt caching is simulated per model: prompt tokens of
+the longest message prefix seen before are reported as `prompt_tokens_details.cached_tokens`.
+
+Faults are injected before the first byte: `error_rate` answers 500, `rate_429` answers 429 with a
+Retry-After header. Point the app at it with SILICONFLOW_BASE_URL=http://127.0.0.1:8765/v1.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .utils import estimate_tokens
+
+
+class MockConfig:
+    """Latency, throughput and fault settings; `models` overrides any of them per model name."""
+
+    FIELDS = ("ttft", "tps", "reasoning_tokens", "content_tokens", "jitter", "error_rate", "rate_429", "retry_after")
+
+    def __init__(self, ttft=0.5, tps=50.0, reasoning_tokens=200, content_tokens=300, jitter=0.1,
+                 error_rate=0.0, rate_429=0.0, retry_after=1.0, models=None, seed=None):
+        self.ttft = ttft
+        self.tps = tps
+        self.reasoning_tokens = reasoning_tokens
+        self.content_tokens = content_tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.models = models or {}
+        self.rng = random.Random(seed)
+
+    def for_model(self, model):
+        overrides = self.models.get(model, {})
+        return {field: overrides.get(field, getattr(self, field)) for field in self.FIELDS}
+
+    def as_dict(self):
+        return {**{field: getattr(self, field) for field in self.FIELDS}, "models": self.models}
+
+
+class MockServer:
+    """Threaded HTTP server plus its counters; `start()` runs it on a daemon thread."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockConfig()
+        self.counters = {"requests": 0, "streams": 0, "errors_500": 0, "errors_429": 0}
+        self._lock = threading.Lock()
+        self._prefixes = {}  # model -> set of message-prefix digests seen
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def prompt_usage(self, model, messages):
+        """(prompt tokens, cached tokens): the cached part is the longest previously seen message prefix."""
+        digest = hashlib.sha256()
+        total = cached = 0
+        seen_prefix = True
+        with self._lock:
+            seen = self._prefixes.setdefault(model, set())
+            for message in messages:
+                digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+                total += estimate_tokens(str(message.get("content", ""))) + 4
+                key = digest.copy().hexdigest()
+                if seen_prefix and key in seen:
+                    cached = total
+                else:
+                    seen_prefix = False
+                    seen.add(key)
+        return total, cached
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    models = sorted(server.config.models) or ["mock-model"]
+                    self._json(200, {"object": "list", "data": [{"id": m, "object": "model"} for m in models]})
+                else:
+                    self._json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._json(404, {"error": {"message": "not found"}})
+                    return
+                server.count("requests")
+                model = body.get("model", "mock-model")
+                cfg = server.config.for_model(model)
+                rng = server.config.rng
+                roll = rng.random()
+                if roll < cfg["rate_429"]:
+                    server.count("errors_429")
+                    self._json(429, {"error": {"message": "rate limited (mock)", "type": "rate_limit"}},
+                               {"Retry-After": f"{cfg['retry_after']:g}"})
+                    return
+                if roll < cfg["rate_429"] + cfg["error_rate"]:
+                    server.count("errors_500")
+                    self._json(500, {"error": {"message": "injected failure (mock)", "type": "server_error"}})
+                    return
+                prompt_tokens, cached = server.prompt_usage(model, body.get("messages", []))
+                reasoning = cfg["reasoning_tokens"]
+                content = min(cfg["content_tokens"], body.get("max_tokens") or cfg["content_tokens"])
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": reasoning + content,
+                         "total_tokens": prompt_tokens + reasoning + content,
+                         "prompt_tokens_details": {"cached_tokens": cached}}
+                ttft = max(0.0, cfg["ttft"] * (1 + rng.uniform(-cfg["jitter"], cfg["jitter"])))
+                time.sleep(ttft)
+                if body.get("stream"):
+                    server.count("streams")
+                    self._stream(model, reasoning, content, cfg["tps"],
+                                 usage if (body.get("stream_options") or {}).get("include_usage") else None)
+                else:
+                    time.sleep((reasoning + content) / cfg["tps"] if cfg["tps"] else 0)
+                    self._json(200, {
+                        "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                            "role": "assistant", "reasoning_content": "想" * reasoning, "content": "答" * content}}],
+                        "usage": usage,
+                    })
+
+            def _json(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model, reasoning, content, tps, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                created = int(time.time())
+
+                def send(payload):
+                    data = f"data: {payload}\n\n".encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+                def chunk(delta, finish=None):
+                    send(json.dumps({"id": "mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}, ensure_ascii=False))
+
+                interval = 1.0 / tps if tps else 0.0
+                started = time.perf_counter()
+                try:
+                    for i in range(reasoning + content):
+                        chunk({"reasoning_content": "想"} if i < reasoning else {"content": "答"})
+                        # Pace against the start time so sleep overshoot does not accumulate.
+                        delay = started + (i + 1) * interval - time.perf_counter()
+                        if delay > 0:
+                            self.wfile.flush()
+                            time.sleep(delay)
+                    chunk({}, "stop")
+                    if usage:
+                        send(json.dumps({"id": "mock", "object": "chat.completion.chunk", "created": created,
+                                         "model": model, "choices": [], "usage": usage}))
+                    send("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client cancelled (quorum, hedging, deadline)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI-compatible chat-completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.5, help="seconds before the first chunk")
+    parser.add_argument("--tps", type=float, default=50.0, help="streamed tokens per second (0 = unthrottled)")
+    parser.add_argument("--reasoning-tokens", type=int, default=200)
+    parser.add_argument("--content-tokens", type=int, default=300)
+    parser.add_argument("--jitter", type=float, default=0.1, help="relative +/- jitter on TTFT")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--models", default="{}", help='per-model overrides as JSON, e.g. {"deepseek-ai/DeepSeek-R1": {"ttft": 2}}')
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    config = MockConfig(args.ttft, args.tps, args.reasoning_tokens, args.content_tokens, args.jitter,
+                        args.error_rate, args.rate_429, args.retry_after, json.loads(args.models), args.seed)
+    server = MockServer(config, args.host, args.port)
+    print(f"mock chat-completions API at {server.base_url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Table-driven 六爻纳甲 charts.
+
+A hexagram is a 6-bit index (bit 0 = 初爻, 1 = yang), and a cast's line values (0 少阴, 1 少阳, 2 老阴,
+3 老阳) already carry it: bit 0 of a value is yin/yang and bit 1 says whether the line moves. Everything
+that depends only on the hexagram (palace, 世/应, 纳甲 stems and branches, 六亲) is computed once for
+all 64 at import; a chart is then a few table reads plus the day-dependent 六神 and 旬空.
+`python -m divination_core.najia check` cross-checks the generated palaces against the traditional
+八宫 names.
+"""
+import argparse
+
+from .ganzhi import GAN, ZHI, xunkong
+
+# Trigrams as 3-bit numbers, bottom line = bit 0.
+TRIGRAM_NAMES = {7: "乾", 3: "兑", 5: "离", 1: "震", 6: "巽", 2: "坎", 4: "艮", 0: "坤"}
+TRIGRAM_NATURE = {7: "天", 3: "泽", 5: "火", 1: "雷", 6: "风", 2: "水", 4: "山", 0: "地"}
+TRIGRAM_ELEMENT = {7: "金", 3: "金", 5: "火", 1: "木", 6: "木", 2: "水", 4: "土", 0: "土"}
+
+# 纳甲: trigram -> (stem, inner branches bottom-up, outer branches bottom-up).
+NAJIA = {
+    7: ("甲", "子寅辰", "壬", "午申戌"),
+    0: ("乙", "未巳卯", "癸", "丑亥酉"),
+    1: ("庚", "子寅辰", "庚", "午申戌"),
+    6: ("辛", "丑亥酉", "辛", "未巳卯"),
+    2: ("戊", "寅辰午", "戊", "申戌子"),
+    5: ("己", "卯丑亥", "己", "酉未巳"),
+    4: ("丙", "辰午申", "丙", "戌子寅"),
+    3: ("丁", "巳卯丑", "丁", "亥酉未"),
+}
+BRANCH_ELEMENT = dict(zip(ZHI, "水土木木土火火土金金土水"))
+ELEMENTS = "木火土金水"  # each generates the next
+LIUSHEN = ["青龙", "朱雀", "勾陈", "螣蛇", "白虎", "玄武"]
+LIUSHEN_START = dict(zip(GAN, [0, 0, 1, 1, 2, 3, 4, 4, 5, 5]))  # 甲乙青龙 丙丁朱雀 戊勾陈 己螣蛇 庚辛白虎 壬癸玄武
+
+# Palace generations: which line flips produce the next member, and where 世 sits.
+GENERATIONS = ["本宫", "一世", "二世", "三世", "四世", "五世", "游魂", "归魂"]
+SHI_LINE = [6, 1, 2, 3, 4, 5, 4, 3]
+PALACE_ORDER = [7, 2, 4, 1, 6, 5, 0, 3]  # 乾坎艮震巽离坤兑
+
+
+def relation(palace_element, element):
+    """六亲 of `element` seen from a palace of `palace_element`."""
+    diff = (ELEMENTS.index(element) - ELEMENTS.index(palace_element)) % 5
+    return ["兄弟", "子孙", "妻财", "官鬼", "父母"][diff]
+
+
+def hexagram_name(index):
+    upper, lower = index >> 3, index & 7
+    if upper == lower:
+        return f"{TRIGRAM_NAMES[upper]}为{TRIGRAM_NATURE[upper]}"
+    return f"{TRIGRAM_NATURE[upper]}{TRIGRAM_NATURE[lower]}{HEXAGRAM_TITLES[index]}"
+
+
+def _build_tables():
+    palace, generation = [None] * 64, [None] * 64
+    for trigram in PALACE_ORDER:
+        index = trigram << 3 | trigram
+        members = [index]
+        for line in range(5):
+            index ^= 1 << line
+            members.append(index)
+        index ^= 1 << 3  # 游魂: the fourth line flips back
+        members.append(index)
+        index = (index & 0b111000) | trigram  # 归魂: the inner trigram returns to the palace trigram
+        members.append(index)
+        for gen, member in enumerate(members):
+            palace[member], generation[member] = trigram, gen
+    stems, branches, liuqin = [], [], []
+    for index in range(64):
+        lower, upper = index & 7, index >> 3
+        inner_stem, inner, _, _ = NAJIA[lower]
+        _, _, outer_stem, outer = NAJIA[upper]
+        stems.append([inner_stem] * 3 + [outer_stem] * 3)
+        branches.append(list(inner) + list(outer))
+        liuqin.append([relation(TRIGRAM_ELEMENT[palace[index]], BRANCH_ELEMENT[b]) for b in branches[-1]])
+    return palace, generation, stems, branches, liuqin
+
+
+# Traditional 八宫 order; the full name prefixes the two natures (e.g. 天风 + 姤).
+_TITLES = {
+    "乾": ["乾", "姤", "遁", "否", "观", "剥", "晋", "大有"],
+    "坎": ["坎", "节", "屯", "既济", "革", "丰", "明夷", "师"],
+    "艮": ["艮", "贲", "大畜", "损", "睽", "履", "中孚", "渐"],
+    "震": ["震", "豫", "解", "恒", "升", "井", "大过", "随"],
+    "巽": ["巽", "小畜", "家人", "益", "无妄", "噬嗑", "颐", "蛊"],
+    "离": ["离", "旅", "鼎", "未济", "蒙", "涣", "讼", "同人"],
+    "坤": ["坤", "复", "临", "泰", "大壮", "夬", "需", "比"],
+    "兑": ["兑", "困", "萃", "咸", "蹇", "谦", "小过", "归妹"],
+}
+
+PALACE, GENERATION, STEMS, BRANCHES, LIUQIN = _build_tables()
+HEXAGRAM_TITLES = [_TITLES[TRIGRAM_NAMES[PALACE[i]]][GENERATION[i]] for i in range(64)]
+SHI = [SHI_LINE[g] for g in GENERATION]
+YING = [(s + 2) % 6 + 1 for s in SHI]
+
+
+def hexagram_index(raw):
+    """6-bit index of the primary hexagram and the mask of moving lines for a cast's line values."""
+    index = moving = 0
+    for line, value in enumerate(raw):
+        index |= (value & 1) << line
+        moving |= (value >> 1) << line
+    return index, moving
+
+
+def najia_chart(raw, day_gan, day_zhi):
+    """The full chart for a 六爻 cast on a day with pillar `day_gan``day_zhi`."""
+    index, moving = hexagram_index(raw)
+    changed = index ^ moving
+    palace = PALACE[index]
+    palace_element = TRIGRAM_ELEMENT[palace]
+    empty = xunkong(day_gan, day_zhi)
+    start = LIUSHEN_START[day_gan]
+    lines = []
+    for line in range(6):
+        branch = BRANCHES[index][line]
+        entry = {
+            "position": line + 1,
+            "yang": bool(index >> line & 1),
+            "moving": bool(moving >> line & 1),
+            "liushen": LIUSHEN[(start + line) % 6],
+            "liuqin": LIUQIN[index][line],
+            "stem": STEMS[index][line],
+            "branch": branch,
+            "element": BRANCH_ELEMENT[branch],
+            "mark": "世" if SHI[index] == line + 1 else "应" if YING[index] == line + 1 else "",
+            "empty": branch in empty,
+        }
+        if entry["moving"]:
+            changed_branch = BRANCHES[changed][line]
+            # 变爻 keep the 六亲 of the primary hexagram's palace.
+            entry["changed"] = {
+                "yang": bool(changed >> line & 1),
+                "stem": STEMS[changed][line],
+                "branch": changed_branch,
+                "element": BRANCH_ELEMENT[changed_branch],
+                "liuqin": relation(palace_element, BRANCH_ELEMENT[changed_branch]),
+            }
+        lines.append(entry)
+    # 伏神: relations missing from the hexagram are taken from the palace's pure hexagram.
+    pure = palace << 3 | palace
+    present = set(LIUQIN[index])
+    fushen = [
+        {"position": line + 1, "liuqin": LIUQIN[pure][line], "stem": STEMS[pure][line], "branch": BRANCHES[pure][line],
+         "element": BRANCH_ELEMENT[BRANCHES[pure][line]]}
+        for line in range(6) if LIUQIN[pure][line] not in present
+    ]
+    return {
+        "index": index,
+        "name": hexagram_name(index),
+        "palace": TRIGRAM_NAMES[palace],
+        "palace_element": palace_element,
+        "generation": GENERATIONS[GENERATION[index]],
+        "shi": SHI[index],
+        "ying": YING[index],
+        "xunkong": empty,
+        "lines": lines,
+        "fushen": fushen,
+        "changed": None if not moving else {
+            "index": changed,
+            "name": hexagram_name(changed),
+            "palace": TRIGRAM_NAMES[PALACE[changed]],
+            "generation": GENERATIONS[GENERATION[changed]],
+        },
+    }
+
+
+def format_chart(chart):
+    """Plain-text chart, top line first, as it goes into the prompt."""
+    head = f"本卦：{chart['name']}（{chart['palace']}宫·{chart['generation']}，五行属{chart['palace_element']}）"
+    if chart["changed"]:
+        changed = chart["changed"]
+        head += f"　变卦：{changed['name']}（{changed['palace']}宫·{changed['generation']}）"
+    rows = [head, f"世爻：第{chart['shi']}爻　应爻：第{chart['ying']}爻　旬空：{chart['xunkong']}"]
+    for line in reversed(chart["lines"]):
+        symbol = ("▅▅▅▅▅" if line["yang"] else "▅▅　▅▅") + (" ○" if line["moving"] and line["yang"] else " ×" if line["moving"] else "　")
+        row = f"{line['liushen']}　{line['liuqin']}{line['stem']}{line['branch']}{line['element']}　{symbol}　{line['mark'] or '　'}"
+        if line["empty"]:
+            row += "（空）"
+        if line["moving"]:
+            c = line["changed"]
+            row += f"　→ {c['liuqin']}{c['stem']}{c['branch']}{c['element']}"
+        rows.append(row)
+    for f in chart["fushen"]:
+        rows.append(f"伏神：{f['liuqin']}{f['stem']}{f['branch']}{f['element']} 伏于第{f['position']}爻下")
+    return "\n".join(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print or check 六爻纳甲 charts.")
+    parser.add_argument("command", choices=["check", "chart"])
+    parser.add_argument("--lines", default="111111", help="line values bottom-up for `chart` (0 少阴 1 少阳 2 老阴 3 老阳)")
+    parser.add_argument("--day", default="甲子", help="day pillar for `chart`")
+    args = parser.parse_args()
+    if args.command == "chart":
+        print(format_chart(najia_chart([int(c) for c in args.lines], args.day[0], args.day[1])))
+        return
+    # The line-flip generation must reach all 64 hexagrams exactly once, and known members must land
+    # on the traditional 八宫 names.
+    errors = []
+    if None in PALACE or len(set(HEXAGRAM_TITLES)) != 64:
+        errors.append("palace generation does not cover all 64 hexagrams exactly once")
+    expected = {
+        "天风姤": 0b111110, "地火明夷": 0b000101, "风泽中孚": 0b110011, "泽雷随": 0b011001,
+        "山风蛊": 0b100110, "天火同人": 0b111101, "水地比": 0b010000, "雷泽归妹": 0b001011,
+    }
+    for name, index in expected.items():
+        if hexagram_name(index) != name:
+            errors.append(f"{index:06b}: {hexagram_name(index)} != {name}")
+    if najia_chart([1, 0, 0, 0, 0, 0], "甲", "子")["lines"][0]["branch"] != "子":
+        errors.append("震 inner 纳甲 should start at 子")
+    for error in errors:
+        print("FAIL", error)
+    print(f"checked 64 hexagrams, {len(errors)} problems")
+    raise SystemExit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
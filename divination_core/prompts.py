@@ -0,0 +1,106 @@
+"""System and user prompts for each divination method."""
+import functools
+
+from .ganzhi import pillars
+from .liuren import format_liuren, liuren_plate
+from .najia import format_chart, najia_chart
+from .qimen import format_qimen, qimen_plate
+
+
+# The system prompt is assembled from most to least stable, so requests share the longest possible
+# prefix for the provider's prompt cache: the static preamble (identical for every request), then the
+# method's instructions, then the session's 命主信息, and last the 时空 data that changes every 时辰.
+STATIC_PREFIX = """你是一位精通中国传统术数的大师。请基于下文给出的严谨时空与命主信息进行推演。
+【核心原则】
+1. **拒绝模棱两可**：请根据五行旺衰给出倾向性判断。
+2. **专业术语**：必须分析月令（旺相休囚死）、日辰（生克冲合）、空亡、神煞。
+3. **结合真太阳时**：排盘依据的是当地真实的太阳位置，而非标准北京时间。
+"""
+METHOD_INSTRUCTIONS = {
+    "六爻": "【六爻特化指令】1. 装卦：用户消息若已附纳甲排盘，直接采用其世应、六亲、六神、旬空与变卦，不要重新推导；否则自动装卦，确定世爻、应爻、六亲。2. 取用神：根据问题选取用神。3. 分析动爻。",
+    "梅花": "【梅花易数特化指令】1. 区分体用。2. 分析五行生克。3. 结合当下时间。",
+    "奇门": "【奇门遁甲特化指令】1. 排盘：用户消息若已附时家奇门盘，直接采用其局数、值符值使与九宫星门神，不要重新排盘；否则脑中排盘（时家奇门）。2. 找用神。3. 分析宫位。4. 决策建议。",
+    "大六壬": "【大六壬特化指令】1. 确定月将。2. 排盘（天地盘、四课、三传）：用户消息若已附课式，直接采用，不要重新推导。3. 断课。",
+    "太乙": "【太乙神数特化指令】1. 计算积年与太乙局。2. 推演主客。3. 定格局。4. 断大势。",
+    "小六壬": "【小六壬特化指令】1. 结合年月日时推导三宫。2. 解释落宫深意。",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def method_segment(method):
+    """Static preamble plus the method's instructions: shared by every session using `method`."""
+    instructions = METHOD_INSTRUCTIONS.get(method)
+    return STATIC_PREFIX + (instructions + "\n" if instructions else "")
+
+
+@functools.lru_cache(maxsize=4096)
+def profile_segment(gender, birth_year, bazi_year, bazi_month, bazi_day, bazi_hour, longitude):
+    gender_str = gender if gender != "未提供" else "未知"
+    bazi_desc = "未提供"
+    if bazi_year or bazi_day:
+        bazi_desc = f"年柱({bazi_year}) 月柱({bazi_month}) 日柱({bazi_day}) 时柱({bazi_hour})"
+    elif birth_year:
+        bazi_desc = f"出生年份: {birth_year}"
+    return f"【命主信息】\n- 性别：{gender_str}\n- 命理八字/年命：{bazi_desc}\n- 所在经度：{longitude}\n"
+
+
+@functools.lru_cache(maxsize=1024)
+def moment_segment(ganzhi_str, lunar_str, solar_term):
+    return f"【时空能量】\n- 真太阳时干支：{ganzhi_str}\n- 农历：{lunar_str}\n- 节气：{solar_term}\n"
+
+
+def system_prompt_segments(method, user_profile, ganzhi_info):
+    """(method, session, turn) segments of the system prompt, each memoized on its own inputs."""
+    profile = tuple(user_profile[k] for k in ("gender", "birth_year", "bazi_year", "bazi_month", "bazi_day", "bazi_hour", "longitude"))
+    return (
+        method_segment(method),
+        profile_segment(*profile),
+        moment_segment(ganzhi_info.get('str', '未知'), ganzhi_info.get('lunar_str', '未知'), ganzhi_info.get('solar_term', '未知')),
+    )
+
+
+def generate_system_prompt(method, user_profile, ganzhi_info):
+    return "".join(system_prompt_segments(method, user_profile, ganzhi_info))
+
+
+def local_chart(method, ganzhi_info, cast=None):
+    """The locally computed chart text for `method` (六爻 纳甲, 奇门 plate, 六壬 课式), or None."""
+    if not ganzhi_info.get('day_gan'):
+        return None
+    _, _, day, hour = pillars(ganzhi_info)
+    if method == "六爻":
+        return format_chart(najia_chart(cast['raw'], ganzhi_info['day_gan'], ganzhi_info['day_zhi']))
+    if method == "奇门":
+        return format_qimen(qimen_plate(day, hour, ganzhi_info['solar_term']), day, hour)
+    if method == "大六壬":
+        return format_liuren(liuren_plate(day, hour, ganzhi_info['solar_term']), day, hour)
+    return None
+
+
+def build_user_prompt(method, question, ganzhi_info, cast=None, charts=True):
+    """The user message the app sends for `method`; `cast` is the matching `DivinationEngine` result.
+
+    For 六爻, 奇门 and 大六壬 the chart is computed locally and sent along (unless `charts=False`), so the
+    model interprets a finished plate instead of spending reasoning tokens laying it out.
+    """
+    chart = local_chart(method, ganzhi_info, cast) if charts else None
+    if method == "六爻":
+        prompt = f"用户问题：{question}\n卦象数据：{[line['name'] for line in cast['display']]}\n"
+        if chart:
+            return prompt + f"纳甲排盘（京房八宫纳甲，日辰{ganzhi_info['day_gan']}{ganzhi_info['day_zhi']}）：\n{chart}\n请依据以上排盘取用神、断卦。"
+        return prompt + "请排盘并断卦。"
+    elif method == "梅花":
+        return f"用户问题：{question}\n上卦：{cast['upper']}\n下卦：{cast['lower']}\n动爻：{cast['moving']}\n请断吉凶。"
+    elif method == "奇门":
+        if chart:
+            return f"用户问题：{question}\n当前真太阳时干支：{ganzhi_info['str']}\n{chart}\n请依据以上盘局找用神、分析宫位并给出决策建议。"
+        return f"用户问题：{question}\n当前真太阳时干支：{ganzhi_info['str']}\n请以时家奇门排盘分析。"
+    elif method == "大六壬":
+        if chart:
+            return f"用户问题：{question}\n当前真太阳时干支：{ganzhi_info['str']}\n当前节气：{ganzhi_info.get('solar_term','')}\n{chart}\n请依据以上课式断事。"
+        return f"用户问题：{question}\n当前真太阳时干支：{ganzhi_info['str']}\n当前节气：{ganzhi_info.get('solar_term','')}\n请确定月将，推导天地盘、四课、三传，最后断事。"
+    elif method == "太乙":
+        return f"用户问题：{question}\n当前真太阳时干支：{ganzhi_info['str']}\n请进行太乙积年推算，定局数，分主客，论格局。"
+    elif method == "小六壬":
+        return f"用户问题：{question}\n推演路径：{cast['path']}\n最终落宫：{cast['result']}\n请解释含义。"
+    raise ValueError(f"unknown method: {method}")
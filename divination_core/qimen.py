@@ -0,0 +1,119 @@
+"""时家奇门 plates (拆补法, 转盘).
+
+A plate depends only on the day pillar, the hour pillar and the 节气 in effect, so `qimen_plate` is an
+LRU cache keyed by those: every user asking within the same 时辰 gets the same (shared, read-only) plate.
+
+Layout rules:
+    局数      the 节气's 上/中/下元 局, picking the 元 from the day's 符头 (拆补法)
+    地盘      戊己庚辛壬癸丁丙乙 laid from the 局's palace, forward for 阳遁 and backward for 阴遁
+    值符/值使  the star and door of the palace holding the hour's 旬首 遁仪 (中五 寄坤二)
+    天盘      the 值符 star moves onto the hour stem's 地盘 palace, the other stars follow round the ring
+    人盘      the 值使 door walks one palace per hour since the 旬首, the other doors follow round the ring
+    八神      start on the 值符 star's palace, clockwise for 阳遁 and counter-clockwise for 阴遁
+"""
+import functools
+
+from .ganzhi import GAN, ZHI, sexagenary, xunkong
+
+PALACE_NAMES = {1: "坎一宫", 2: "坤二宫", 3: "震三宫", 4: "巽四宫", 5: "中五宫", 6: "乾六宫", 7: "兑七宫", 8: "艮八宫", 9: "离九宫"}
+STARS = {1: "天蓬", 2: "天芮", 3: "天冲", 4: "天辅", 5: "天禽", 6: "天心", 7: "天柱", 8: "天任", 9: "天英"}
+DOORS = {1: "休门", 2: "死门", 3: "伤门", 4: "杜门", 6: "开门", 7: "惊门", 8: "生门", 9: "景门"}
+DEITIES = ["值符", "螣蛇", "太阴", "六合", "白虎", "玄武", "九地", "九天"]
+RING = [1, 8, 3, 4, 9, 2, 7, 6]  # outer palaces clockwise: 坎艮震巽离坤兑乾
+YI_ORDER = "戊己庚辛壬癸丁丙乙"
+XUN_YI = {"子": "戊", "戌": "己", "申": "庚", "午": "辛", "辰": "壬", "寅": "癸"}  # 旬首 branch -> 遁仪
+YIMA = {"申": "寅", "子": "寅", "辰": "寅", "寅": "申", "午": "申", "戌": "申",
+        "巳": "亥", "酉": "亥", "丑": "亥", "亥": "巳", "卯": "巳", "未": "巳"}
+
+# 节气 -> (阳遁?, 局 for 上元, 中元, 下元)
+JU_TABLE = {
+    "冬至": (True, 1, 7, 4), "惊蛰": (True, 1, 7, 4), "小寒": (True, 2, 8, 5), "大寒": (True, 3, 9, 6),
+    "春分": (True, 3, 9, 6), "立春": (True, 8, 5, 2), "雨水": (True, 9, 6, 3), "清明": (True, 4, 1, 7),
+    "立夏": (True, 4, 1, 7), "谷雨": (True, 5, 2, 8), "小满": (True, 5, 2, 8), "芒种": (True, 6, 3, 9),
+    "夏至": (False, 9, 3, 6), "白露": (False, 9, 3, 6), "小暑": (False, 8, 2, 5), "大暑": (False, 7, 1, 4),
+    "秋分": (False, 7, 1, 4), "立秋": (False, 2, 5, 8), "处暑": (False, 1, 4, 7), "寒露": (False, 6, 9, 3),
+    "立冬": (False, 6, 9, 3), "霜降": (False, 5, 8, 2), "小雪": (False, 5, 8, 2), "大雪": (False, 4, 7, 1),
+}
+YUAN_NAMES = ["上元", "中元", "下元"]
+
+
+def _step(palace, steps, forward):
+    """Move through palaces 1..9 (including 中五)."""
+    return (palace - 1 + (steps if forward else -steps)) % 9 + 1
+
+
+@functools.lru_cache(maxsize=1024)
+def qimen_plate(day_pillar, hour_pillar, solar_term):
+    """The 时家奇门 plate for a day/hour pillar (e.g. '戊午', '壬子') under `solar_term`. Do not mutate it."""
+    yang, *jus = JU_TABLE[solar_term]
+    day = sexagenary(day_pillar)
+    futou = ZHI[(day - day % 5) % 12]
+    yuan = 0 if futou in "子午卯酉" else 1 if futou in "寅申巳亥" else 2
+    ju = jus[yuan]
+
+    earth = {_step(ju, k, yang): stem for k, stem in enumerate(YI_ORDER)}
+    stem_palace = {stem: palace for palace, stem in earth.items()}
+
+    hour = sexagenary(hour_pillar)
+    xun_zhi = ZHI[(hour - hour % 10) % 12]
+    yi = XUN_YI[xun_zhi]
+    xun_palace = stem_palace[yi]
+    lead = 2 if xun_palace == 5 else xun_palace
+
+    hour_gan = GAN[hour % 10]
+    target = stem_palace[yi if hour_gan == "甲" else hour_gan]
+    target = 2 if target == 5 else target
+    star_shift = RING.index(target) - RING.index(lead)
+
+    door_palace = _step(xun_palace, hour % 10, yang)
+    door_palace = 2 if door_palace == 5 else door_palace
+    door_shift = RING.index(door_palace) - RING.index(lead)
+
+    palaces = {5: {"name": PALACE_NAMES[5], "earth": earth[5], "heaven": "", "star": "", "door": "", "deity": ""}}
+    for i, palace in enumerate(RING):
+        source = RING[(i - star_shift) % 8]
+        heaven, star = earth[source], STARS[source]
+        if source == 2:
+            # 天禽 (and the 中五 stem) ride with 天芮.
+            heaven, star = heaven + earth[5], star + "禽"
+        palaces[palace] = {
+            "name": PALACE_NAMES[palace],
+            "earth": earth[palace],
+            "heaven": heaven,
+            "star": star,
+            "door": DOORS[RING[(i - door_shift) % 8]],
+            "deity": "",
+        }
+    direction = 1 if yang else -1
+    for k, deity in enumerate(DEITIES):
+        palaces[RING[(RING.index(target) + k * direction) % 8]]["deity"] = deity
+
+    return {
+        "dun": "阳遁" if yang else "阴遁",
+        "ju": ju,
+        "yuan": YUAN_NAMES[yuan],
+        "solar_term": solar_term,
+        "xunshou": f"甲{xun_zhi}{yi}",
+        "zhifu": STARS[xun_palace],
+        "zhifu_palace": target,
+        "zhishi": DOORS[lead],
+        "zhishi_palace": door_palace,
+        "xunkong": xunkong(hour_pillar[0], hour_pillar[1]),
+        "yima": YIMA[hour_pillar[1]],
+        "palaces": palaces,
+    }
+
+
+def format_qimen(plate, day_pillar, hour_pillar):
+    rows = [
+        f"时家奇门（拆补法）：{plate['solar_term']} {plate['yuan']} {plate['dun']}{plate['ju']}局，{day_pillar}日 {hour_pillar}时",
+        f"旬首：{plate['xunshou']}　值符：{plate['zhifu']}（落{PALACE_NAMES[plate['zhifu_palace']]}）"
+        f"　值使：{plate['zhishi']}（落{PALACE_NAMES[plate['zhishi_palace']]}）　旬空：{plate['xunkong']}　马星：{plate['yima']}",
+    ]
+    for palace in (4, 9, 2, 3, 5, 7, 8, 1, 6):  # 上南下北
+        p = plate["palaces"][palace]
+        if palace == 5:
+            rows.append(f"{p['name']}：地盘{p['earth']}")
+        else:
+            rows.append(f"{p['name']}：{p['deity']}　{p['star']}　{p['door']}　天盘{p['heaven']}　地盘{p['earth']}")
+    return "\n".join(rows)
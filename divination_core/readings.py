@@ -0,0 +1,71 @@
+"""One reading end to end without any UI: cast, build the prompts, ask the model."""
+from .casting import DivinationEngine, meihua_numbers
+from .prompts import build_user_prompt, generate_system_prompt
+from .utils import estimate_tokens, truncate_to_tokens
+
+METHODS = ("六爻", "梅花", "奇门", "大六壬", "太乙", "小六壬")
+DEFAULT_PROFILE = {
+    "gender": "未提供", "birth_year": None,
+    "bazi_year": "", "bazi_month": "", "bazi_day": "", "bazi_hour": "",
+    "longitude": 120.0,
+}
+ANALYSIS_OUTPUT_TOKENS = 4000  # expected reasoning + answer size, used for tokens/min admission
+# A cheap non-reasoning model reconciles an ensemble's verdicts; only their final answers are sent.
+CONSENSUS_MODEL = "deepseek-ai/DeepSeek-V3"
+CONSENSUS_VERDICT_TOKENS = 1500  # per verdict
+CONSENSUS_OUTPUT_TOKENS = 800
+
+
+def cast_for(method, ganzhi_info, n1=0, n2=0, rng=None):
+    """The cast the app would show for `method`, or None for methods the model charts itself.
+
+    `rng` is the request's own Generator (see `RngStreams`); a fresh OS-seeded one is used if omitted.
+    """
+    if method == "六爻":
+        raw, display = DivinationEngine.cast_liuyao_coin(rng)
+        return {"raw": raw, "display": display}
+    if method == "梅花":
+        if n1 == 0 or n2 == 0:
+            n1, n2 = (int(x[0]) for x in meihua_numbers(1, rng))
+        return DivinationEngine.cast_meihua(n1, n2, ganzhi_info['hour_idx'] + 1)
+    if method == "小六壬":
+        return DivinationEngine.cast_xiaoliuren(ganzhi_info['month_num'], ganzhi_info['day_num'], ganzhi_info['hour_idx'] + 1)
+    return None
+
+
+def prepare_reading(method, question, ganzhi_info, profile=None, cast=None, charts=True):
+    if method not in METHODS:
+        raise ValueError(f"unknown method: {method}")
+    profile = {**DEFAULT_PROFILE, **(profile or {})}
+    return {
+        "method": method,
+        "question": question,
+        "cast": cast,
+        "system_prompt": generate_system_prompt(method, profile, ganzhi_info),
+        "user_prompt": build_user_prompt(method, question, ganzhi_info, cast, charts),
+    }
+
+
+def reading_messages(reading):
+    return [{"role": "system", "content": reading["system_prompt"]}, {"role": "user", "content": reading["user_prompt"]}]
+
+
+def reading_tokens(reading):
+    return estimate_tokens(reading["system_prompt"]) + estimate_tokens(reading["user_prompt"]) + ANALYSIS_OUTPUT_TOKENS
+
+
+def consensus_messages(method, question, verdicts):
+    """Messages asking CONSENSUS_MODEL to reconcile `verdicts`, a list of (model, answer) on one cast."""
+    parts = [f"【推演者 {chr(ord('A') + i)}：{model.split('/')[-1]}】\n{truncate_to_tokens(answer, CONSENSUS_VERDICT_TOKENS)}"
+             for i, (model, answer) in enumerate(verdicts)]
+    prompt = (
+        f"【占问】{method}：{question or '（未填问题）'}\n\n" + "\n\n".join(parts) + "\n\n"
+        f"以上是多位推演者对同一起局的批断。请给出综合结论：1. 共识之处；2. 分歧之处及各自依据；"
+        f"3. 最终综合判断（吉凶倾向与建议）。简明扼要，不超过 {CONSENSUS_OUTPUT_TOKENS} 字。"
+    )
+    return [{"role": "system", "content": "你是易学批断的评审，负责比对多位推演者对同一起局的结论并给出综合意见。"},
+            {"role": "user", "content": prompt}]
+
+
+def consensus_tokens(messages):
+    return sum(estimate_tokens(m["content"]) for m in messages) + CONSENSUS_OUTPUT_TOKENS
@@ -0,0 +1,81 @@
+"""Frame-budgeted rendering of streamed replies into any object with a `.markdown()` method."""
+import os
+import time
+
+class StreamRenderer:
+    """Buffers streamed chunks and pushes them to Streamlit placeholders on a frame budget.
+
+    Re-rendering the whole markdown on every chunk is quadratic in the output length, so chunks are
+    only appended to lists; a flush happens at most every `frame_ms` (or earlier once `frame_chars`
+    new characters are waiting). The collapsed reasoning trace is redrawn only every
+    `reasoning_every`-th flush, and placeholders whose text did not change are not touched.
+    """
+
+    def __init__(self, reasoning_area, content_area, frame_ms=None, frame_chars=None, reasoning_every=4):
+        self.reasoning_area = reasoning_area
+        self.content_area = content_area
+        self.frame_s = (frame_ms or int(os.getenv("DIVINATION_RENDER_FRAME_MS", "120"))) / 1000.0
+        self.frame_chars = frame_chars or int(os.getenv("DIVINATION_RENDER_FRAME_CHARS", "600"))
+        self.reasoning_every = reasoning_every
+        self.reasoning = ""
+        self.content = ""
+        self._pending_reasoning = []
+        self._pending_content = []
+        self._pending_chars = 0
+        self._shown_reasoning = 0
+        self._shown_content = 0
+        self._last_flush = time.monotonic()
+        self.started = time.monotonic()
+        self.chunks = 0
+        self.flushes = 0
+        self.reasoning_flushes = 0
+        self.skipped = 0
+
+    def add_reasoning(self, text):
+        self.chunks += 1
+        self._pending_reasoning.append(text)
+        self._pending_chars += len(text)
+        self._maybe_flush()
+
+    def add_content(self, text):
+        self.chunks += 1
+        self._pending_content.append(text)
+        self._pending_chars += len(text)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self._pending_chars >= self.frame_chars or time.monotonic() - self._last_flush >= self.frame_s:
+            self.flush()
+
+    def flush(self, final=False):
+        if self._pending_reasoning:
+            self.reasoning += "".join(self._pending_reasoning)
+            self._pending_reasoning.clear()
+        if self._pending_content:
+            self.content += "".join(self._pending_content)
+            self._pending_content.clear()
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+        updated = False
+        if len(self.reasoning) != self._shown_reasoning and (final or self.flushes % self.reasoning_every == 0):
+            self.reasoning_area.markdown(f"*{self.reasoning}*")
+            self._shown_reasoning = len(self.reasoning)
+            self.reasoning_flushes += 1
+            updated = True
+        if len(self.content) != self._shown_content or (final and self.content):
+            self.content_area.markdown(self.content if final else self.content + "▌")
+            self._shown_content = len(self.content)
+            updated = True
+        if not updated:
+            self.skipped += 1
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return {
+            "chunks": self.chunks,
+            "chunks_per_s": self.chunks / elapsed,
+            "flushes": self.flushes,
+            "reasoning_flushes": self.reasoning_flushes,
+            "skipped": self.skipped,
+        }
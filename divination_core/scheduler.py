@@ -0,0 +1,340 @@
+"""Process-wide admission control and retry policy for upstream model calls."""
+import collections
+import json
+import os
+import random
+import threading
+import time
+
+class TokenBucket:
+    """Refills `per_minute` units evenly over each minute; debt from under-estimates is paid back first."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60.0 / self.capacity
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+class Ticket:
+    """A place in a model's queue; becomes a running slot once granted. Always `release()` it."""
+
+    def __init__(self, scheduler, model, session_id, tokens):
+        self.scheduler = scheduler
+        self.model = model
+        self.session_id = session_id
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted_at = None
+        self.released = False
+        self._event = threading.Event()
+        self._callbacks = []
+
+    @property
+    def granted(self):
+        return self._event.is_set()
+
+    @property
+    def wait_seconds(self):
+        return (self.granted_at or time.monotonic()) - self.enqueued
+
+    def position(self):
+        return self.scheduler.position(self)
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    async def wait_async(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        self._add_callback(wake)
+        try:
+            await future
+        except asyncio.CancelledError:
+            self.release()
+            raise
+
+    def _add_callback(self, callback):
+        with self.scheduler._lock:
+            if not self.granted:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def _grant(self):
+        # Called with the scheduler lock held.
+        self.granted_at = time.monotonic()
+        self._event.set()
+        for callback in self._callbacks:
+            callback()
+        self._callbacks.clear()
+
+    def release(self, tokens=None):
+        self.scheduler.release(self, tokens)
+
+class ModelScheduler:
+    """Process-wide admission control for every upstream model call.
+
+    Per model it enforces a maximum number of in-flight requests plus requests/min and tokens/min
+    token buckets, and grants queued tickets round-robin across sessions so that one busy session
+    cannot starve the others. A 429 from upstream pauses the whole model for its Retry-After.
+    """
+
+    def __init__(self, default_limits, overrides=None):
+        self.default_limits = default_limits
+        self.overrides = overrides or {}
+        self._lock = threading.Lock()
+        self._models = {}
+
+    @classmethod
+    def from_env(cls):
+        defaults = {
+            "max_inflight": int(os.getenv("DIVINATION_MODEL_MAX_INFLIGHT", "4")),
+            "rpm": int(os.getenv("DIVINATION_MODEL_RPM", "60")),
+            "tpm": int(os.getenv("DIVINATION_MODEL_TPM", "200000")),
+        }
+        # e.g. DIVINATION_MODEL_LIMITS='{"deepseek-ai/DeepSeek-R1": {"max_inflight": 2, "rpm": 30}}'
+        overrides = json.loads(os.getenv("DIVINATION_MODEL_LIMITS", "{}"))
+        return cls(defaults, overrides)
+
+    def _model(self, model):
+        state = self._models.get(model)
+        if state is None:
+            limits = {**self.default_limits, **self.overrides.get(model, {})}
+            state = self._models[model] = {
+                "limits": limits,
+                "inflight": 0,
+                "queues": collections.OrderedDict(),  # session_id -> deque[Ticket]
+                "rpm": TokenBucket(limits["rpm"]),
+                "tpm": TokenBucket(limits["tpm"]),
+                "paused_until": 0.0,
+                "timer": None,
+                "waits": collections.deque(maxlen=200),
+                "throttled": 0,
+            }
+        return state
+
+    def request(self, model, session_id, tokens=1000):
+        """Enqueue a ticket; it may already be granted when this returns."""
+        ticket = Ticket(self, model, session_id, tokens)
+        with self._lock:
+            state = self._model(model)
+            state["queues"].setdefault(session_id, collections.deque()).append(ticket)
+            self._dispatch_locked(model, state)
+        return ticket
+
+    def acquire(self, model, session_id, tokens=1000, timeout=None):
+        ticket = self.request(model, session_id, tokens)
+        if not ticket.wait(timeout):
+            ticket.release()
+            raise TimeoutError(f"{model} 排队超时")
+        return ticket
+
+    async def acquire_async(self, model, session_id, tokens=1000):
+        ticket = self.request(model, session_id, tokens)
+        await ticket.wait_async()
+        return ticket
+
+    def release(self, ticket, tokens=None):
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            state = self._model(ticket.model)
+            if ticket.granted:
+                state["inflight"] -= 1
+                if tokens is not None:
+                    # Settle the estimate against what was actually used.
+                    state["tpm"].take(tokens - ticket.tokens, time.monotonic())
+            else:
+                queue = state["queues"].get(ticket.session_id)
+                if queue and ticket in queue:
+                    queue.remove(ticket)
+                    if not queue:
+                        del state["queues"][ticket.session_id]
+            self._dispatch_locked(ticket.model, state)
+
+    def report_throttle(self, model, retry_after=None):
+        """Upstream said 429: stop granting this model for a while, for every session."""
+        with self._lock:
+            state = self._model(model)
+            state["throttled"] += 1
+            state["paused_until"] = max(state["paused_until"], time.monotonic() + (retry_after or 2.0))
+            self._dispatch_locked(model, state)
+
+    def position(self, ticket):
+        with self._lock:
+            if ticket.granted or ticket.released:
+                return 0
+            position = 0
+            for queue in self._model(ticket.model)["queues"].values():
+                for queued in queue:
+                    position += 1
+                    if queued is ticket:
+                        return position
+            return position
+
+    def _dispatch_locked(self, model, state):
+        now = time.monotonic()
+        while state["queues"] and state["inflight"] < state["limits"]["max_inflight"]:
+            session_id, queue = next(iter(state["queues"].items()))
+            ticket = queue[0]
+            delay = max(state["paused_until"] - now, state["rpm"].wait_time(1, now), state["tpm"].wait_time(ticket.tokens, now))
+            if delay > 0:
+                self._schedule_locked(model, state, delay)
+                return
+            queue.popleft()
+            # Round-robin: the served session goes to the back of the line.
+            del state["queues"][session_id]
+            if queue:
+                state["queues"][session_id] = queue
+            state["rpm"].take(1, now)
+            state["tpm"].take(ticket.tokens, now)
+            state["inflight"] += 1
+            ticket._grant()
+            state["waits"].append(ticket.wait_seconds)
+
+    def _schedule_locked(self, model, state, delay):
+        if state["timer"] is not None and state["timer"].is_alive():
+            return
+
+        def redispatch():
+            with self._lock:
+                state["timer"] = None
+                self._dispatch_locked(model, state)
+
+        state["timer"] = threading.Timer(delay, redispatch)
+        state["timer"].daemon = True
+        state["timer"].start()
+
+    def stats(self):
+        with self._lock:
+            out = {}
+            for model, state in self._models.items():
+                waits = sorted(state["waits"])
+                out[model] = {
+                    "inflight": state["inflight"],
+                    "max_inflight": state["limits"]["max_inflight"],
+                    "queued": sum(len(q) for q in state["queues"].values()),
+                    "sessions_waiting": len(state["queues"]),
+                    "avg_wait_s": sum(waits) / len(waits) if waits else 0.0,
+                    "p95_wait_s": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                    "throttled": state["throttled"],
+                }
+            return out
+
+MAX_RETRIES = int(os.getenv("DIVINATION_MAX_RETRIES", "3"))
+
+def retry_after_seconds(exc):
+    """Retry-After hint (seconds) for retryable upstream errors, 0.0 if none, None if not retryable."""
+    import openai
+    if isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError)):
+        return 0.0
+    if isinstance(exc, openai.APIStatusError) and (exc.status_code == 429 or exc.status_code >= 500):
+        try:
+            return float(exc.response.headers.get("retry-after", 0))
+        except ValueError:
+            return 0.0
+    return None
+
+def backoff_delay(attempt, retry_after=0.0, base=1.0, cap=30.0):
+    # "Full jitter" exponential backoff, never shorter than what the server asked for.
+    return max(retry_after, random.uniform(0, min(cap, base * 2 ** attempt)))
+
+def call_with_retry(scheduler, model, session_id, tokens, fn):
+    """Run `fn()` inside a scheduler slot, retrying 429/5xx with jittered backoff (sync callers)."""
+    for attempt in range(MAX_RETRIES + 1):
+        ticket = scheduler.acquire(model, session_id, tokens)
+        try:
+            return fn()
+        except Exception as e:
+            retry_after = retry_after_seconds(e)
+            if retry_after is None or attempt == MAX_RETRIES:
+                raise
+            if getattr(e, "status_code", None) == 429:
+                scheduler.report_throttle(model, retry_after)
+        finally:
+            ticket.release()
+        time.sleep(backoff_delay(attempt, retry_after))
+
+def stream_completion(client, scheduler, model, messages, session_id, tokens, on_wait=None, on_retry=None,
+                      on_usage=None, telemetry=None, kind="stream", **kwargs):
+    """Stream a chat completion inside a scheduler slot, yielding ("reasoning" | "content", text).
+
+    429/5xx before the stream opens are retried with backoff. `on_wait(ticket)` is called about twice
+    a second while the ticket is queued (and with None once it is granted); `on_retry(attempt)` before
+    each backoff sleep; `on_usage(numbers)` with the final chunk's usage (see `context.usage_numbers`),
+    which also settles the slot's tokens/min estimate against the real count. With `telemetry` the call
+    is timed and recorded under `kind` (see `telemetry.CallTimer`).
+    """
+    from .context import usage_numbers
+    timer = telemetry.start(kind, model, session_id) if telemetry is not None else None
+    ticket = response = None
+    used = None
+    error = None
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            ticket = scheduler.request(model, session_id, tokens)
+            while not ticket.wait(0.5):
+                if on_wait:
+                    on_wait(ticket)
+            if on_wait:
+                on_wait(None)
+            if timer:
+                timer.sent()
+            try:
+                response = client.chat.completions.create(model=model, messages=messages, stream=True,
+                                                          stream_options={"include_usage": True}, **kwargs)
+                break
+            except Exception as e:
+                ticket.release()
+                retry_after = retry_after_seconds(e)
+                if retry_after is None or attempt == MAX_RETRIES:
+                    raise
+                if getattr(e, "status_code", None) == 429:
+                    scheduler.report_throttle(model, retry_after)
+                if on_retry:
+                    on_retry(attempt)
+                time.sleep(backoff_delay(attempt, retry_after))
+        for chunk in response:
+            if getattr(chunk, "usage", None):
+                used = usage_numbers(chunk.usage)
+                if on_usage:
+                    on_usage(used)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if getattr(delta, 'reasoning_content', None):
+                if timer:
+                    timer.reasoning()
+                yield "reasoning", delta.reasoning_content
+            if getattr(delta, 'content', None):
+                if timer:
+                    timer.content()
+                yield "content", delta.content
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        if response is not None:
+            response.close()  # a consumer that stops early also stops the upstream generation
+        if ticket is not None:
+            ticket.release(used["prompt_tokens"] + used["completion_tokens"] if used else None)
+        if timer:
+            timer.finish(error, used)
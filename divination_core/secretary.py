@@ -0,0 +1,57 @@
+"""The Roundtable secretary: folds new panel messages into one rolling meeting summary.
+
+Its cost is bounded per call: at most SECRETARY_INPUT_BUDGET tokens of new discussion are sent, split
+evenly across the new messages, and the summary itself is capped at SECRETARY_SUMMARY_TOKENS.
+"""
+import os
+
+from .context import usage_numbers
+from .scheduler import call_with_retry
+from .utils import estimate_tokens, truncate_to_tokens
+
+SECRETARY_MODEL = "deepseek-ai/DeepSeek-V3"
+SECRETARY_INPUT_BUDGET = int(os.getenv("DIVINATION_SECRETARY_INPUT_BUDGET", "3000"))
+SECRETARY_SUMMARY_TOKENS = int(os.getenv("DIVINATION_SECRETARY_SUMMARY_TOKENS", "600"))
+
+
+def secretary_messages(summary_text, new_messages):
+    """Messages asking SECRETARY_MODEL to merge `new_messages` into `summary_text`."""
+    # Split the input budget evenly so every new message is represented, however long the turn.
+    share = max(SECRETARY_INPUT_BUDGET // max(len(new_messages), 1), 50)
+    transcript = "\n\n".join(
+        f"[{m.get('name', 'User')}]: {truncate_to_tokens(m['content'], share)}" for m in new_messages
+    )
+    prompt = (
+        f"【已有纪要】\n{summary_text or '（无）'}\n\n【新增发言】\n{transcript}\n\n"
+        f"请将新增发言并入已有纪要，输出更新后的完整会议纪要：保留用户的核心问题、各AI的关键分歧和共识，"
+        f"删去已过时的细节，总长度不超过 {SECRETARY_SUMMARY_TOKENS} 字。"
+    )
+    return [{"role": "system", "content": "你是AI圆桌会议的秘书，负责维护一份滚动更新的会议纪要。"},
+            {"role": "user", "content": prompt}]
+
+
+def summarize(client, scheduler, summary, new_messages, session_id, telemetry=None):
+    """Fold only `new_messages` into the rolling `summary` ({"text", "watermark"}); returns the updated dict.
+
+    The new watermark is the `seq` of the last new message.
+    """
+    messages = secretary_messages(summary["text"], new_messages)
+    timer = telemetry.start("secretary", SECRETARY_MODEL, session_id) if telemetry is not None else None
+
+    def request():
+        if timer:
+            timer.sent()
+        return client.chat.completions.create(
+            model=SECRETARY_MODEL, messages=messages, temperature=0.5, max_tokens=SECRETARY_SUMMARY_TOKENS,
+        )
+
+    tokens = sum(estimate_tokens(m["content"]) for m in messages) + SECRETARY_SUMMARY_TOKENS
+    try:
+        response = call_with_retry(scheduler, SECRETARY_MODEL, session_id, tokens, request)
+    except Exception as e:
+        if timer:
+            timer.finish(e)
+        raise
+    if timer:
+        timer.finish(usage=usage_numbers(getattr(response, "usage", None)))
+    return {"text": response.choices[0].message.content, "watermark": new_messages[-1]["seq"]}
@@ -0,0 +1,620 @@
+"""Shared cache tier for several app processes: an mmap-file store or a Redis-protocol server.
+
+Every Streamlit worker keeps its own memory tier (see `store.ResponseCache`); this tier sits behind it
+so a reply generated by one process is served by all the others, and survives restarts. It is picked
+with DIVINATION_SHARED_CACHE:
+
+    mmap:///var/cache/divination.cache?size=256M   one file mapped by every process on the host
+    redis://[:password@]host:6379/0                 any Redis-compatible server, across hosts
+
+Both backends store opaque bytes with a TTL and offer the same calls: get, set, add (set only if
+absent), delete, stats, and the compare-and-swap pair `renew`/`delete_if` (extend or drop a key only
+while it still holds a given value) that `SingleFlight` leases are built on. Both are size-bounded: the
+mmap file is a ring log that overwrites its oldest records once full, and the Redis server is expected to run
+with a maxmemory policy (the stand-in here evicts least recently used keys past `max_bytes`).
+
+Only data crosses processes: the 干支 index is already one mmap-shared .npy file, prompts and charts
+are cheap pure functions memoized per process, and HTTP clients hold sockets that cannot be shared.
+
+`python -m divination_core.shared_cache serve` runs the stand-in RESP server (for tests and local
+multi-process runs); `check URL` exercises a backend, including single-flight from several processes.
+"""
+import argparse
+import collections
+import contextlib
+import hashlib
+import logging
+import mmap
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
+
+log = logging.getLogger(__name__)
+
+_SIZE_SUFFIXES = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text):
+    """'256M' -> 268435456."""
+    text = str(text).strip().upper().rstrip("B")
+    suffix = text[-1:] if text[-1:] in _SIZE_SUFFIXES else ""
+    return int(float(text[:len(text) - len(suffix)]) * _SIZE_SUFFIXES[suffix])
+
+
+class MmapStore:
+    """A fixed-size file mapped by every process on the host: a slot table over a ring log.
+
+    Layout: header | `slots` index entries | `data_size` bytes of records. A record is written at the
+    ring's write position; when it doesn't fit before the end, the ring wraps to offset 0 and starts a
+    new generation, overwriting the oldest records. An index entry is live while its record is inside
+    the window the ring hasn't overwritten yet (current generation below the write position, previous
+    generation at or above it), so eviction is implicit and O(1). Keys hash to a slot and probe
+    PROBE slots; a full window evicts its first entry. Writers take an exclusive flock on the file and
+    readers a shared one (POSIX only), plus a thread lock within the process.
+    """
+
+    MAGIC = b"DIVCACHE"
+    HEADER = struct.Struct("<8sIQQI")  # magic, slots, data size, write position, generation
+    HEADER_SIZE = 64
+    SLOT = struct.Struct("<16sQIId")  # key digest, record offset, value length, generation, expires (0 = never)
+    RECORD = struct.Struct("<16sI")  # key digest, value length; the value follows
+    PROBE = 8
+    EMPTY = bytes(16)
+
+    def __init__(self, path, size=64 * 1024 * 1024, slots=None):
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size >= self.HEADER_SIZE:
+                magic, slots, size, _, _ = self.HEADER.unpack(os.pread(self._fd, self.HEADER.size, 0))
+                if magic != self.MAGIC:
+                    raise ValueError(f"{path} is not a divination cache file")
+            else:
+                slots = slots or max(1024, size // 4096)
+                os.ftruncate(self._fd, self.HEADER_SIZE + slots * self.SLOT.size + size)
+                os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, slots, size, 0, 0), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self.slots = slots
+        self.data_size = size
+        self._index = self.HEADER_SIZE
+        self._data = self.HEADER_SIZE + slots * self.SLOT.size
+        self._mm = mmap.mmap(self._fd, self._data + size)
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        with self._thread_lock:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_EX if exclusive else self._fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def _cursor(self):
+        _, _, _, write_pos, generation = self.HEADER.unpack_from(self._mm, 0)
+        return write_pos, generation
+
+    def _live(self, entry, write_pos, generation, now):
+        digest, offset, length, entry_generation, expires = entry
+        if digest == self.EMPTY or (expires and expires < now):
+            return False
+        if entry_generation == generation:
+            return offset + self.RECORD.size + length <= write_pos
+        return entry_generation == (generation - 1) & 0xFFFFFFFF and offset >= write_pos
+
+    def _probe(self, digest):
+        start = int.from_bytes(digest[:8], "little") % self.slots
+        return [(start + i) % self.slots for i in range(min(self.PROBE, self.slots))]
+
+    def _find_locked(self, digest, now):
+        write_pos, generation = self._cursor()
+        for slot in self._probe(digest):
+            entry = self.SLOT.unpack_from(self._mm, self._index + slot * self.SLOT.size)
+            if entry[0] == digest and self._live(entry, write_pos, generation, now):
+                return slot, entry
+        return None, None
+
+    def get(self, key):
+        digest = self._digest(key)
+        with self._locked(False):
+            _, entry = self._find_locked(digest, time.time())
+            if entry is None:
+                return None
+            start = self._data + entry[1]
+            if self.RECORD.unpack_from(self._mm, start) != (digest, entry[2]):
+                return None
+            return bytes(self._mm[start + self.RECORD.size:start + self.RECORD.size + entry[2]])
+
+    def _set_locked(self, digest, value, ttl, now):
+        size = self.RECORD.size + len(value)
+        write_pos, generation = self._cursor()
+        if write_pos + size > self.data_size:
+            write_pos, generation = 0, (generation + 1) & 0xFFFFFFFF
+        start = self._data + write_pos
+        self.RECORD.pack_into(self._mm, start, digest, len(value))
+        self._mm[start + self.RECORD.size:start + size] = value
+        probe = self._probe(digest)
+        entries = [(slot, self.SLOT.unpack_from(self._mm, self._index + slot * self.SLOT.size)) for slot in probe]
+        # Reuse the digest's own slot if it has one, so no older copy stays live further along the probe
+        # (a later delete would clear one and expose the other); otherwise the first free slot.
+        same = [slot for slot, entry in entries if entry[0] == digest]
+        free = [slot for slot, entry in entries if not self._live(entry, write_pos, generation, now)]
+        target = same[0] if same else free[0] if free else probe[0]
+        for slot in same[1:]:
+            self.SLOT.pack_into(self._mm, self._index + slot * self.SLOT.size, self.EMPTY, 0, 0, 0, 0.0)
+        self.SLOT.pack_into(self._mm, self._index + target * self.SLOT.size, digest, write_pos, len(value), generation,
+                            now + ttl if ttl else 0.0)
+        self.HEADER.pack_into(self._mm, 0, self.MAGIC, self.slots, self.data_size, write_pos + size, generation)
+
+    def set(self, key, value, ttl=None):
+        """Store `value` (bytes); values larger than the ring are not stored."""
+        if self.RECORD.size + len(value) > self.data_size:
+            return False
+        with self._locked(True):
+            self._set_locked(self._digest(key), value, ttl, time.time())
+        return True
+
+    def add(self, key, value, ttl=None):
+        """Store `value` only if `key` is absent; True if it was stored."""
+        digest, now = self._digest(key), time.time()
+        with self._locked(True):
+            if self._find_locked(digest, now)[1] is not None:
+                return False
+            self._set_locked(digest, value, ttl, now)
+        return True
+
+    def delete(self, key):
+        digest = self._digest(key)
+        with self._locked(True):
+            slot, _ = self._find_locked(digest, time.time())
+            if slot is None:
+                return False
+            self.SLOT.pack_into(self._mm, self._index + slot * self.SLOT.size, self.EMPTY, 0, 0, 0, 0.0)
+        return True
+
+    def _holding_locked(self, digest, value, now):
+        # The slot of `digest` if its live value equals `value`.
+        slot, entry = self._find_locked(digest, now)
+        if entry is None or entry[2] != len(value):
+            return None, None
+        start = self._data + entry[1] + self.RECORD.size
+        return (slot, entry) if self._mm[start:start + entry[2]] == value else (None, None)
+
+    def renew(self, key, value, ttl):
+        """Push `key`'s expiry to now + `ttl`, only while it still holds `value`."""
+        digest, now = self._digest(key), time.time()
+        with self._locked(True):
+            slot, entry = self._holding_locked(digest, value, now)
+            if slot is None:
+                return False
+            self.SLOT.pack_into(self._mm, self._index + slot * self.SLOT.size, *entry[:4], now + ttl)
+        return True
+
+    def delete_if(self, key, value):
+        """Delete `key` only while it still holds `value`."""
+        digest = self._digest(key)
+        with self._locked(True):
+            slot, _ = self._holding_locked(digest, value, time.time())
+            if slot is None:
+                return False
+            self.SLOT.pack_into(self._mm, self._index + slot * self.SLOT.size, self.EMPTY, 0, 0, 0, 0.0)
+        return True
+
+    def stats(self):
+        now = time.time()
+        with self._locked(False):
+            write_pos, generation = self._cursor()
+            entries = sum(self._live(self.SLOT.unpack_from(self._mm, self._index + i * self.SLOT.size), write_pos, generation, now)
+                          for i in range(self.slots))
+        return {"backend": "mmap", "path": self.path, "entries": entries, "slots": self.slots,
+                "capacity_bytes": self.data_size, "write_pos": write_pos, "generation": generation}
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+
+# Compare-and-swap as server-side scripts, so the check and the write are atomic on any Redis.
+RENEW_SCRIPT = 'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("PEXPIRE", KEYS[1], ARGV[2]) else return 0 end'
+DELETE_IF_SCRIPT = 'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) else return 0 end'
+
+
+class RespError(Exception):
+    """An error reply from a Redis-protocol server."""
+
+
+def _encode_command(args):
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+def _read_reply(stream):
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        return RespError(rest.decode("utf-8"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(rest)
+        return None if count < 0 else [_read_reply(stream) for _ in range(count)]
+    raise ConnectionError(f"bad RESP reply: {line[:40]!r}")
+
+
+class RespClient:
+    """Minimal Redis-protocol (RESP2) client with the cache's five calls; one connection, reconnected on error."""
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, timeout=2.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = self._stream = None
+
+    @classmethod
+    def from_url(cls, url, timeout=2.0):
+        parts = urllib.parse.urlsplit(url)
+        return cls(parts.hostname or "127.0.0.1", parts.port or 6379, int(parts.path.strip("/") or 0),
+                   urllib.parse.unquote(parts.password) if parts.password else None, timeout)
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._stream = self._sock.makefile("rb")
+        for command in ([("AUTH", self.password)] if self.password else []) + ([("SELECT", self.db)] if self.db else []):
+            self._sock.sendall(_encode_command(command))
+            reply = _read_reply(self._stream)
+            if isinstance(reply, RespError):
+                raise reply
+
+    def _close(self):
+        if self._sock is not None:
+            self._stream.close()
+            self._sock.close()
+        self._sock = self._stream = None
+
+    def execute(self, *args):
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall(_encode_command(args))
+                    reply = _read_reply(self._stream)
+                    break
+                except OSError:
+                    # One reconnect covers a server restart or an idle connection the server dropped.
+                    self._close()
+                    if attempt:
+                        raise
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def get(self, key):
+        return self.execute("GET", key)
+
+    def set(self, key, value, ttl=None):
+        args = ("SET", key, value) + (("PX", max(int(ttl * 1000), 1)) if ttl else ())
+        return self.execute(*args) == "OK"
+
+    def add(self, key, value, ttl=None):
+        args = ("SET", key, value, "NX") + (("PX", max(int(ttl * 1000), 1)) if ttl else ())
+        return self.execute(*args) == "OK"
+
+    def delete(self, key):
+        return self.execute("DEL", key) > 0
+
+    def renew(self, key, value, ttl):
+        return self.execute("EVAL", RENEW_SCRIPT, 1, key, value, max(int(ttl * 1000), 1)) == 1
+
+    def delete_if(self, key, value):
+        return self.execute("EVAL", DELETE_IF_SCRIPT, 1, key, value) == 1
+
+    def stats(self):
+        return {"backend": "redis", "address": f"{self.host}:{self.port}/{self.db}", "entries": self.execute("DBSIZE")}
+
+
+class RespServer:
+    """In-memory stand-in for a Redis server: the commands `RespClient` sends, LRU eviction past `max_bytes`.
+
+    EVAL runs only RENEW_SCRIPT and DELETE_IF_SCRIPT, natively; there is no Lua interpreter.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()  # key -> (value, expires or None), least recently used first
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        command = _read_reply(self.rfile)
+                    except (ConnectionError, OSError):
+                        return
+                    if not isinstance(command, list) or not command:
+                        self.wfile.write(b"-ERR protocol error\r\n")
+                        return
+                    self.wfile.write(server.dispatch([part if isinstance(part, bytes) else str(part).encode() for part in command]))
+
+        self.tcp = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=False)
+        self.tcp.allow_reuse_address = True
+        self.tcp.daemon_threads = True
+        self.tcp.server_bind()
+        self.tcp.server_activate()
+
+    @property
+    def url(self):
+        host, port = self.tcp.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        threading.Thread(target=self.tcp.serve_forever, name="resp-standin", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.tcp.shutdown()
+        self.tcp.server_close()
+
+    def _live_locked(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            self._drop_locked(key)
+            return None
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def _drop_locked(self, key):
+        value, _ = self._data.pop(key)
+        self.used_bytes -= len(key) + len(value)
+
+    def dispatch(self, command):
+        name, args = command[0].upper(), command[1:]
+        now = time.time()
+        with self._lock:
+            if name == b"PING":
+                return b"+PONG\r\n"
+            if name in (b"SELECT", b"AUTH"):
+                return b"+OK\r\n"
+            if name == b"GET" and len(args) == 1:
+                value = self._live_locked(args[0], now)
+                return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+            if name == b"SET" and len(args) >= 2:
+                key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+                expires = None
+                for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+                    if unit in options:
+                        expires = now + float(options[options.index(unit) + 1]) * scale
+                present = self._live_locked(key, now) is not None
+                if (b"NX" in options and present) or (b"XX" in options and not present):
+                    return b"$-1\r\n"
+                if present:
+                    self._drop_locked(key)
+                self._data[key] = (value, expires)
+                self.used_bytes += len(key) + len(value)
+                while self.used_bytes > self.max_bytes and len(self._data) > 1:
+                    self._drop_locked(next(iter(self._data)))
+                    self.evictions += 1
+                return b"+OK\r\n"
+            if name in (b"DEL", b"EXISTS"):
+                found = [key for key in args if self._live_locked(key, now) is not None]
+                if name == b"DEL":
+                    for key in found:
+                        self._drop_locked(key)
+                return b":%d\r\n" % len(found)
+            if name == b"EVAL" and len(args) >= 4 and args[0].decode() in (RENEW_SCRIPT, DELETE_IF_SCRIPT):
+                key, value = args[2], args[3]
+                if self._live_locked(key, now) != value:
+                    return b":0\r\n"
+                if args[0].decode() == DELETE_IF_SCRIPT:
+                    self._drop_locked(key)
+                else:
+                    self._data[key] = (value, now + float(args[4]) / 1000)
+                return b":1\r\n"
+            if name == b"DBSIZE":
+                return b":%d\r\n" % len(self._data)
+            if name == b"FLUSHALL":
+                self._data.clear()
+                self.used_bytes = 0
+                return b"+OK\r\n"
+        return b"-ERR unknown or malformed command '%s'\r\n" % name
+
+
+def open_shared_cache(url):
+    """The backend named by `url` (see the module docstring), or None when `url` is empty."""
+    if not url:
+        return None
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme in ("redis", "resp"):
+        return RespClient.from_url(url)
+    if parts.scheme == "mmap":
+        options = urllib.parse.parse_qs(parts.query)
+        return MmapStore(parts.netloc + parts.path, parse_size(options.get("size", ["64M"])[0]),
+                         int(options["slots"][0]) if "slots" in options else None)
+    raise ValueError(f"unsupported shared cache URL: {url!r} (use mmap:///path or redis://host:port/db)")
+
+
+class Lease:
+    """One claim on a single-flight key. The leader calls `keep()` as it works (cheap: it renews at most
+    every third of the lease) and `release()` when done; both act only while the claim is still its own."""
+
+    def __init__(self, flight, key, token):
+        self.flight = flight
+        self.key = key
+        self.token = token
+        self.renewed = time.monotonic()
+        self.lost = False
+
+    def keep(self):
+        """Renew the lease when due; False once it has been lost to another leader."""
+        if self.lost or self.flight is None or time.monotonic() - self.renewed < self.flight.lease / 3:
+            return not self.lost
+        self.renewed = time.monotonic()
+        try:
+            self.lost = not self.flight.backend.renew(self.flight.PREFIX + self.key, self.token, self.flight.lease)
+        except Exception as e:
+            log.warning("renewing lease on %s failed: %s", self.key, e)
+            return True
+        if self.lost:
+            log.warning("lease on %s expired before it was renewed; another worker may now generate it too", self.key)
+        return not self.lost
+
+    def release(self):
+        if self.flight is None:
+            return
+        try:
+            self.flight.backend.delete_if(self.flight.PREFIX + self.key, self.token)
+        except Exception as e:
+            log.warning("releasing lease on %s failed: %s", self.key, e)
+
+
+class SingleFlight:
+    """Collapse identical work across every process sharing `backend` into one leader.
+
+    `acquire(key)` claims a lease with the backend's set-if-absent and returns it as a `Lease` (None if
+    another worker holds it). The leader keeps the lease alive while it works, stores the result and
+    releases it; the others `wait(key, ready)` for as long as a live lease exists, then try `acquire`
+    again if no result appeared. A leader that dies stops renewing, so its lease lapses after `lease`
+    seconds and a waiter takes over.
+    """
+
+    PREFIX = "flight:"
+
+    def __init__(self, backend, lease=300.0, poll=0.2):
+        self.backend = backend
+        self.lease = lease
+        self.poll = poll
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def acquire(self, key):
+        # A token per claim, so a stale leader in the same process can't release its successor's lease.
+        token = f"{self.owner}:{uuid.uuid4().hex}".encode("utf-8")
+        return Lease(self, key, token) if self.backend.add(self.PREFIX + key, token, self.lease) else None
+
+    def wait(self, key, ready, timeout=None, should_stop=None):
+        """Poll `ready()` while a lease on `key` is live; the result, or None once the lease is gone
+        without one (or `timeout`, if given, passes)."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not (should_stop and should_stop()) and (deadline is None or time.monotonic() < deadline):
+            value = ready()
+            if value is not None:
+                return value
+            if self.backend.get(self.PREFIX + key) is None:
+                return ready()  # the leader finished (or gave up) just now
+            time.sleep(self.poll)
+        return None
+
+
+def _flight_worker(url, key, results):
+    backend = open_shared_cache(url)
+    flight = SingleFlight(backend, lease=10.0, poll=0.05)
+    lease = flight.acquire(key)
+    if lease is not None:
+        time.sleep(0.5)  # the "LLM call"
+        backend.set("value:" + key, b"computed", 60)
+        lease.release()
+        results.put("leader")
+    else:
+        value = flight.wait(key, lambda: backend.get("value:" + key))
+        results.put("follower" if value == b"computed" else "missed")
+
+
+def check(url, processes=6):
+    """Round-trip, add/delete, compare-and-swap, TTL, eviction and cross-process single-flight against `url`."""
+    import multiprocessing
+    backend = open_shared_cache(url)
+    key = f"check:{uuid.uuid4().hex}"
+    report = {}
+    report["roundtrip"] = backend.set(key, "测试".encode("utf-8"), 60) and backend.get(key) == "测试".encode("utf-8")
+    report["add"] = not backend.add(key, b"x", 60) and backend.delete(key) and backend.add(key, b"x", 60)
+    report["compare_and_swap"] = (not backend.renew(key, b"y", 60) and not backend.delete_if(key, b"y")
+                                  and backend.renew(key, b"x", 60) and backend.delete_if(key, b"x")
+                                  and backend.get(key) is None)
+    backend.set(key + ":lease", b"x", 0.2)
+    backend.renew(key + ":lease", b"x", 60)
+    time.sleep(0.3)
+    report["renew"] = backend.get(key + ":lease") == b"x" and backend.delete(key + ":lease")
+    backend.set(key + ":ttl", b"x", 0.2)
+    time.sleep(0.3)
+    report["ttl"] = backend.get(key + ":ttl") is None
+    big = os.urandom(64 * 1024)
+    for i in range(64):
+        backend.set(f"{key}:fill:{i}", big, 60)
+    report["latest_after_fill"] = backend.get(f"{key}:fill:63") == big
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [context.Process(target=_flight_worker, args=(url, key + ":flight", results)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    roles = collections.Counter(results.get(timeout=30) for _ in workers)
+    for worker in workers:
+        worker.join()
+    report["single_flight"] = roles["leader"] == 1 and roles["follower"] == processes - 1
+    report["roles"] = dict(roles)
+    report["stats"] = backend.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a stand-in Redis-protocol cache, or check a shared cache backend.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run the in-memory RESP stand-in server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=6380)
+    serve.add_argument("--max-bytes", default="64M")
+    check_cmd = sub.add_parser("check", help="exercise a backend, e.g. mmap:///tmp/divination.cache?size=1M")
+    check_cmd.add_argument("url")
+    check_cmd.add_argument("--processes", type=int, default=6)
+    args = parser.parse_args()
+    if args.command == "serve":
+        server = RespServer(args.host, args.port, parse_size(args.max_bytes))
+        print(f"RESP stand-in at {server.url}", flush=True)
+        try:
+            server.tcp.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.tcp.server_close()
+        return
+    report = check(args.url, args.processes)
+    for name, value in report.items():
+        print(f"{name:>18}: {value}")
+    raise SystemExit(0 if all(v for k, v in report.items() if k not in ("roles", "stats")) else 1)
+
+
+if __name__ == "__main__":
+    main()
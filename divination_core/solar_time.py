@@ -0,0 +1,299 @@
+"""真太阳时: longitude offset plus the equation of time, 时辰 boundaries and place lookup.
+
+Apparent (sundial) solar time is UTC + longitude × 4 min + the equation of time, which swings
+between about -14 min (mid February) and +16 min (early November). Leaving the second term out
+moves the hour pillar for anything cast within a quarter of an hour of a 时辰 boundary.
+
+The equation of time comes from the low-precision solar series in Meeus' *Astronomical Algorithms*
+(the one NOAA's solar calculator uses), good to a few seconds. It is tabulated once per day at 0h UT
+for TABLE_FIRST_DAY .. TABLE_LAST_DAY (about 600 KB of float64, built in a few milliseconds) and
+interpolated linearly, which adds well under a second of error because the value changes by at most
+about 30 s a day. Moments outside the table are computed directly from the series.
+
+Naive datetimes are Beijing time (TZ_CN), as everywhere else in the app; aware ones may be in any
+zone. Returned solar times are naive local apparent time. `python -m divination_core.solar_time
+verify` checks the table against the series and known values, `bench` times the scalar and batch
+paths, and `convert` prints the solar time and 时辰 boundaries for a moment and place.
+"""
+import argparse
+import datetime
+import functools
+import logging
+import os
+import re
+import threading
+import time
+
+from .ganzhi import CITY_COORDINATES, TZ_CN, ZHI
+
+log = logging.getLogger(__name__)
+
+TABLE_FIRST_DAY = datetime.date(1900, 1, 1)
+TABLE_LAST_DAY = datetime.date(2101, 1, 1)
+UNIX_EPOCH_JD = 2440587.5  # Julian day of 1970-01-01 00:00 UT
+J2000_JD = 2451545.0
+SHICHEN_SECONDS = 7200
+# Online place lookup is opt-in, since the typed place leaves the host: set e.g.
+# DIVINATION_GEOCODER_URL=https://nominatim.openstreetmap.org/search (any Nominatim-compatible service).
+GEOCODER_URL = os.getenv("DIVINATION_GEOCODER_URL", "")
+
+
+def equation_of_time(jd):
+    """Apparent minus mean solar time in minutes at Julian day(s) `jd` (scalar or array, UT)."""
+    import numpy as np
+    t = (np.asarray(jd, dtype=np.float64) - J2000_JD) / 36525.0
+    mean_longitude = np.radians((280.46646 + t * (36000.76983 + 0.0003032 * t)) % 360.0)
+    anomaly = np.radians(357.52911 + t * (35999.05029 - 0.0001537 * t))
+    eccentricity = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+    obliquity = (23.0 + (26.0 + (21.448 - t * (46.815 + t * (0.00059 - 0.001813 * t))) / 60.0) / 60.0
+                 + 0.00256 * np.cos(np.radians(125.04 - 1934.136 * t)))
+    y = np.tan(np.radians(obliquity) / 2.0) ** 2
+    radians = (y * np.sin(2 * mean_longitude) - 2 * eccentricity * np.sin(anomaly)
+               + 4 * eccentricity * y * np.sin(anomaly) * np.cos(2 * mean_longitude)
+               - 0.5 * y * y * np.sin(4 * mean_longitude) - 1.25 * eccentricity ** 2 * np.sin(2 * anomaly))
+    return 4.0 * np.degrees(radians)
+
+
+def to_utc(dt):
+    """Naive UTC for `dt`; naive input is taken as Beijing time."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=TZ_CN)
+    return dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class EquationOfTimeTable:
+    """Equation of time (minutes) per day at 0h UT from `first` to `last`, linearly interpolated."""
+
+    def __init__(self, first=TABLE_FIRST_DAY, last=TABLE_LAST_DAY):
+        import numpy as np
+        self.first = first
+        self.last = last
+        self._first_day64 = np.datetime64(first, "D")
+        epoch_days = (first - datetime.date(1970, 1, 1)).days
+        self.minutes_per_day = equation_of_time(UNIX_EPOCH_JD + epoch_days + np.arange((last - first).days + 1))
+        self._as_list = self.minutes_per_day.tolist()  # plain floats: the scalar path avoids numpy overhead
+
+    def minutes(self, utc):
+        """Equation of time at the naive UTC datetime `utc`."""
+        position = (utc - datetime.datetime.combine(self.first, datetime.time())).total_seconds() / 86400.0
+        day = int(position // 1)
+        if not 0 <= day < len(self._as_list) - 1:
+            return float(equation_of_time(UNIX_EPOCH_JD + (utc - datetime.datetime(1970, 1, 1)).total_seconds() / 86400.0))
+        before = self._as_list[day]
+        return before + (self._as_list[day + 1] - before) * (position - day)
+
+    def minutes_batch(self, utc):
+        """Vectorized `minutes` for a datetime64 array of UTC moments."""
+        import numpy as np
+        position = (np.asarray(utc, dtype="datetime64[ms]") - self._first_day64).astype(np.float64) / 86400000.0
+        inside = (position >= 0) & (position < len(self.minutes_per_day) - 1)
+        day = np.clip(position, 0, len(self.minutes_per_day) - 2).astype(np.int64)
+        before = self.minutes_per_day[day]
+        out = before + (self.minutes_per_day[day + 1] - before) * (position - day)
+        if not inside.all():
+            outside = ~inside
+            out[outside] = equation_of_time(UNIX_EPOCH_JD + position[outside] + (self.first - datetime.date(1970, 1, 1)).days)
+        return out
+
+
+@functools.lru_cache(maxsize=1)
+def default_table():
+    """The process-wide table, built on first use."""
+    return EquationOfTimeTable()
+
+
+def solar_offset(utc, longitude, table=None):
+    """Apparent solar time minus UTC at `utc` for `longitude` (degrees east)."""
+    minutes = longitude * 4.0 + (table or default_table()).minutes(utc)
+    return datetime.timedelta(minutes=minutes)
+
+
+def true_solar_time(dt, longitude, table=None):
+    """Local apparent solar time (naive) of the moment `dt` at `longitude`."""
+    utc = to_utc(dt)
+    return utc + solar_offset(utc, longitude, table)
+
+
+def true_solar_time_batch(datetimes, longitudes, utc_offset_hours=8.0, table=None):
+    """Vectorized `true_solar_time`: naive local clock times (datetimes or datetime64, all at
+    `utc_offset_hours`) and longitudes (scalar or one per moment) -> datetime64[ms] solar times."""
+    import numpy as np
+    clock = np.asarray(datetimes, dtype="datetime64[ms]")
+    utc = clock - np.timedelta64(int(round(utc_offset_hours * 3600000)), "ms")
+    minutes = np.asarray(longitudes, dtype=np.float64) * 4.0 + (table or default_table()).minutes_batch(utc)
+    return utc + np.rint(minutes * 60000.0).astype("timedelta64[ms]")
+
+
+def shichen_batch(solar):
+    """For datetime64 solar times: (时辰 branch index, seconds since it began, seconds until the next)."""
+    import numpy as np
+    solar = np.asarray(solar, dtype="datetime64[ms]")
+    since_midnight = (solar - solar.astype("datetime64[D]")).astype(np.int64) / 1000.0
+    since = (since_midnight + 3600.0) % SHICHEN_SECONDS
+    branch = ((since_midnight + 3600.0) // SHICHEN_SECONDS).astype(np.int64) % 12
+    return branch, since, SHICHEN_SECONDS - since
+
+
+def _clock_at(solar, longitude, table, guess_utc, tzinfo):
+    # Solve utc + offset(utc) = solar; the offset drifts < 1 s per hour, so two passes are exact.
+    utc = guess_utc
+    for _ in range(2):
+        utc = solar - solar_offset(utc, longitude, table)
+    clock = utc.replace(tzinfo=datetime.timezone.utc).astimezone(tzinfo or TZ_CN)
+    return clock if tzinfo else clock.replace(tzinfo=None)
+
+
+def shichen_boundaries(dt, longitude, table=None):
+    """The 时辰 that `dt` falls in at `longitude` and exactly when, on the clock, it starts and ends.
+
+    Clock times come back in `dt`'s zone (naive Beijing time for naive input). `margin_s` is the
+    distance to the nearer boundary, for warning that a slightly different time would change the
+    hour pillar.
+    """
+    table = table or default_table()
+    utc = to_utc(dt)
+    solar = utc + solar_offset(utc, longitude, table)
+    midnight = solar.replace(hour=0, minute=0, second=0, microsecond=0)
+    since = ((solar - midnight).total_seconds() + 3600.0) % SHICHEN_SECONDS
+    start = solar - datetime.timedelta(seconds=since)
+    end = start + datetime.timedelta(seconds=SHICHEN_SECONDS)
+    branch = (start.hour + 1) // 2 % 12
+    return {
+        "solar": solar,
+        "zhi": ZHI[branch],
+        "next_zhi": ZHI[(branch + 1) % 12],
+        "equation_of_time_min": table.minutes(utc),
+        # Relative to the meridian of `dt`'s zone (120°E for Beijing time).
+        "longitude_offset_min": longitude * 4.0 - (dt.utcoffset() or datetime.timedelta(hours=8)).total_seconds() / 60.0,
+        "starts": _clock_at(start, longitude, table, utc, dt.tzinfo),
+        "ends": _clock_at(end, longitude, table, utc, dt.tzinfo),
+        "since_s": since,
+        "until_s": SHICHEN_SECONDS - since,
+        "margin_s": min(since, SHICHEN_SECONDS - since),
+    }
+
+
+_COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*[,，\s]\s*(-?\d+(?:\.\d+)?)\s*$")
+_geocoded = {}
+_geocode_lock = threading.Lock()
+
+
+def geocode(query, timeout=5.0):
+    """A place as {"name", "longitude", "latitude"}, or None when it can't be resolved.
+
+    Accepts "纬度,经度" pairs, a bare longitude, the names in CITY_COORDINATES and, when a
+    GEOCODER_URL service is configured, any other place name. Answers (including "not found") are memoized;
+    network errors are not, so a later rerun retries.
+    """
+    query = (query or "").strip()
+    if not query:
+        return None
+    pair = _COORDINATES.match(query)
+    if pair:
+        latitude, longitude = float(pair.group(1)), float(pair.group(2))
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            return {"name": query, "longitude": longitude, "latitude": latitude}
+        return None
+    try:
+        longitude = float(query)
+    except ValueError:
+        pass
+    else:
+        return {"name": query, "longitude": longitude, "latitude": None} if -180 <= longitude <= 180 else None
+    if query in CITY_COORDINATES and CITY_COORDINATES[query]:
+        return {"name": query, "longitude": CITY_COORDINATES[query], "latitude": None}
+    if not GEOCODER_URL:
+        return None
+    with _geocode_lock:
+        if query in _geocoded:
+            return _geocoded[query]
+    import httpx
+    try:
+        response = httpx.get(GEOCODER_URL, params={"q": query, "format": "jsonv2", "limit": 1, "accept-language": "zh"},
+                             headers={"User-Agent": "divination-app (true solar time)"}, timeout=timeout)
+        response.raise_for_status()
+        hits = response.json()
+    except Exception as e:
+        log.warning("geocoding %r failed: %s", query, e)
+        return None
+    place = None
+    if hits:
+        place = {"name": hits[0].get("display_name", query), "longitude": float(hits[0]["lon"]), "latitude": float(hits[0]["lat"])}
+    with _geocode_lock:
+        _geocoded[query] = place
+    return place
+
+
+# Reference values (minutes) from published almanac tables, to a few seconds.
+KNOWN_VALUES = [
+    (datetime.datetime(2024, 2, 11, 12), -14.2),
+    (datetime.datetime(2024, 5, 14, 12), 3.7),
+    (datetime.datetime(2024, 7, 26, 12), -6.5),
+    (datetime.datetime(2024, 11, 3, 12), 16.4),
+]
+
+
+def verify(table, samples=20000, seed=0):
+    """Max |table - series| over random moments, plus the error against KNOWN_VALUES and batch vs scalar."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    span_ms = int((table.last - table.first).days) * 86400000
+    moments = np.datetime64(table.first, "ms") + rng.integers(0, span_ms, samples).astype("timedelta64[ms]")
+    jd = UNIX_EPOCH_JD + moments.astype(np.int64) / 86400000.0
+    interpolation = float(np.abs(table.minutes_batch(moments) - equation_of_time(jd)).max() * 60)
+    known = max(abs(table.minutes(dt) - value) * 60 for dt, value in KNOWN_VALUES)
+    longitudes = rng.uniform(-180, 180, 500)
+    batch = true_solar_time_batch(moments[:500], longitudes, table=table)
+    scalar = np.array([true_solar_time(m.astype(datetime.datetime), lon, table)
+                       for m, lon in zip(moments[:500], longitudes)], dtype="datetime64[ms]")
+    return {"interpolation_max_s": interpolation, "known_values_max_s": known,
+            "batch_vs_scalar_max_ms": float(np.abs((batch - scalar).astype(np.int64)).max())}
+
+
+def bench(table, n=100000):
+    import numpy as np
+    moments = np.datetime64("2000-01-01", "ms") + np.arange(n).astype("timedelta64[m]") * 37
+    scalar = moments[:10000].astype(datetime.datetime).tolist()
+    t = time.perf_counter()
+    for dt in scalar:
+        true_solar_time(dt, 116.4, table)
+    scalar_us = (time.perf_counter() - t) / len(scalar) * 1e6
+    t = time.perf_counter()
+    true_solar_time_batch(moments, 116.4, table=table)
+    batch_us = (time.perf_counter() - t) / n * 1e6
+    t = time.perf_counter()
+    EquationOfTimeTable()
+    return {"scalar_us": scalar_us, "batch_us": batch_us, "table_build_ms": (time.perf_counter() - t) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check, benchmark or use the true-solar-time tables.")
+    parser.add_argument("command", choices=["verify", "bench", "convert"])
+    parser.add_argument("--time", default=None, help="ISO datetime for convert (naive = Beijing time; default now)")
+    parser.add_argument("--place", default="北京", help="city, place name, longitude or 'lat,lon' for convert")
+    parser.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args()
+    table = default_table()
+    if args.command == "verify":
+        result = verify(table, args.samples)
+        for name, value in result.items():
+            print(f"{name:>24}: {value:.3f}")
+        ok = result["interpolation_max_s"] < 1 and result["known_values_max_s"] < 15 and result["batch_vs_scalar_max_ms"] <= 1
+        raise SystemExit(0 if ok else 1)
+    if args.command == "bench":
+        for name, value in bench(table, args.samples * 5).items():
+            print(f"{name:>16}: {value:8.3f}")
+        return
+    place = geocode(args.place)
+    if place is None:
+        raise SystemExit(f"cannot resolve place {args.place!r}")
+    dt = datetime.datetime.fromisoformat(args.time) if args.time else datetime.datetime.now(TZ_CN)
+    info = shichen_boundaries(dt, place["longitude"], table)
+    print(f"{place['name']} ({place['longitude']:.2f}°E): 真太阳时 {info['solar']:%Y-%m-%d %H:%M:%S} "
+          f"(经度 {info['longitude_offset_min']:+.1f} 分, 时差 {info['equation_of_time_min']:+.2f} 分)")
+    print(f"{info['zhi']}时 {info['starts']:%H:%M:%S} - {info['ends']:%H:%M:%S} (clock), "
+          f"{info['until_s'] / 60:.1f} min until {info['next_zhi']}时")
+
+
+if __name__ == "__main__":
+    main()
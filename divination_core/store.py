@@ -0,0 +1,293 @@
+"""SQLite-backed session store and response cache."""
+import collections
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+class SessionStore:
+    """Append-only SQLite (WAL) log of Roundtable messages and Yi Jing readings, keyed by session ID.
+
+    Sessions keep only a bounded tail in memory; older history is read back page by page.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY, created REAL NOT NULL, updated REAL NOT NULL, meta TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, name TEXT,
+                content TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (session_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS readings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, method TEXT NOT NULL,
+                question TEXT, payload TEXT NOT NULL, created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS readings_by_session ON readings (session_id, id);
+        """)
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("DIVINATION_DB_PATH", "divination.db"))
+
+    def _touch(self, session_id, now):
+        self._conn.execute(
+            "INSERT INTO sessions (id, created, updated) VALUES (?, ?, ?) ON CONFLICT(id) DO UPDATE SET updated = excluded.updated",
+            (session_id, now, now),
+        )
+
+    def exists(self, session_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is not None
+
+    def get_meta(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT meta FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row["meta"]) if row else {}
+
+    def update_meta(self, session_id, **values):
+        with self._lock:
+            now = time.time()
+            self._touch(session_id, now)
+            row = self._conn.execute("SELECT meta FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            meta = {**json.loads(row["meta"]), **values}
+            self._conn.execute("UPDATE sessions SET meta = ? WHERE id = ?", (json.dumps(meta, ensure_ascii=False), session_id))
+
+    def append_message(self, session_id, msg):
+        with self._lock:
+            now = time.time()
+            self._touch(session_id, now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO messages (session_id, seq, role, name, content, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, msg["seq"], msg["role"], msg.get("name"), msg["content"], now),
+            )
+
+    def load_messages(self, session_id, before_seq=None, after_seq=0, limit=50):
+        """The `limit` newest messages with after_seq < seq < before_seq, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, name, content FROM messages WHERE session_id = ? AND seq > ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_id, after_seq, before_seq if before_seq is not None else 2 ** 62, limit),
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def count_messages(self, session_id, before_seq=None, after_seq=0):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ? AND seq > ? AND seq < ?",
+                (session_id, after_seq, before_seq if before_seq is not None else 2 ** 62),
+            ).fetchone()[0]
+
+    def max_seq(self, session_id):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    def append_reading(self, session_id, method, question, payload):
+        with self._lock:
+            now = time.time()
+            self._touch(session_id, now)
+            cur = self._conn.execute(
+                "INSERT INTO readings (session_id, method, question, payload, created) VALUES (?, ?, ?, ?, ?)",
+                (session_id, method, question, json.dumps(payload, ensure_ascii=False), now),
+            )
+            return cur.lastrowid
+
+    def load_readings(self, session_id, before_id=None, limit=10, method=None):
+        """The `limit` newest readings with id < before_id, newest first."""
+        query = "SELECT id, method, question, payload, created FROM readings WHERE session_id = ? AND id < ?"
+        params = [session_id, before_id if before_id is not None else 2 ** 62]
+        if method:
+            query += " AND method = ?"
+            params.append(method)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id DESC LIMIT ?", (*params, limit)).fetchall()
+        return [{**dict(row), "payload": json.loads(row["payload"])} for row in rows]
+
+class ResponseCache:
+    """Content-addressed cache of finished LLM replies: an in-memory LRU in front of a SQLite file.
+
+    Keys hash (method, model, system prompt, user prompt), so a reading is reused only when every input
+    that reaches the model is identical. Entries expire after `ttl` seconds; the disk tier drops the
+    least recently used entries once it grows past `max_bytes`.
+
+    With a `shared` backend (see `shared_cache`) a tier shared by every app process sits between the
+    two, and `lead`/`wait_for` let one process generate a missing reply while the others
+    wait for it. Shared-tier failures are logged and treated as misses.
+    """
+
+    def __init__(self, path, memory_items=256, ttl=7 * 86400, max_bytes=64 * 1024 * 1024, shared=None, lease=300.0):
+        self.memory_items = memory_items
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._flight = None
+        if shared is not None:
+            from .shared_cache import SingleFlight
+            self._flight = SingleFlight(shared, lease)
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = collections.OrderedDict()  # key -> (created, payload)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, method TEXT, model TEXT, payload TEXT NOT NULL,
+                size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_by_access ON responses (accessed)")
+
+    @classmethod
+    def from_env(cls):
+        from .shared_cache import open_shared_cache
+        return cls(
+            os.getenv("DIVINATION_CACHE_PATH", "divination_cache.db"),
+            memory_items=int(os.getenv("DIVINATION_CACHE_MEMORY_ITEMS", "256")),
+            ttl=float(os.getenv("DIVINATION_CACHE_TTL", str(7 * 86400))),
+            max_bytes=int(os.getenv("DIVINATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            shared=open_shared_cache(os.getenv("DIVINATION_SHARED_CACHE")),
+            lease=float(os.getenv("DIVINATION_SHARED_CACHE_LEASE", "300")),
+        )
+
+    @staticmethod
+    def make_key(method, model, system_prompt, user_prompt, *extra):
+        """Hash of everything that reaches the model; `extra` components (JSON-serializable) scope a key
+        further without touching the prompt text, and leave keys made without them unchanged."""
+        raw = json.dumps([method, model, system_prompt, user_prompt, *extra], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+        # Network or file I/O happens outside the lock.
+        payload = self._shared_get(key, now)
+        if payload is not None:
+            return payload
+        with self._lock:
+            row = self._conn.execute("SELECT payload, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            payload = json.loads(row[0])
+            self._remember_locked(key, row[1], payload)
+            self.disk_hits += 1
+            return payload
+
+    def put(self, key, payload, method=None, model=None):
+        now = time.time()
+        data = json.dumps(payload, ensure_ascii=False)
+        with self._lock:
+            self._remember_locked(key, now, payload)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, method, model, payload, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, method, model, data, len(data.encode("utf-8")), now, now),
+            )
+            self._evict_disk_locked(now)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, json.dumps([now, payload], ensure_ascii=False).encode("utf-8"), self.ttl)
+            except Exception as e:
+                log.warning("shared cache put failed: %s", e)
+
+    def _shared_get(self, key, now):
+        if self.shared is None:
+            return None
+        try:
+            data = self.shared.get(key)
+        except Exception as e:
+            log.warning("shared cache get failed: %s", e)
+            return None
+        if data is None:
+            return None
+        created, payload = json.loads(data)
+        if now - created > self.ttl:
+            return None
+        with self._lock:
+            self._remember_locked(key, created, payload)
+            self.shared_hits += 1
+        return payload
+
+    def lead(self, key):
+        """Claim the generation of `key`'s reply: a `shared_cache.Lease` to `keep()` while generating and
+        `release()` once the reply is `put`. None means another worker, in any process sharing the tier,
+        holds the lease: `wait_for` it instead. Without a shared tier the lease is local and both are no-ops."""
+        from .shared_cache import Lease
+        if self._flight is None:
+            return Lease(None, key, None)
+        try:
+            return self._flight.acquire(key)
+        except Exception as e:
+            log.warning("shared cache lease failed: %s", e)
+            return Lease(None, key, None)
+
+    def wait_for(self, key, should_stop=None):
+        """The reply another worker is generating for `key`, waiting as long as its lease is kept alive;
+        None if the lease ends without one, after which the caller should try to `lead` again."""
+        if self._flight is None:
+            return None
+        try:
+            return self._flight.wait(key, lambda: self._shared_get(key, time.time()), should_stop=should_stop)
+        except Exception as e:
+            log.warning("shared cache wait failed: %s", e)
+            return None
+
+    def _remember_locked(self, key, created, payload):
+        self._memory[key] = (created, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_disk_locked(self, now):
+        cur = self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self.evictions += max(cur.rowcount, 0)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.shared_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "shared_hits": self.shared_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "evictions": self.evictions,
+            }
+
+# Methods whose readings are a pure function of their prompt and may be served from the cache.
+CACHEABLE_METHODS = set(filter(None, os.getenv("DIVINATION_CACHE_METHODS", "梅花,小六壬,奇门,大六壬,太乙").split(",")))
@@ -0,0 +1,223 @@
+"""Per-call latency and throughput telemetry for upstream model calls.
+
+Every call gets a `CallTimer`; the streaming loops only touch it on the first reasoning and first
+content chunk and otherwise bump two integer counters, so instrumentation costs a few attribute
+writes per chunk. When the call ends the timer becomes one flat record that goes into an in-process
+ring buffer (for the app's dashboard), optionally a JSONL file (DIVINATION_TELEMETRY_PATH) and the
+counters behind `prometheus_text()`, which `serve()` exposes at /metrics (DIVINATION_METRICS_PORT).
+
+Token counts: most providers stream about one token per chunk, so chunk counts stand in for tokens;
+when the API reports `completion_tokens`, that total is split between reasoning and content in
+proportion to their chunk counts.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import threading
+import time
+
+QUANTILES = (0.5, 0.95, 0.99)
+# Record fields summarised per model, with their Prometheus metric names.
+SUMMARY_FIELDS = {
+    "ttft_s": "divination_ttft_seconds",
+    "total_s": "divination_call_seconds",
+    "queue_s": "divination_queue_seconds",
+    "reasoning_tps": "divination_reasoning_tokens_per_second",
+    "content_tps": "divination_content_tokens_per_second",
+}
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list (None when empty)."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class CallTimer:
+    """Timing of one model call. Call `sent()` when the request goes out, `reasoning()`/`content()` per
+    chunk and `finish()` exactly once."""
+
+    __slots__ = ("telemetry", "kind", "model", "session_id", "started", "sent_at", "first_reasoning",
+                 "first_content", "reasoning_chunks", "content_chunks", "finished")
+
+    def __init__(self, telemetry, kind, model, session_id=None):
+        self.telemetry = telemetry
+        self.kind = kind
+        self.model = model
+        self.session_id = session_id
+        self.started = time.perf_counter()
+        self.sent_at = self.first_reasoning = self.first_content = None
+        self.reasoning_chunks = self.content_chunks = 0
+        self.finished = False
+
+    def sent(self):
+        # Retries and hedged duplicates keep the first send time: TTFT is what the caller waited.
+        if self.sent_at is None:
+            self.sent_at = time.perf_counter()
+
+    def reasoning(self):
+        if self.first_reasoning is None:
+            self.first_reasoning = time.perf_counter()
+        self.reasoning_chunks += 1
+
+    def content(self):
+        if self.first_content is None:
+            self.first_content = time.perf_counter()
+        self.content_chunks += 1
+
+    def finish(self, error=None, usage=None):
+        """Close the call; `error` is the exception that ended it (if any), `usage` from `context.usage_numbers`."""
+        if self.finished:
+            return None
+        self.finished = True
+        end = time.perf_counter()
+        sent = self.sent_at or end
+        firsts = [t for t in (self.first_reasoning, self.first_content) if t is not None]
+        reasoning, content = self.reasoning_chunks, self.content_chunks
+        if usage and usage.get("completion_tokens"):
+            chunks = reasoning + content
+            if chunks:
+                reasoning = round(usage["completion_tokens"] * reasoning / chunks)
+                content = usage["completion_tokens"] - reasoning
+            else:
+                content = usage["completion_tokens"]  # non-streaming call
+        if error is None:
+            status = "ok"
+        elif isinstance(error, (GeneratorExit, asyncio.CancelledError, concurrent.futures.CancelledError)):
+            status = "cancelled"
+        else:
+            status = "error"
+        reasoning_end = self.first_content or end
+        record = {
+            "ts": time.time(),
+            "kind": self.kind,
+            "model": self.model,
+            "session_id": self.session_id,
+            "status": status,
+            "error": None if status != "error" else f"{type(error).__name__}: {error}"[:300],
+            "queue_s": round(sent - self.started, 4),
+            "ttft_s": round(min(firsts) - sent, 4) if firsts else None,
+            "total_s": round(end - sent, 4),
+            "reasoning_tokens": reasoning,
+            "content_tokens": content,
+            "reasoning_tps": round(reasoning / (reasoning_end - self.first_reasoning), 2)
+            if self.first_reasoning is not None and reasoning_end > self.first_reasoning else None,
+            "content_tps": round(content / (end - self.first_content), 2)
+            if self.first_content is not None and end > self.first_content else None,
+            **{k: (usage or {}).get(k) for k in ("prompt_tokens", "cached_tokens", "completion_tokens")},
+        }
+        self.telemetry.record(record)
+        return record
+
+
+class Telemetry:
+    """Process-wide sink for call records: ring buffer, cumulative counters and an optional JSONL file."""
+
+    def __init__(self, capacity=5000, jsonl_path=None):
+        self.records = collections.deque(maxlen=capacity)
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._file = None
+        self._counters = collections.Counter()  # (metric, ((label, value), ...)) -> value
+        self._server = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(int(os.getenv("DIVINATION_TELEMETRY_BUFFER", "5000")), os.getenv("DIVINATION_TELEMETRY_PATH") or None)
+
+    def start(self, kind, model, session_id=None):
+        return CallTimer(self, kind, model, session_id)
+
+    def record(self, record):
+        line = json.dumps(record, ensure_ascii=False) if self.jsonl_path else None
+        model = (("model", record["model"]),)
+        labels = model + (("kind", record["kind"]),)
+        with self._lock:
+            self.records.append(record)
+            counters = self._counters
+            counters[("divination_requests_total", labels + (("status", record["status"]),))] += 1
+            for key in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+                if record.get(key):
+                    counters[(f"divination_{key}_total", labels)] += record[key]
+            for field, metric in SUMMARY_FIELDS.items():
+                # Like the windowed quantiles, summaries cover successful calls only.
+                if record["status"] == "ok" and record.get(field) is not None:
+                    counters[(f"{metric}_sum", model)] += record[field]
+                    counters[(f"{metric}_count", model)] += 1
+            if line is not None:
+                if self._file is None:
+                    self._file = open(self.jsonl_path, "a", encoding="utf-8", buffering=1)
+                self._file.write(line + "\n")
+
+    def recent(self, window_s=None, model=None):
+        """Records of the last `window_s` seconds (all buffered records if None), oldest first."""
+        cutoff = time.time() - window_s if window_s else 0
+        with self._lock:
+            return [r for r in self.records if r["ts"] >= cutoff and (model is None or r["model"] == model)]
+
+    def summary(self, window_s=900):
+        """Per model over the sliding window: call counts, error rate and p50/p95/p99 of each timing field."""
+        by_model = collections.defaultdict(list)
+        for r in self.recent(window_s):
+            by_model[r["model"]].append(r)
+        out = {}
+        for model, records in sorted(by_model.items()):
+            finished = [r for r in records if r["status"] != "cancelled"]
+            errors = sum(r["status"] == "error" for r in finished)
+            stats = {"calls": len(records), "errors": errors, "error_rate": errors / len(finished) if finished else 0.0}
+            ok = [r for r in finished if r["status"] == "ok"]
+            for field in SUMMARY_FIELDS:
+                values = sorted(r[field] for r in ok if r.get(field) is not None)
+                stats[field] = {q: percentile(values, q) for q in QUANTILES}
+            out[model] = stats
+        return out
+
+    def prometheus_text(self, window_s=900):
+        """Prometheus text exposition: cumulative counters plus windowed quantiles per model."""
+        def labels(pairs):
+            return ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+        quantiles = self.summary(window_s)
+        lines = []
+        for metric in sorted({m for (m, _), _ in counters if m.endswith("_total")}):
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f"{m}{{{labels(pairs)}}} {value:g}" for (m, pairs), value in counters if m == metric)
+        for field, metric in SUMMARY_FIELDS.items():
+            lines.append(f"# TYPE {metric} summary")
+            for model, stats in quantiles.items():
+                lines.extend(f"{metric}{{{labels((('model', model), ('quantile', q)))}}} {value:g}"
+                             for q, value in stats[field].items() if value is not None)
+            lines.extend(f"{m}{{{labels(pairs)}}} {value:g}" for (m, pairs), value in counters
+                         if m in (f"{metric}_sum", f"{metric}_count"))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve `prometheus_text()` at http://host:port/metrics from a daemon thread (idempotent)."""
+        if self._server is not None:
+            return self._server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="divination-metrics", daemon=True).start()
+        return self._server
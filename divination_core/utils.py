@@ -0,0 +1,42 @@
+"""Small helpers shared by the app, the engine and the batch CLI."""
+import threading
+
+def estimate_tokens(text):
+    """Cheap token estimate: ~1 token per CJK character, ~4 ASCII characters per token."""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + ascii_chars // 4 + 1
+
+def truncate_to_tokens(text, budget):
+    """Keep the head of `text` within roughly `budget` tokens."""
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + "…"
+
+class HitRateCounter:
+    """Thread-safe hit/miss counter shared by every session in the process."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,100 @@
+"""Statistical checks of the casting engine (the pytest side of `python -m divination_core.casting check`)."""
+import math
+
+import numpy as np
+import pytest
+
+from divination_core.casting import (
+    COINS_TO_LINE, LINE_PROBABILITIES, DivinationEngine, RngStreams, cast_liuyao_batch, chi2_goodness,
+    chi2_independence, chi2_sf,
+)
+
+CASTS = 50_000  # 300k lines: enough power for 1/8 vs 3/8 while the suite stays well under a second
+ALPHA = 1e-4
+SEED = 20240101
+PROBS = [LINE_PROBABILITIES[v] for v in range(4)]
+
+
+@pytest.fixture(scope="module")
+def streams():
+    return RngStreams(SEED)
+
+
+@pytest.fixture(scope="module")
+def lines(streams):
+    return cast_liuyao_batch(CASTS, streams.generator("test"))
+
+
+def test_chi2_sf_matches_known_quantiles():
+    # Upper 5% points of the chi-square distribution.
+    for df, x in [(1, 3.841), (3, 7.815), (6, 12.592), (9, 16.919)]:
+        assert chi2_sf(x, df) == pytest.approx(0.05, abs=1e-3)
+    assert chi2_sf(0, 3) == 1.0
+
+
+def test_coins_map_to_line_probabilities():
+    # Every 3-coin outcome is equally likely, so COINS_TO_LINE alone fixes the line distribution.
+    for value, p in LINE_PROBABILITIES.items():
+        assert COINS_TO_LINE.count(value) / 8 == p
+
+
+def test_line_value_frequencies(lines):
+    assert lines.shape == (CASTS, 6) and lines.dtype == np.uint8
+    _, p = chi2_goodness(np.bincount(lines.ravel(), minlength=4).tolist(), PROBS)
+    assert p >= ALPHA
+
+
+@pytest.mark.parametrize("position", range(6))
+def test_line_frequencies_per_position(lines, position):
+    _, p = chi2_goodness(np.bincount(lines[:, position], minlength=4).tolist(), PROBS)
+    assert p >= ALPHA
+
+
+def test_adjacent_lines_independent(lines):
+    for position in range(5):
+        pair = np.bincount(lines[:, position] * 4 + lines[:, position + 1], minlength=16).reshape(4, 4)
+        _, p = chi2_independence(pair.tolist())
+        assert p >= ALPHA, f"lines {position + 1}/{position + 2}"
+
+
+def test_moving_lines_binomial(lines):
+    moving = np.bincount((lines >= 2).sum(axis=1), minlength=7)
+    binomial = [math.comb(6, k) * 0.25 ** k * 0.75 ** (6 - k) for k in range(7)]
+    _, p = chi2_goodness(moving.tolist(), binomial)
+    assert p >= ALPHA
+
+
+def test_session_streams_independent(streams):
+    a = cast_liuyao_batch(CASTS, streams.generator("session-a")).ravel()
+    b = cast_liuyao_batch(CASTS, streams.generator("session-b")).ravel()
+    assert not np.array_equal(a, b)
+    _, p = chi2_independence(np.bincount(a * 4 + b, minlength=16).reshape(4, 4).tolist())
+    assert p >= ALPHA
+
+
+def test_roots_independent():
+    # The same key under two root seeds must not correlate either.
+    a = cast_liuyao_batch(CASTS, RngStreams(1).generator("session")).ravel()
+    b = cast_liuyao_batch(CASTS, RngStreams(2).generator("session")).ravel()
+    _, p = chi2_independence(np.bincount(a * 4 + b, minlength=16).reshape(4, 4).tolist())
+    assert p >= ALPHA
+
+
+def test_deterministic_per_seed_and_key():
+    first = cast_liuyao_batch(1000, RngStreams(SEED).generator("replay"))
+    assert np.array_equal(first, cast_liuyao_batch(1000, RngStreams(SEED).generator("replay")))
+    assert not np.array_equal(first, cast_liuyao_batch(1000, RngStreams(SEED + 1).generator("replay")))
+
+
+def test_session_generator_continues_stream():
+    streams = RngStreams(SEED)
+    rng = streams.for_session("s")
+    assert streams.for_session("s") is rng
+    expected = cast_liuyao_batch(2, RngStreams(SEED).generator("s"))
+    cast = [cast_liuyao_batch(1, rng)[0], cast_liuyao_batch(1, streams.for_session("s"))[0]]
+    assert np.array_equal(np.stack(cast), expected)
+
+
+def test_single_cast_matches_batch():
+    lines, _ = DivinationEngine.cast_liuyao_coin(RngStreams(SEED).generator("single"))
+    assert lines == cast_liuyao_batch(1, RngStreams(SEED).generator("single"))[0].tolist()
@@ -0,0 +1,71 @@
+"""ClientPool eviction must never close a client that still has a request in flight."""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+
+from divination_core.clients import ClientPool
+from divination_core.mock_server import MockConfig, MockServer
+
+MESSAGES = [{"role": "user", "content": "问"}]
+
+
+@pytest.fixture(scope="module")
+def mock():
+    server = MockServer(MockConfig(ttft=0.0, tps=50.0, reasoning_tokens=0, content_tokens=20, jitter=0.0)).start()
+    yield server
+    server.stop()
+
+
+def in_use(pool):
+    return [c["in_use"] for c in pool.stats()["clients"]]
+
+
+def test_streaming_client_survives_idle_eviction(mock):
+    pool = ClientPool(idle_ttl=0.05)
+    client = pool.get("sk-test", mock.base_url)
+    stream = client.chat.completions.create(model="m", messages=MESSAGES, stream=True)
+    chunks = [next(iter(stream))]
+    assert in_use(pool) == [1]
+    time.sleep(0.1)  # well past idle_ttl since the lookup
+    pool.evict_idle()
+    assert pool.evictions == 0
+    chunks += list(stream)  # the client is still open, so the stream completes
+    assert "".join(c.choices[0].delta.content or "" for c in chunks if c.choices) == "答" * 20
+    assert in_use(pool) == [0]
+    time.sleep(0.1)
+    pool.evict_idle()
+    assert pool.evictions == 1 and in_use(pool) == []
+
+
+def test_abandoned_and_failed_requests_release(mock):
+    pool = ClientPool(idle_ttl=60)
+    client = pool.get("sk-test", mock.base_url)
+    stream = client.chat.completions.create(model="m", messages=MESSAGES, stream=True)
+    next(iter(stream))
+    stream.close()
+    client.chat.completions.create(model="m", messages=MESSAGES)
+    with pytest.raises(Exception):
+        pool.get("sk-test", "http://127.0.0.1:9/v1").chat.completions.create(model="m", messages=MESSAGES)
+    assert in_use(pool) == [0, 0]
+
+
+def test_async_client_in_use(mock):
+    pool = ClientPool(idle_ttl=0.05)
+
+    async def run():
+        client = pool.get_async("sk-test", mock.base_url)
+        stream = await client.chat.completions.create(model="m", messages=MESSAGES, stream=True)
+        await stream.__anext__()
+        counts = in_use(pool)
+        await asyncio.sleep(0.1)
+        pool.evict_idle()
+        evictions = pool.evictions
+        async for _ in stream:
+            pass
+        return counts, evictions
+
+    counts, evictions = asyncio.run(run())
+    assert counts == [1] and evictions == 0 and in_use(pool) == [0]
@@ -0,0 +1,136 @@
+"""RoundtableEngine against the local mock chat-completions server: quorum, deadline, hedging, cancellation."""
+import asyncio
+import concurrent.futures
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+
+from divination_core.clients import ClientPool
+from divination_core.engine import RoundtableEngine, new_stream_state
+from divination_core.mock_server import MockConfig, MockServer
+from divination_core.scheduler import ModelScheduler
+
+MODELS = {
+    "fast-a": {"ttft": 0.05},
+    "fast-b": {"ttft": 0.1},
+    "slow": {"ttft": 5.0},
+    "laggy": {"ttft": 0.6},
+    "long": {"tps": 20.0, "content_tokens": 200},
+}
+MESSAGES = [{"role": "system", "content": "你是易学大师。"}, {"role": "user", "content": "问前程"}]
+
+
+@pytest.fixture(scope="module")
+def mock():
+    server = MockServer(MockConfig(ttft=0.05, tps=0, reasoning_tokens=5, content_tokens=10, jitter=0.0,
+                                   models=MODELS, seed=0)).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def scheduler():
+    return ModelScheduler({"max_inflight": 4, "rpm": 600, "tpm": 10_000_000})
+
+
+@pytest.fixture
+def engine(mock, scheduler):
+    engine = RoundtableEngine(ClientPool(), scheduler, base_url=mock.base_url)
+    yield engine
+    stop(engine)
+
+
+def stop(engine):
+    # Let closing streams finish before the loop goes away.
+    asyncio.run_coroutine_threadsafe(engine.loop.shutdown_asyncgens(), engine.loop).result(5)
+    engine.loop.call_soon_threadsafe(engine.loop.stop)
+
+
+def run_panel(engine, models, timeout=10, **kwargs):
+    states = {model: new_stream_state() for model in models}
+    started = time.monotonic()
+    engine.submit_panel("sk-test", "s1", models, MESSAGES, states, **kwargs).result(timeout)
+    return states, time.monotonic() - started
+
+
+def assert_settled(scheduler, timeout=2.0):
+    # Losing hedges release their slot from a done-callback, a moment after the panel returns.
+    deadline = time.monotonic() + timeout
+    while any(s["inflight"] for s in scheduler.stats().values()) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert {model: s["inflight"] for model, s in scheduler.stats().items()} == dict.fromkeys(scheduler.stats(), 0)
+
+
+def test_panel_streams_every_model(engine, scheduler):
+    states, _ = run_panel(engine, ["fast-a", "fast-b"])
+    for state in states.values():
+        assert state["done"] and state["error"] is None
+        assert "".join(state["reasoning"]) == "想" * 5 and "".join(state["content"]) == "答" * 10
+        assert state["usage"]["completion_tokens"] == 15 and state["sent_messages"] == 2
+    assert_settled(scheduler)
+
+
+def test_quorum_cancels_slowest(engine, scheduler):
+    states, elapsed = run_panel(engine, ["fast-a", "fast-b", "slow"], quorum=2)
+    assert elapsed < 2.0
+    assert states["fast-a"]["error"] is None and states["fast-b"]["error"] is None
+    assert states["slow"]["cancelled"] and states["slow"]["done"] and not states["slow"]["content"]
+    assert_settled(scheduler)
+
+
+def test_deadline_times_out(engine, scheduler):
+    states, elapsed = run_panel(engine, ["fast-a", "slow"], deadline=0.5)
+    assert elapsed < 2.0
+    assert states["fast-a"]["error"] is None
+    assert states["slow"]["done"] and "超时" in states["slow"]["error"] and not states["slow"]["cancelled"]
+    assert_settled(scheduler)
+
+
+def test_hedge_fires(engine, scheduler, mock):
+    before = mock.counters["requests"]
+    states, _ = run_panel(engine, ["laggy"], hedge_after=0.2)
+    state = states["laggy"]
+    assert state["hedged"] and state["error"] is None and "".join(state["content"]) == "答" * 10
+    assert mock.counters["requests"] - before == 2
+    assert_settled(scheduler)
+
+
+def test_no_hedge_when_first_chunk_is_early(engine, scheduler):
+    states, _ = run_panel(engine, ["fast-a"], hedge_after=0.5)
+    assert not states["fast-a"]["hedged"]
+    assert_settled(scheduler)
+
+
+def test_cancel_mid_panel(engine, scheduler):
+    states = {model: new_stream_state() for model in ["fast-a", "long"]}
+    future = engine.submit_panel("sk-test", "s1", list(states), MESSAGES, states)
+    deadline = time.monotonic() + 5
+    while not states["long"]["content"] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert states["long"]["content"], "the long stream never started"
+    future.cancel()
+    with pytest.raises(concurrent.futures.CancelledError):
+        future.result(5)
+    deadline = time.monotonic() + 2
+    while not states["long"]["done"] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert states["long"]["cancelled"] and states["long"]["error"] == "已取消"
+    assert len(states["long"]["content"]) < 200
+    assert states["fast-a"]["error"] is None
+    assert_settled(scheduler)
+
+
+def test_queued_beyond_max_inflight(mock):
+    scheduler = ModelScheduler({"max_inflight": 1, "rpm": 600, "tpm": 10_000_000})
+    engine = RoundtableEngine(ClientPool(), scheduler, base_url=mock.base_url)
+    try:
+        states = [{"fast-a": new_stream_state()} for _ in range(3)]
+        futures = [engine.submit_panel("sk-test", f"s{i}", ["fast-a"], MESSAGES, state) for i, state in enumerate(states)]
+        for future in futures:
+            future.result(10)
+        assert all(state["fast-a"]["error"] is None for state in states)
+        assert_settled(scheduler)
+    finally:
+        stop(engine)
@@ -0,0 +1,96 @@
+"""The 干支 day index against lunar_python, on a small range built per test session (the full build takes minutes)."""
+import datetime
+
+import numpy as np
+import pytest
+
+pytest.importorskip("lunar_python")
+
+from divination_core.ganzhi import JIEQI, ganzhi_info_from_lunar, ganzhi_name, pillars
+from divination_core.ganzhi_index import GanZhiIndex, verify
+
+# Dec 2023 .. Mar 2025: two 立春 (2024-02-04 16:27, 2025-02-03 22:10), one after and one before
+# its lunar new year (2024-02-10, 2025-01-29), and the 冬至/小寒 turn of two calendar years.
+FIRST = datetime.date(2023, 12, 1)
+LAST = datetime.date(2025, 3, 31)
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    path = tmp_path_factory.mktemp("ganzhi") / "index.npy"
+    GanZhiIndex.build(workers=2, first_day=FIRST, last_day=LAST).save(path)
+    return GanZhiIndex.load(path, FIRST, LAST)
+
+
+def days(index):
+    return [index.first_day + datetime.timedelta(days=i) for i in range(len(index.table))]
+
+
+def test_load_checks_range(index, tmp_path):
+    path = tmp_path / "index.npy"
+    index.save(path)
+    with pytest.raises(ValueError):
+        GanZhiIndex.load(path)  # the default range is the full 1900 .. 2100 table
+    assert index.covers(datetime.datetime(2024, 6, 1)) and not index.covers(datetime.datetime(2025, 4, 1))
+
+
+def test_every_day_matches_lunar_python(index):
+    for day in days(index):
+        for hour, minute in [(0, 0), (11, 59), (22, 59)]:
+            dt = datetime.datetime(day.year, day.month, day.day, hour, minute)
+            assert index.lookup(dt) == ganzhi_info_from_lunar(dt), dt
+
+
+def test_zi_hour_rollover(index):
+    # 23:00 starts the next day's 子时: its stem follows the next day's, but the day pillar waits for midnight.
+    for day in days(index)[:-1:3]:
+        late = datetime.datetime(day.year, day.month, day.day, 23)
+        before, at, end = late - datetime.timedelta(seconds=1), late, late + datetime.timedelta(minutes=59, seconds=59)
+        midnight = late + datetime.timedelta(hours=1)
+        for dt in (before, at, end, midnight):
+            assert index.lookup(dt) == ganzhi_info_from_lunar(dt), dt
+        assert index.lookup(before)["hour_zhi"] == "亥" and index.lookup(at)["hour_zhi"] == "子"
+        assert pillars(index.lookup(at))[3] == pillars(index.lookup(midnight))[3]
+        assert pillars(index.lookup(end))[2] == pillars(index.lookup(before))[2] != pillars(index.lookup(midnight))[2]
+
+
+def test_jieqi_switch_seconds(index):
+    switches = np.nonzero(np.asarray(index.table["jq_sec"]) >= 0)[0]
+    assert len(switches) == 32  # two 节气 a month over 16 months
+    for i in switches:
+        day = index.first_day + datetime.timedelta(days=int(i))
+        moment = datetime.datetime(day.year, day.month, day.day) + datetime.timedelta(seconds=int(index.table["jq_sec"][i]))
+        before, at = moment - datetime.timedelta(seconds=1), moment
+        assert index.lookup(before) == ganzhi_info_from_lunar(before), before
+        assert index.lookup(at) == ganzhi_info_from_lunar(at), at
+        assert JIEQI.index(index.lookup(at)["solar_term"]) == (JIEQI.index(index.lookup(before)["solar_term"]) + 1) % 24
+
+
+@pytest.mark.parametrize("eve, lichun, year_before, year_after", [
+    (datetime.date(2024, 2, 3), datetime.datetime(2024, 2, 4, 16, 27), "癸卯", "癸卯"),
+    (datetime.date(2025, 2, 2), datetime.datetime(2025, 2, 3, 22, 10), "乙巳", "乙巳"),
+])
+def test_lichun_boundary(index, eve, lichun, year_before, year_after):
+    # The month pillar turns to 寅 on the day of 立春; the year pillar follows the lunar new year instead.
+    before = index.lookup(datetime.datetime(eve.year, eve.month, eve.day, 12))
+    after = index.lookup(lichun + datetime.timedelta(minutes=1))
+    assert pillars(before)[1][1] == "丑" and pillars(after)[1][1] == "寅"
+    assert pillars(before)[0] == year_before and pillars(after)[0] == year_after
+    assert index.lookup(lichun - datetime.timedelta(minutes=1))["solar_term"] == "大寒"
+    assert after["solar_term"] == "立春"
+
+
+def test_lookup_batch_matches_lookup(index):
+    cases = [datetime.datetime(d.year, d.month, d.day, h, 30) for d in days(index)[::7] for h in (0, 1, 12, 22, 23)]
+    batch = index.lookup_batch(cases)
+    for i, dt in enumerate(cases):
+        single = index.lookup(dt)
+        assert pillars(single) == tuple(ganzhi_name(batch[k][i]) for k in ("year", "month", "day", "hour"))
+        assert single["solar_term"] == JIEQI[batch["jieqi"][i]]
+    with pytest.raises(ValueError):
+        index.lookup_batch([datetime.datetime(2025, 4, 1)])
+
+
+def test_verify(index):
+    checked, mismatches = verify(index, samples=200)
+    assert checked > 200 and mismatches == []
@@ -0,0 +1,83 @@
+"""JobQueue: dedup by key, ensembles submitted all or nothing, `after` dependencies and cancellation."""
+import threading
+
+import pytest
+
+from divination_core.jobs import JobQueue
+
+
+@pytest.fixture
+def queue():
+    return JobQueue(workers=8, ttl=60)
+
+
+@pytest.fixture
+def gate():
+    event = threading.Event()
+    yield event
+    event.set()  # never leave workers blocked
+
+
+def blocking(gate):
+    def target(job):
+        gate.wait(5)
+        job.content.append(job.meta.get("model", ""))
+    return target
+
+
+def members(gate, *keys):
+    return [{"target": blocking(gate), "key": key, "model": key} for key in keys]
+
+
+def test_submit_dedups_unfinished_key(queue, gate):
+    first = queue.submit("s", blocking(gate), key="k")
+    assert queue.submit("s", blocking(gate), key="k") is first
+    assert queue.submit("other", blocking(gate), key="k") is not first
+    gate.set()
+    assert first.wait(5) and first.status == "done"
+    assert queue.submit("s", blocking(gate), key="k") is not first  # finished jobs are not reused
+
+
+def test_ensemble_reattaches_when_every_member_matches(queue, gate):
+    old = queue.submit_all("s", members(gate, "a", "b"), group="g1")
+    again = queue.submit_all("s", members(gate, "b", "a"), group="g2")
+    assert {job.id for job in again} == {job.id for job in old}
+    assert {job.group for job in again} == {"g1"}
+
+
+def test_ensemble_partial_match_starts_fresh(queue, gate):
+    old = queue.submit_all("s", members(gate, "a", "b"), group="g1")
+    # "a" is still running in g1, "c" is new: the whole ensemble starts over under g2.
+    mixed = queue.submit_all("s", members(gate, "a", "c"), group="g2")
+    assert [job.group for job in mixed] == ["g2", "g2"]
+    assert not {job.id for job in mixed} & {job.id for job in old}
+    assert [job.meta["model"] for job in queue.group("g2")] == ["a", "c"]
+    assert [job.meta["model"] for job in queue.group("g1")] == ["a", "b"]
+    gate.set()
+    assert all(job.wait(5) and job.status == "done" for job in old + mixed)
+
+
+def test_ensemble_matching_jobs_from_two_groups_starts_fresh(queue, gate):
+    a = queue.submit("s", blocking(gate), key="a", group="g1")
+    b = queue.submit("s", blocking(gate), key="b", group="g2")
+    jobs = queue.submit_all("s", members(gate, "a", "b"), group="g3")
+    assert [job.group for job in jobs] == ["g3", "g3"] and a not in jobs and b not in jobs
+
+
+def test_consensus_waits_for_its_own_group(queue, gate):
+    jobs = queue.submit_all("s", members(gate, "a", "b"), group="g1")
+    seen = []
+    consensus = queue.submit("s", lambda job: seen.extend(j.text()[1] for j in jobs), group="g1", after=jobs)
+    assert consensus.status == "queued"
+    gate.set()
+    assert consensus.wait(5) and consensus.status == "done" and seen == ["a", "b"]
+    assert [job.id for job in queue.group("g1")] == [jobs[0].id, jobs[1].id, consensus.id]
+
+
+def test_cancel(queue, gate):
+    job = queue.submit("s", blocking(gate))
+    queued = queue.submit("s", blocking(gate), after=[job])
+    assert queue.cancel(queued.id) and queue.cancel(job.id)
+    gate.set()
+    assert job.wait(5) and queued.wait(5)
+    assert job.status == "cancelled" and queued.status == "cancelled" and not queue.cancel(job.id)
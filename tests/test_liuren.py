@@ -0,0 +1,57 @@
+"""大六壬 三传 for each of the 九宗门, checked against hand-worked 课式."""
+import pytest
+
+from divination_core.liuren import XING, chong, liuren_plate, yuejiang
+
+
+def chuan(day, hour, term):
+    plate = liuren_plate(day, hour, term)
+    return plate["rule"], "".join(t["branch"] for t in plate["transmissions"])
+
+
+def test_yuejiang():
+    assert (yuejiang("冬至"), yuejiang("大寒"), yuejiang("雨水"), yuejiang("小雪")) == ("丑", "子", "亥", "寅")
+
+
+@pytest.mark.parametrize("day, hour, term, expected", [
+    # 冬至 puts 丑 on the 丑 hour: heaven sits on earth.
+    ("壬子", "辛丑", "冬至", "亥子卯"),  # no 克, 阳日 干上 亥 自刑 -> 支上 子 -> 刑 卯
+    ("丁卯", "辛丑", "冬至", "卯子午"),  # 阴日 支上 卯, 刑 子; 子 would 刑 卯 again, so 末传 is the 中传's 冲
+    ("乙卯", "丁丑", "冬至", "辰戌未"),  # 乙 克 its 寄宫 辰; 辰 自刑 and 干上 is 辰 again -> 冲 戌 -> 刑 未
+    ("甲子", "乙丑", "冬至", "寅巳申"),
+])
+def test_fuyin(day, hour, term, expected):
+    assert chuan(day, hour, term) == ("伏吟", expected)
+
+
+def test_fuyin_never_repeats():
+    for first, middle in XING.items():
+        if XING.get(middle) == first:
+            assert chong(middle) not in (first, middle)
+    for day in ("乙卯", "丁卯", "己卯", "辛卯", "癸卯", "壬子", "丙子"):
+        plate = liuren_plate(day, "丁丑", "冬至")
+        branches = [t["branch"] for t in plate["transmissions"]]
+        assert plate["rule"] == "伏吟" and len(set(branches)) == 3, (day, branches)
+
+
+@pytest.mark.parametrize("day, hour, term, rule, expected", [
+    ("甲子", "甲子", "大暑", "返吟", "寅申寅"),
+    ("辛未", "戊子", "大暑", "返吟（无依）", "巳丑辰"),
+    # 冬至 丑将 on 子 hour: 课 卯/甲 辰/卯 丑/子 寅/丑; only 辰 is 克 from below.
+    ("甲子", "甲子", "冬至", "重审", "辰巳午"),
+    ("甲子", "甲子", "春分", "元首", "戌申午"),
+    ("甲子", "甲子", "雨水", "比用", "子亥戌"),
+    ("丁卯", "庚子", "冬至", "涉害", "辰巳午"),
+    ("丙寅", "戊子", "谷雨", "遥克", "亥申巳"),
+    # 丁 寄 未, so 丁未 is 八专: 阴日 counts back three from the fourth 课's 上神, then 干上 twice.
+    ("丁未", "庚子", "雨水", "八专", "卯午午"),
+    ("辛未", "戊子", "谷雨", "别责", "亥未未"),
+    # 戊辰 with 丑将 on 子: no 克 and no 遥克; 阳日 takes what stands over 酉 (戌), then 支上 巳, 干上 午.
+    ("戊辰", "壬子", "冬至", "昴星", "戌巳午"),
+])
+def test_nine_gates(day, hour, term, rule, expected):
+    assert chuan(day, hour, term) == (rule, expected)
+
+
+def test_plate_is_cached_per_shichen():
+    assert liuren_plate("甲子", "甲子", "冬至") is liuren_plate("甲子", "甲子", "冬至")
@@ -0,0 +1,81 @@
+"""六爻纳甲 charts against traditional ones: palaces, 世应, 纳甲, 六亲, 六神, 旬空 and 伏神."""
+import pytest
+
+from divination_core.najia import GENERATION, HEXAGRAM_TITLES, PALACE, format_chart, hexagram_index, hexagram_name, najia_chart
+
+
+def column(chart, field):
+    return [line[field] for line in chart["lines"]]
+
+
+def test_every_hexagram_has_one_palace():
+    assert None not in PALACE and len(set(HEXAGRAM_TITLES)) == 64
+    assert sorted(GENERATION).count(0) == 8  # one 本宫 per palace
+
+
+@pytest.mark.parametrize("name, index", [
+    ("天风姤", 0b111110), ("地火明夷", 0b000101), ("风泽中孚", 0b110011), ("泽雷随", 0b011001),
+    ("山风蛊", 0b100110), ("天火同人", 0b111101), ("水地比", 0b010000), ("雷泽归妹", 0b001011),
+])
+def test_names(name, index):
+    assert hexagram_name(index) == name
+
+
+def test_line_values_carry_the_hexagram():
+    # 少阴 0, 少阳 1, 老阴 2, 老阳 3: bit 0 is the line, bit 1 says it moves.
+    assert hexagram_index([3, 0, 2, 1, 1, 0]) == (0b011001, 0b000101)
+
+
+def test_pure_hexagram():
+    chart = najia_chart([1] * 6, "甲", "子")
+    assert (chart["name"], chart["palace"], chart["generation"], chart["palace_element"]) == ("乾为天", "乾", "本宫", "金")
+    assert (chart["shi"], chart["ying"]) == (6, 3)
+    assert column(chart, "stem") == list("甲甲甲壬壬壬") and column(chart, "branch") == list("子寅辰午申戌")
+    assert column(chart, "liuqin") == ["子孙", "妻财", "父母", "官鬼", "兄弟", "父母"]
+    assert column(chart, "liushen") == ["青龙", "朱雀", "勾陈", "螣蛇", "白虎", "玄武"]
+    assert chart["xunkong"] == "戌亥" and column(chart, "empty") == [False] * 5 + [True]
+    assert column(chart, "mark") == ["", "", "应", "", "", "世"]
+    assert chart["fushen"] == [] and chart["changed"] is None
+
+
+def test_wandering_soul_with_fushen():
+    # 火地晋, 乾宫游魂: no 子孙 in the hexagram, so 乾为天's 甲子水 lies hidden under the first line.
+    chart = najia_chart([0, 0, 0, 1, 0, 1], "庚", "午")
+    assert (chart["name"], chart["palace"], chart["generation"]) == ("火地晋", "乾", "游魂")
+    assert (chart["shi"], chart["ying"]) == (4, 1)
+    assert [l["stem"] + l["branch"] for l in chart["lines"]] == ["乙未", "乙巳", "乙卯", "己酉", "己未", "己巳"]
+    assert column(chart, "liuqin") == ["父母", "官鬼", "妻财", "兄弟", "父母", "官鬼"]
+    assert column(chart, "liushen") == ["白虎", "玄武", "青龙", "朱雀", "勾陈", "螣蛇"]
+    assert chart["xunkong"] == "戌亥"  # 庚午 is still in the 甲子 旬
+    assert chart["fushen"] == [{"position": 1, "liuqin": "子孙", "stem": "甲", "branch": "子", "element": "水"}]
+    assert "伏神：子孙甲子水 伏于第1爻下" in format_chart(chart)
+
+
+def test_returning_soul():
+    # 火天大有, 乾宫归魂: 世 on the third line, every relation present.
+    chart = najia_chart([1, 1, 1, 1, 0, 1], "丙", "寅")
+    assert (chart["name"], chart["palace"], chart["generation"]) == ("火天大有", "乾", "归魂")
+    assert (chart["shi"], chart["ying"]) == (3, 6)
+    assert [l["stem"] + l["branch"] for l in chart["lines"]] == ["甲子", "甲寅", "甲辰", "己酉", "己未", "己巳"]
+    assert column(chart, "liuqin") == ["子孙", "妻财", "父母", "兄弟", "父母", "官鬼"]
+    assert column(chart, "liushen")[0] == "朱雀" and chart["fushen"] == []
+
+
+def test_moving_lines_keep_the_primary_palace():
+    # 乾为天 with a moving top line becomes 泽天夬 of the 坤 palace; its 未土 is still read from 乾 (金): 父母.
+    chart = najia_chart([1, 1, 1, 1, 1, 3], "甲", "子")
+    assert chart["changed"] == {"index": 0b011111, "name": "泽天夬", "palace": "坤", "generation": "五世"}
+    top = chart["lines"][5]
+    assert top["moving"] and top["changed"] == {"yang": False, "stem": "丁", "branch": "未", "element": "土", "liuqin": "父母"}
+    assert najia_chart([1, 1, 1, 1, 1, 1], "甲", "子")["lines"][5]["liuqin"] == "父母"
+    assert all("changed" not in line for line in chart["lines"][:5])
+    assert "变卦：泽天夬（坤宫·五世）" in format_chart(chart)
+    assert "→ 父母丁未土" in format_chart(chart)
+
+
+def test_moving_yin_line():
+    # 坤为地 with a moving first line: 地雷复, same palace, 子水 seen from 坤 (土) is 妻财.
+    chart = najia_chart([2, 0, 0, 0, 0, 0], "戊", "辰")
+    assert chart["changed"]["name"] == "地雷复" and chart["changed"]["generation"] == "一世"
+    assert chart["lines"][0]["changed"]["branch"] == "子" and chart["lines"][0]["changed"]["liuqin"] == "妻财"
+    assert column(chart, "liushen")[0] == "勾陈"
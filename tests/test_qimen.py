@@ -0,0 +1,50 @@
+"""时家奇门 plates: 局数 by 节气 and 元, 值符/值使, and 中五 寄坤二."""
+import pytest
+
+from divination_core.qimen import qimen_plate
+
+
+@pytest.mark.parametrize("day, term, dun, yuan, ju", [
+    ("丁卯", "冬至", "阳遁", "上元", 1),  # 符头 甲子
+    ("己巳", "惊蛰", "阳遁", "中元", 7),  # 符头 己巳
+    ("庚午", "惊蛰", "阳遁", "中元", 7),  # still 己巳's 元
+    ("甲辰", "立春", "阳遁", "下元", 2),
+    ("己卯", "夏至", "阴遁", "上元", 9),
+    ("甲申", "霜降", "阴遁", "中元", 8),
+])
+def test_ju(day, term, dun, yuan, ju):
+    plate = qimen_plate(day, "甲子", term)
+    assert (plate["dun"], plate["yuan"], plate["ju"]) == (dun, yuan, ju)
+
+
+def test_earth_plate_runs_with_the_dun():
+    yang = qimen_plate("丁卯", "甲辰", "冬至")["palaces"]
+    assert "".join(yang[p]["earth"] for p in range(1, 10)) == "戊己庚辛壬癸丁丙乙"
+    yin = qimen_plate("己卯", "甲子", "夏至")["palaces"]
+    assert "".join(yin[p]["earth"] for p in range(9, 0, -1)) == "戊己庚辛壬癸丁丙乙"
+
+
+def test_zhifu_zhishi():
+    # 阳遁一局 甲子日 丙寅时: 天蓬 goes onto 丙 (艮八), 休门 walks 子丑寅 from 坎一 to 震三.
+    plate = qimen_plate("甲子", "丙寅", "冬至")
+    assert (plate["xunshou"], plate["zhifu"], plate["zhishi"]) == ("甲子戊", "天蓬", "休门")
+    assert (plate["zhifu_palace"], plate["zhishi_palace"]) == (8, 3)
+    assert plate["palaces"][8]["star"] == "天蓬" and plate["palaces"][8]["heaven"] == "戊"
+    assert plate["palaces"][8]["deity"] == "值符" and plate["palaces"][3]["door"] == "休门"
+    assert plate["xunkong"] == "戌亥" and plate["yima"] == "申"
+
+
+def test_zhifu_on_the_hour_of_the_xunshou():
+    plate = qimen_plate("甲子", "甲子", "冬至")
+    assert (plate["zhifu_palace"], plate["zhishi_palace"]) == (1, 1)
+    assert all(plate["palaces"][p]["heaven"] == plate["palaces"][p]["earth"] for p in (1, 3, 4, 6, 7, 8, 9))
+
+
+def test_center_lodges_in_kun():
+    # 阳遁一局 puts 壬 in 中五, so the 甲辰 旬 has 天禽 as 值符 and 坤二's 死门 as 值使.
+    plate = qimen_plate("丁卯", "甲辰", "冬至")
+    assert (plate["xunshou"], plate["zhifu"], plate["zhishi"]) == ("甲辰壬", "天禽", "死门")
+    assert (plate["zhifu_palace"], plate["zhishi_palace"]) == (2, 2)
+    kun = plate["palaces"][2]
+    assert (kun["star"], kun["heaven"], kun["door"], kun["deity"]) == ("天芮禽", "己壬", "死门", "值符")
+    assert plate["palaces"][5] == {"name": "中五宫", "earth": "壬", "heaven": "", "star": "", "door": "", "deity": ""}
@@ -0,0 +1,194 @@
+"""The shared cache tier on both backends: an mmap file in tmp_path and an in-process RESP stand-in."""
+import collections
+import multiprocessing
+import threading
+import time
+import uuid
+
+import pytest
+
+from divination_core.shared_cache import (
+    MmapStore, RespClient, RespServer, SingleFlight, _flight_worker, open_shared_cache,
+)
+from divination_core.store import ResponseCache
+
+
+@pytest.fixture(scope="module")
+def resp_server():
+    server = RespServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(params=["mmap", "resp"])
+def url(request, tmp_path, resp_server):
+    if request.param == "mmap":
+        return f"mmap://{tmp_path}/shared.cache?size=1M"
+    return resp_server.url
+
+
+@pytest.fixture
+def backend(url):
+    return open_shared_cache(url)
+
+
+@pytest.fixture
+def key():
+    return f"test:{uuid.uuid4().hex}"
+
+
+def test_roundtrip(backend, key):
+    assert backend.get(key) is None
+    assert backend.set(key, "卦象".encode("utf-8"), 60)
+    assert backend.get(key) == "卦象".encode("utf-8")
+    assert backend.set(key, b"second", 60) and backend.get(key) == b"second"
+    assert backend.delete(key) and backend.get(key) is None and not backend.delete(key)
+
+
+def test_add_only_if_absent(backend, key):
+    assert backend.add(key, b"first", 60)
+    assert not backend.add(key, b"second", 60)
+    assert backend.get(key) == b"first"
+
+
+def test_ttl_expiry(backend, key):
+    backend.set(key, b"x", 0.1)
+    assert backend.get(key) == b"x"
+    time.sleep(0.15)
+    assert backend.get(key) is None
+    assert backend.add(key, b"y", 60)  # an expired key counts as absent
+
+
+def test_compare_and_swap(backend, key):
+    backend.set(key, b"mine", 0.2)
+    assert not backend.renew(key, b"theirs", 60) and not backend.delete_if(key, b"theirs")
+    assert backend.renew(key, b"mine", 60)
+    time.sleep(0.25)
+    assert backend.get(key) == b"mine"
+    assert backend.delete_if(key, b"mine") and backend.get(key) is None
+    assert not backend.renew(key, b"mine", 60)
+
+
+def test_mmap_ring_overwrites_oldest(tmp_path):
+    store = MmapStore(str(tmp_path / "ring.cache"), size=64 * 1024)
+    value = bytes(range(256)) * 16  # 4 KB
+    for i in range(40):
+        assert store.set(f"k{i}", value, 60)
+    assert store.get("k0") is None and store.get("k39") == value
+    assert store.stats()["generation"] >= 1
+    assert not store.set("huge", b"x" * (64 * 1024))
+    # Reopening maps the same file and the same records.
+    assert MmapStore(str(tmp_path / "ring.cache")).get("k39") == value
+
+
+def test_mmap_rewrite_leaves_no_stale_slot(tmp_path):
+    store = MmapStore(str(tmp_path / "slots.cache"), size=64 * 1024, slots=2)
+    start = store._probe(store._digest("x"))[0]
+    other = next(k for k in (f"y{i}" for i in range(1000)) if store._probe(store._digest(k))[0] == start)
+    store.set(other, b"short-lived", 0.05)  # takes x's first slot, so x lands in the second
+    store.set("x", b"old", 60)
+    time.sleep(0.1)
+    store.set("x", b"new", 60)  # the first slot is free again; x must still keep a single slot
+    assert store.get("x") == b"new"
+    assert store.delete("x") and store.get("x") is None
+
+
+def test_resp_lru_eviction():
+    server = RespServer(max_bytes=10 * 1024).start()
+    try:
+        client = RespClient.from_url(server.url)
+        for i in range(5):
+            client.set(f"k{i}", b"x" * 1024, 60)
+        client.get("k0")  # now the most recently used
+        for i in range(5, 12):
+            client.set(f"k{i}", b"x" * 1024, 60)
+        assert client.get("k0") is not None and client.get("k1") is None and client.get("k11") is not None
+        assert server.evictions > 0 and server.used_bytes <= server.max_bytes
+    finally:
+        server.stop()
+
+
+def test_lease_release_is_compare_and_delete(backend, key):
+    flight = SingleFlight(backend, lease=0.3, poll=0.02)
+    old = flight.acquire(key)
+    assert old is not None and flight.acquire(key) is None
+    time.sleep(0.35)  # the old leader stalls past its lease
+    new = flight.acquire(key)
+    assert new is not None
+    old.release()
+    assert backend.get(SingleFlight.PREFIX + key) == new.token
+    assert old.keep() is False and new.keep() is True
+    new.release()
+    assert backend.get(SingleFlight.PREFIX + key) is None
+
+
+def test_lease_keep_renews(backend, key):
+    flight = SingleFlight(backend, lease=0.3, poll=0.02)
+    lease = flight.acquire(key)
+    for _ in range(8):  # 0.6 s, twice the lease
+        time.sleep(0.075)
+        assert lease.keep()
+    assert flight.acquire(key) is None
+    lease.release()
+    assert flight.acquire(key) is not None
+
+
+def test_wait_outlasts_a_kept_lease(backend, key):
+    flight = SingleFlight(backend, lease=0.3, poll=0.02)
+    lease = flight.acquire(key)
+
+    def leader():
+        for _ in range(8):
+            time.sleep(0.075)
+            lease.keep()
+        backend.set("value:" + key, b"done", 60)
+        lease.release()
+
+    threading.Thread(target=leader).start()
+    started = time.monotonic()
+    assert flight.wait(key, lambda: backend.get("value:" + key)) == b"done"
+    assert time.monotonic() - started > 0.5
+
+
+def test_wait_ends_when_leader_dies(backend, key):
+    flight = SingleFlight(backend, lease=0.2, poll=0.02)
+    assert flight.acquire(key) is not None  # never kept or released
+    assert flight.wait(key, lambda: None) is None
+    assert flight.acquire(key) is not None  # a waiter takes over
+
+
+def test_one_leader_across_processes(url, key):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [context.Process(target=_flight_worker, args=(url, key, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    roles = collections.Counter(results.get(timeout=60) for _ in workers)
+    for worker in workers:
+        worker.join()
+    assert roles == {"leader": 1, "follower": 3}
+
+
+def test_response_cache_shared_tier(backend, key, tmp_path):
+    a = ResponseCache(str(tmp_path / "a.db"), shared=backend, lease=1.0)
+    b = ResponseCache(str(tmp_path / "b.db"), shared=backend, lease=1.0)
+    payload = {"reasoning": "想", "content": "答"}
+    lease = a.lead(key)
+    assert lease is not None and b.lead(key) is None
+
+    def generate():
+        time.sleep(0.2)
+        a.put(key, payload, "六爻", "m")
+        lease.release()
+
+    threading.Thread(target=generate).start()
+    assert b.wait_for(key) == payload
+    assert b.get(key) == payload and b.stats()["memory_hits"] + b.stats()["shared_hits"] >= 1
+
+
+def test_response_cache_without_shared_tier(tmp_path):
+    cache = ResponseCache(str(tmp_path / "c.db"))
+    lease = cache.lead("k")
+    assert lease is not None and cache.lead("k") is not None  # local leases never contend
+    assert lease.keep() and cache.wait_for("k") is None
+    lease.release()
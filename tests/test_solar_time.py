@@ -0,0 +1,123 @@
+"""Equation of time, true solar time and 时辰 boundaries (the pytest side of `solar_time verify`)."""
+import datetime
+
+import numpy as np
+import pytest
+
+from divination_core import solar_time
+from divination_core.solar_time import (
+    KNOWN_VALUES, UNIX_EPOCH_JD, EquationOfTimeTable, equation_of_time, geocode, shichen_batch, shichen_boundaries,
+    to_utc, true_solar_time, true_solar_time_batch,
+)
+
+SECOND = datetime.timedelta(seconds=1)
+
+
+@pytest.fixture(scope="module")
+def table():
+    return EquationOfTimeTable(datetime.date(2023, 1, 1), datetime.date(2026, 1, 1))
+
+
+def julian_day(utc):
+    return UNIX_EPOCH_JD + (utc - datetime.datetime(1970, 1, 1)).total_seconds() / 86400.0
+
+
+@pytest.mark.parametrize("moment, minutes", KNOWN_VALUES)
+def test_equation_of_time_matches_almanac(table, moment, minutes):
+    utc = to_utc(moment)
+    assert float(equation_of_time(julian_day(utc))) == pytest.approx(minutes, abs=0.1)
+    assert table.minutes(utc) == pytest.approx(minutes, abs=0.1)
+
+
+def test_table_interpolation_and_fallback(table):
+    utc = datetime.datetime(2024, 3, 7, 17, 45)
+    assert table.minutes(utc) == pytest.approx(float(equation_of_time(julian_day(utc))), abs=1 / 60)
+    outside = datetime.datetime(2030, 6, 1)  # beyond the table: computed from the series
+    assert table.minutes(outside) == pytest.approx(float(equation_of_time(julian_day(outside))), abs=1e-9)
+
+
+def test_batch_matches_scalar(table):
+    rng = np.random.default_rng(0)
+    moments = np.datetime64("2023-01-01", "ms") + rng.integers(0, 3 * 365 * 86400000, 300).astype("timedelta64[ms]")
+    moments = np.append(moments, np.datetime64("2030-06-01T12:00", "ms"))  # one outside the table
+    longitudes = rng.uniform(-180, 180, len(moments))
+    batch = true_solar_time_batch(moments, longitudes, table=table)
+    scalar = np.array([true_solar_time(m.astype(datetime.datetime), lon, table) for m, lon in zip(moments, longitudes)],
+                      dtype="datetime64[ms]")
+    assert np.abs((batch - scalar).astype(np.int64)).max() <= 1
+    branch, since, until = shichen_batch(batch)
+    for solar, b, s, u in zip(scalar.astype(datetime.datetime), branch, since, until):
+        assert b == (solar.hour + 1) // 2 % 12 and s + u == 7200
+
+
+def test_equation_of_time_moves_the_hour(table):
+    # Beijing time is mean time at 120°E; on 3 November the sun runs 16 minutes ahead of it.
+    info = shichen_boundaries(datetime.datetime(2024, 11, 3, 10, 50), 120.0, table)
+    assert info["zhi"] == "午" and info["longitude_offset_min"] == 0
+    assert info["equation_of_time_min"] == pytest.approx(16.4, abs=0.1)
+    assert info["starts"].strftime("%H:%M") == "10:43"
+
+
+@pytest.mark.parametrize("clock, longitude", [
+    (datetime.datetime(2024, 2, 11, 9, 40), 116.40),   # 北京, the sun 14 min behind
+    (datetime.datetime(2024, 7, 26, 14, 10), 87.62),   # 乌鲁木齐, more than two hours west of 120°E
+    (datetime.datetime(2024, 11, 3, 6, 20), 126.63),   # 哈尔滨, east of 120°E and the sun 16 min ahead
+])
+def test_either_side_of_a_boundary(table, clock, longitude):
+    info = shichen_boundaries(clock, longitude, table)
+    assert info["starts"] <= clock < info["ends"]
+    assert info["since_s"] + info["until_s"] == 7200 and info["margin_s"] == min(info["since_s"], info["until_s"])
+    after = shichen_boundaries(info["ends"] + SECOND, longitude, table)
+    before = shichen_boundaries(info["ends"] - SECOND, longitude, table)
+    assert before["zhi"] == info["zhi"] and after["zhi"] == info["next_zhi"]
+    assert before["until_s"] == pytest.approx(1, abs=0.01) and after["since_s"] == pytest.approx(1, abs=0.01)
+    assert shichen_boundaries(info["starts"] - SECOND, longitude, table)["next_zhi"] == info["zhi"]
+
+
+def test_zi_hour_starts_at_solar_2300(table):
+    info = shichen_boundaries(datetime.datetime(2024, 2, 11, 22, 50), 116.40, table)
+    assert info["zhi"] == "亥" and info["next_zhi"] == "子"
+    rollover = info["ends"]
+    assert shichen_boundaries(rollover - SECOND, 116.40, table)["solar"].strftime("%H:%M:%S") == "22:59:59"
+    zi = shichen_boundaries(rollover + SECOND, 116.40, table)
+    assert zi["zhi"] == "子" and zi["solar"].hour == 23
+    # 14.4 min of longitude plus 14.2 min of equation of time: 子时 starts at 23:28:36 on the clock.
+    assert rollover.strftime("%H:%M") == "23:28"
+
+
+def test_aware_datetimes_keep_their_zone(table):
+    new_york = datetime.timezone(datetime.timedelta(hours=-5))
+    clock = datetime.datetime(2024, 11, 3, 12, 0, tzinfo=new_york)
+    info = shichen_boundaries(clock, -74.01, table)
+    assert info["starts"].tzinfo == new_york and info["starts"] <= clock < info["ends"]
+    assert info["longitude_offset_min"] == pytest.approx(-74.01 * 4 + 300)
+
+
+def test_geocode_offline_forms(monkeypatch):
+    monkeypatch.setattr(solar_time, "GEOCODER_URL", "")
+    assert geocode("40.71,-74.01") == {"name": "40.71,-74.01", "longitude": -74.01, "latitude": 40.71}
+    assert geocode(" 31.23， 121.47 ")["longitude"] == 121.47
+    assert geocode("116.4") == {"name": "116.4", "longitude": 116.4, "latitude": None}
+    assert geocode("北京")["longitude"] == 116.40
+    for bad in ["", "   ", "200", "91,0", "自定义/手动输入", "某个小镇"]:
+        assert geocode(bad) is None
+
+
+def test_geocode_online_is_opt_in(monkeypatch):
+    import httpx
+    calls = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return [{"display_name": "Paris, France", "lon": "2.35", "lat": "48.86"}]
+
+    monkeypatch.setattr(httpx, "get", lambda url, **kwargs: calls.append(url) or Response())
+    monkeypatch.setattr(solar_time, "GEOCODER_URL", "")
+    assert geocode("巴黎") is None and calls == []
+    monkeypatch.setattr(solar_time, "GEOCODER_URL", "https://geocoder.example/search")
+    monkeypatch.setattr(solar_time, "_geocoded", {})
+    assert geocode("巴黎") == {"name": "Paris, France", "longitude": 2.35, "latitude": 48.86}
+    assert geocode("巴黎") is not None and calls == ["https://geocoder.example/search"]  # memoized